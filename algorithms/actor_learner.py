@@ -0,0 +1,175 @@
+import multiprocessing
+import random
+import time
+
+import numpy as np
+
+from algorithms.dqn_config import DQNConfig
+from algorithms.numpy_policy import NumpyPolicy
+from algorithms.replay_buffer import SharedReplayBuffer
+from envs.fast_snake_env import FastSnakeEnv
+from envs.snake_preprocessor import ReduceState
+
+
+class SharedWeights():
+    def __init__(self, weights:list, activations:list, context = None):
+        # Policy weights in shared memory, the learner publishes model.get_weights() and the actors load them into
+        # their NumpyPolicy. version counts the publications so actors skip copies of weights they already have.
+        context = context or multiprocessing.get_context()
+        self.shapes = [np.shape(w) for w in weights]
+        self.activations = activations
+        self.lock = context.Lock()
+        self.version = context.RawValue("q", 0)
+        self._raw = context.RawArray("f", sum(int(np.prod(shape)) for shape in self.shapes))
+        self.publish(weights)
+
+    def publish(self, weights:list) -> None:
+        flat = np.frombuffer(self._raw, dtype=np.float32)
+        with self.lock:
+            flat[:] = np.concatenate([np.ravel(w) for w in weights])
+            self.version.value += 1
+
+    def load(self, policy: NumpyPolicy) -> int:
+        # copies the weights into policy and returns their version
+        flat = np.frombuffer(self._raw, dtype=np.float32)
+        with self.lock:
+            flat = flat.copy()
+            version = self.version.value
+        weights, start = [], 0
+        for shape in self.shapes:
+            size = int(np.prod(shape))
+            weights.append(flat[start:start + size].reshape(shape))
+            start += size
+        policy.set_weights(weights, self.activations)
+        return version
+
+
+def _run_actor(config: DQNConfig, epsilon:float, env_class, tiles:int, processor_class, memory: SharedReplayBuffer,
+               weights: SharedWeights, counters, stop, seed:int) -> None:
+    # Actor process: plays with an epsilon-greedy NumpyPolicy and pushes chunks of actor_push_size transitions.
+    # counters holds env steps, finished episodes and the summed final score of all actors, written under the memory lock.
+    random.seed(seed)
+    np.random.seed(seed)
+    env = env_class(tiles)
+    processor = processor_class()
+    policy = NumpyPolicy()
+    version = weights.load(policy)
+    steps_since_sync = 0
+
+    chunk = [], [], [], [], []
+    episodes, score_sum = 0, 0
+    observation = env.reset()
+    state = processor.process_state(observation, {"direction": env.actions[0]}).copy()
+    episode_steps = 0
+    while not stop.is_set():
+        if np.random.rand() <= epsilon:
+            action = np.random.randint(len(env.actions))
+        else:
+            action = int(policy.act(state)[0])
+        observation, score, done, info = env.step(env.actions[action])
+        reward = processor.process_reward(observation, score, done, info)
+        # the chunk outlives the buffers a preprocessor like FullState reuses
+        next_state = processor.process_state(observation, info).copy()
+        for field, value in zip(chunk, (state, action, reward, next_state, done)):
+            field.append(value)
+        state = next_state
+        episode_steps += 1
+
+        if done or episode_steps >= config.max_steps:
+            episodes += 1
+            score_sum += score
+            observation = env.reset()
+            state = processor.process_state(observation, {"direction": env.actions[0]}).copy()
+            episode_steps = 0
+
+        if len(chunk[1]) >= config.actor_push_size:
+            steps = len(chunk[1])
+            memory.add_batch(*(np.asarray(field) for field in chunk))
+            with memory.lock:
+                counters[0] += steps
+                counters[1] += episodes
+                counters[2] += score_sum
+            chunk = [], [], [], [], []
+            episodes, score_sum = 0, 0
+
+            steps_since_sync += steps
+            if steps_since_sync >= config.weight_sync_interval and weights.version.value != version:
+                version = weights.load(policy)
+                steps_since_sync = 0
+
+
+class ActorLearner():
+    def __init__(self, config: DQNConfig = None, tiles:int = 10, env_class = FastSnakeEnv, processor_class = ReduceState):
+        # config.actors actor processes play env_class games and fill a SharedReplayBuffer, this process is the learner
+        # and trains the DQN on it without pausing for the games. Actors act with a NumPy copy of the policy that they
+        # refresh every config.weight_sync_interval env steps, the learner publishes its weights every
+        # config.publish_interval updates. Actor i explores with epsilon 0.4 ** (1 + 7 * i / (actors - 1)) (Ape-X),
+        # so some actors explore a lot and others play almost greedily.
+        # Processes are spawned: the actors never import TensorFlow and a forked TensorFlow runtime is not safe.
+        self.config = config or DQNConfig(memory_size=100000)
+        if self.config.prioritized_replay:
+            raise ValueError("ActorLearner supports uniform replay only")
+        self.tiles = tiles
+        self.env_class = env_class
+        self.processor_class = processor_class
+        self.context = multiprocessing.get_context("spawn")
+
+    def actor_epsilons(self) -> list:
+        actors = self.config.actors
+        return [0.4 ** (1 + 7 * i / (actors - 1)) if actors > 1 else 0.4 for i in range(actors)]
+
+    def train(self, updates:int = None, seconds:float = None, log_seconds:float = 10):
+        # Trains until updates learner updates are done or seconds have passed and returns the trained DQN
+        from algorithms.snake_dqn_agent import DQN
+
+        if updates is None and seconds is None:
+            raise ValueError("Set updates, seconds or both")
+        config = self.config
+        processor = self.processor_class()
+        env = self.env_class(self.tiles)
+        agent = DQN(env.action_space, processor.observation_space, config)
+        agent.memory = SharedReplayBuffer(config.memory_size, (processor.observation_space.n,), context=self.context)
+        print(f"Shared replay buffer: {agent.memory.nbytes / 2**20:.1f} MiB for {config.memory_size} transitions")
+
+        weights = SharedWeights(agent.model.get_weights(), NumpyPolicy.activations(agent.model), self.context)
+        counters = self.context.RawArray("d", 3)
+        stop = self.context.Event()
+        actors = [self.context.Process(target=_run_actor, daemon=True,
+                                       args=(config, epsilon, self.env_class, self.tiles, self.processor_class, agent.memory,
+                                             weights, counters, stop, random.getrandbits(32)))
+                  for epsilon in self.actor_epsilons()]
+        for actor in actors:
+            actor.start()
+
+        try:
+            warmup = max(config.warmup, config.batch_size)
+            while len(agent.memory) < warmup:
+                time.sleep(0.05)
+
+            start = time.perf_counter()
+            last_log = (start, 0, 0.0, 0.0, 0.0)
+            done = 0
+            while (updates is None or done < updates) and (seconds is None or time.perf_counter() - start < seconds):
+                # the learner does not act, agent.policy is only synced at the end, the actors get the weights through SharedWeights
+                agent.replay()
+                done += 1
+                if done % config.publish_interval == 0:
+                    weights.publish(agent.model.get_weights())
+
+                now = time.perf_counter()
+                if now - last_log[0] >= log_seconds:
+                    with agent.memory.lock:
+                        env_steps, episodes, score_sum = counters[:]
+                    last_time, last_updates, last_env_steps, last_episodes, last_score_sum = last_log
+                    mean_score = (score_sum - last_score_sum) / max(episodes - last_episodes, 1)
+                    print(f"{done} updates, {(done - last_updates) / (now - last_time):,.0f} updates/s, "
+                          f"{(env_steps - last_env_steps) / (now - last_time):,.0f} env steps/s over {len(actors)} actors, "
+                          f"{episodes - last_episodes:.0f} episodes with mean score {mean_score:.2f}")
+                    last_log = (now, done, env_steps, episodes, score_sum)
+        finally:
+            stop.set()
+            for actor in actors:
+                actor.join()
+        # one sync for the caller that acts with the returned agent
+        agent.policy.sync(agent.model)
+        return agent
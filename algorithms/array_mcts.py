@@ -0,0 +1,210 @@
+import math
+import random
+
+import numpy as np
+
+from algorithms.mcts import MCTS
+
+
+class ArrayTree():
+    # Search tree stored as struct-of-arrays in NumPy buffers, a node is an index into them. The children of a node
+    # are a block of num_actions consecutive ids reserved at its first expansion and filled in expansion order, so
+    # the statistics of all children are one contiguous slice. Buffers grow by doubling.
+    FIELDS = {
+        # name: (dtype, fill value)
+        "visits": (np.float64, 0),
+        "values": (np.float64, 0),
+        "parent": (np.int32, -1),
+        # the children of a node are first_child .. first_child + num_children - 1
+        "first_child": (np.int32, -1),
+        "num_children": (np.int8, 0),
+        # index into the action list of the action that led to the node
+        "action": (np.int8, 0),
+        "terminal": (np.bool_, False),
+        # moves from the root of the first search, see MCTS._new_root
+        "depth": (np.int32, 0),
+        # board hash of the game state
+        "key": (np.uint64, 0),
+    }
+
+    def __init__(self, num_actions:int, capacity:int = 1024):
+        self.num_actions = num_actions
+        self.capacity = capacity
+        self.size = 0
+        for name, (dtype, fill) in ArrayTree.FIELDS.items():
+            setattr(self, name, np.full(capacity, fill, dtype=dtype))
+        # The compact game state of every node as returned by SnakeEnv.snapshot(), a tuple can not live in a
+        # NumPy buffer so they are kept in a list indexed by node id
+        self.snapshots = [None] * capacity
+
+    @property
+    def nbytes(self) -> int:
+        # memory of the buffers and the snapshot list, without the snapshots themselves
+        return sum(getattr(self, name).nbytes for name in ArrayTree.FIELDS) + 8 * self.capacity
+
+    def add_root(self, snapshot: tuple, is_terminal: bool, key: int, depth: int) -> int:
+        root = self.__allocate(1)
+        self.__set(root, snapshot, is_terminal, key, depth)
+        return root
+
+    def add_child(self, node: int, action: int, snapshot: tuple, is_terminal: bool, key: int) -> int:
+        if self.first_child[node] < 0:
+            self.first_child[node] = self.__allocate(self.num_actions)
+        child = int(self.first_child[node] + self.num_children[node])
+        self.num_children[node] += 1
+
+        self.parent[child] = node
+        self.action[child] = action
+        self.__set(child, snapshot, is_terminal, key, self.depth[node] + 1)
+        return child
+
+    def subtree(self, node: int, capacity:int = 1024) -> "ArrayTree":
+        # Copy of the subtree below node in a new tree with node as root 0, the rest of the tree is dropped.
+        # Nodes are copied breadth first, one child block at a time.
+        tree = ArrayTree(self.num_actions, capacity)
+        tree.__copy(self, node, tree.__allocate(1), 1)
+        tree.parent[0] = -1
+        queue = [(node, 0)]
+        for old, new in queue:
+            first_child = int(self.first_child[old])
+            if first_child < 0:
+                continue
+            count = int(self.num_children[old])
+            block = tree.__allocate(self.num_actions)
+            tree.__copy(self, first_child, block, self.num_actions)
+            tree.first_child[new] = block
+            tree.parent[block:block + count] = new
+            queue.extend(zip(range(first_child, first_child + count), range(block, block + count)))
+        return tree
+
+    def __set(self, node: int, snapshot: tuple, is_terminal: bool, key: int, depth: int):
+        self.terminal[node] = is_terminal
+        self.key[node] = key
+        self.depth[node] = depth
+        self.snapshots[node] = snapshot
+
+    def __copy(self, source: "ArrayTree", start: int, destination: int, count: int):
+        for name in ArrayTree.FIELDS:
+            getattr(self, name)[destination:destination + count] = getattr(source, name)[start:start + count]
+        self.snapshots[destination:destination + count] = source.snapshots[start:start + count]
+
+    def __allocate(self, count:int) -> int:
+        while self.size + count > self.capacity:
+            self.__grow()
+        start = self.size
+        self.size += count
+        return start
+
+    def __grow(self):
+        for name, (dtype, fill) in ArrayTree.FIELDS.items():
+            buffer = np.full(2 * self.capacity, fill, dtype=dtype)
+            buffer[:self.capacity] = getattr(self, name)
+            setattr(self, name, buffer)
+        self.snapshots.extend([None] * self.capacity)
+        self.capacity *= 2
+
+
+class ArrayMCTS(MCTS):
+    def __init__(self, initial_capacity:int = 1024, **settings):
+        # Same search as MCTS with the same settings, on an ArrayTree instead of Node objects. With the same seed it
+        # takes the same decisions as MCTS. A node takes about half the memory of a Node with its snapshot, but every
+        # read or write of a single buffer entry costs more than a Node attribute, so an iteration is slower. Use it
+        # when memory rather than time bounds the search.
+        # UCB stays a scalar loop over the child block: with the 4 children of a snake node one NumPy expression per
+        # tree level costs more than the loop, see benchmarks/bench_mcts.py. The children statistics are read as one slice.
+        super(ArrayMCTS, self).__init__(**settings)
+        self.initial_capacity = initial_capacity
+        self.tree = None
+
+    def _new_root(self) -> int:
+        self.tree = ArrayTree(len(self.actions), self.initial_capacity)
+        return self.tree.add_root(self.env.snapshot(), self.env.terminal, self.env.hash, self._root_depth + 1)
+
+    def _reuse_root(self, old_root: int) -> int:
+        # the old root itself or the child that matches the current game, copied into a new tree without the rest of the old one
+        tree = self.tree
+        first_child = int(tree.first_child[old_root])
+        for node in [old_root, *range(first_child, first_child + tree.num_children[old_root])]:
+            if self.env.matches(tree.snapshots[node]):
+                self.tree = tree.subtree(node, self.initial_capacity)
+                return 0
+        return None
+
+    def _visits(self, node: int) -> float:
+        return float(self.tree.visits[node])
+
+    def _depth(self, node: int) -> int:
+        return int(self.tree.depth[node])
+
+    def _best_action(self, root: int):
+        tree = self.tree
+        first_child = tree.first_child[root]
+        values = tree.values[first_child:first_child + tree.num_children[root]]
+        return self.actions[tree.action[first_child + int(np.argmax(values))]]
+
+    def _root_statistics(self, root: int) -> dict:
+        # visits and value of every explored action of the root
+        tree = self.tree
+        first_child = int(tree.first_child[root])
+        children = range(first_child, first_child + tree.num_children[root])
+        return {self.actions[tree.action[child]]: (float(tree.visits[child]), float(tree.values[child])) for child in children}
+
+    def _selection(self, node: int) -> int:
+        tree = self.tree
+        visits, values, first_child, num_children, terminal = tree.visits, tree.values, tree.first_child, tree.num_children, tree.terminal
+        num_actions = tree.num_actions
+
+        # if the selected node can be expanded we stop the search
+        while not (terminal[node] or num_children[node] < num_actions):
+            block = int(first_child[node])
+            log_visits = 2 * math.log(visits[node])
+            best_ucb = float("-inf")
+            # track multiple nodes in case of equal UCB values
+            best_nodes = []
+            child_visits = visits[block:block + num_actions].tolist()
+            child_values = values[block:block + num_actions].tolist()
+            for child in range(num_actions):
+                # calculate UCB for each child node
+                ucb = child_values[child] / child_visits[child] + self.C * math.sqrt(log_visits / child_visits[child])
+
+                if ucb > best_ucb:
+                    best_ucb = ucb
+                    best_nodes = [block + child]
+                elif ucb == best_ucb:
+                    best_nodes.append(block + child)
+
+            # in case of multiple best nodes, randomly choose one
+            node = random.choice(best_nodes)
+        return node
+
+    def _expand(self, node: int) -> int:
+        tree = self.tree
+        # terminal nodes can not be expanded
+        if tree.terminal[node]:
+            return node
+        # randomly choose an unexplored action to expand the tree
+        first_child = tree.first_child[node]
+        explored = tree.action[first_child:first_child + tree.num_children[node]].tolist() if first_child >= 0 else []
+        action = random.choice([a for a in range(tree.num_actions) if not a in explored])
+        # create new node and add to the tree
+        self.env.restore(tree.snapshots[node])
+        self.env.step(self.actions[action])
+        return tree.add_child(node, action, self.env.snapshot(), self.env.terminal, self.env.hash)
+
+    def _simulation(self, node: int) -> float:
+        # if state is terminal no new reward to backpropagate
+        if self.tree.terminal[node]:
+            return 0
+        else:
+            return self._evaluate(int(self.tree.key[node]), self.tree.snapshots[node])
+
+    def _backpropogation(self, node: int, reward: float) -> None:
+        # backpropagate from node to root and update visits and value of node
+        tree = self.tree
+        visits, values, parent = tree.visits, tree.values, tree.parent
+        while node >= 0:
+            visits[node] += 1
+            values[node] += reward
+            if self.transpositions is not None:
+                self.transpositions.update(int(tree.key[node]), reward, int(tree.depth[node]))
+            node = parent[node]
@@ -0,0 +1,193 @@
+import json
+import os
+import random
+import shutil
+import threading
+
+import numpy as np
+
+from algorithms.dqn_config import TrainingSchedule
+from algorithms.replay_buffer import ReplayBuffer, PrioritizedReplayBuffer, FrameReplayBuffer, PrioritizedFrameReplayBuffer
+
+# Replay fields written as one .npy file each
+REPLAY_FIELDS = ("states", "actions", "rewards", "next_states", "dones")
+FRAME_REPLAY_FIELDS = ("frames", "actions", "rewards", "dones", "steps", "valid")
+PRIORITIZED = (PrioritizedReplayBuffer, PrioritizedFrameReplayBuffer)
+
+
+def save_replay(buffer: ReplayBuffer, directory:str) -> None:
+    # Writes the filled slots of every field as a plain .npy file, plus the ring position and the priorities of a
+    # prioritized buffer. Nothing is pickled, load_replay maps the files instead of parsing them.
+    _write_replay(*_replay_state(buffer), directory)
+
+
+def _replay_state(buffer: ReplayBuffer, copies:dict = None) -> tuple:
+    # The filled slots of every field. Without copies they are views, enough for a save on the thread that adds the
+    # transitions. A background save needs them copied at the capture: a slot overwritten between two np.save calls
+    # would mix the fields of two transitions. copies maps field names to arrays of the buffer's shape that are reused
+    # for that, missing ones are allocated. The priority sums are always copied.
+    arrays = {}
+    for name in _replay_fields(buffer):
+        field = getattr(buffer, name)
+        arrays[name] = field[:buffer.size]
+        if copies is not None:
+            if name not in copies or copies[name].shape != field.shape:
+                copies[name] = np.empty_like(field)
+            np.copyto(copies[name][:buffer.size], arrays[name])
+            arrays[name] = copies[name][:buffer.size]
+    meta = {"capacity": buffer.capacity, "position": buffer.position, "size": buffer.size,
+            "rng": buffer.rng.bit_generator.state}
+    if isinstance(buffer, FrameReplayBuffer):
+        meta.update(transitions=buffer.transitions, episode_steps=buffer.episode_steps)
+    if isinstance(buffer, PRIORITIZED):
+        arrays["priorities"] = buffer.priorities.nodes.copy()
+        meta.update(beta=buffer.beta, max_priority=buffer.max_priority)
+    return arrays, meta
+
+
+def _replay_fields(buffer) -> tuple:
+    return FRAME_REPLAY_FIELDS if isinstance(buffer, FrameReplayBuffer) else REPLAY_FIELDS
+
+
+def _write_replay(arrays:dict, meta:dict, directory:str) -> None:
+    os.makedirs(directory, exist_ok=True)
+    for name, values in arrays.items():
+        np.save(os.path.join(directory, f"{name}.npy"), values)
+    with open(os.path.join(directory, "replay.json"), "w") as file:
+        json.dump(meta, file)
+
+
+def load_replay(buffer: ReplayBuffer, directory:str) -> None:
+    # Restores a buffer written by save_replay into a buffer of the same type, capacity and state shape
+    with open(os.path.join(directory, "replay.json")) as file:
+        meta = json.load(file)
+    if meta["capacity"] != buffer.capacity:
+        raise ValueError(f"Checkpoint holds a replay buffer of capacity {meta['capacity']}, not {buffer.capacity}")
+    for name in _replay_fields(buffer):
+        getattr(buffer, name)[:meta["size"]] = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+    buffer.position = meta["position"]
+    buffer.size = meta["size"]
+    buffer.rng.bit_generator.state = meta["rng"]
+    if isinstance(buffer, FrameReplayBuffer):
+        buffer.transitions = meta["transitions"]
+        buffer.episode_steps = meta["episode_steps"]
+    if isinstance(buffer, PRIORITIZED):
+        buffer.priorities.nodes[:] = np.load(os.path.join(directory, "priorities.npy"), mmap_mode="r")
+        buffer.beta = meta["beta"]
+        buffer.max_priority = meta["max_priority"]
+
+
+class Checkpointer():
+    def __init__(self, directory:str, keep:int = 2):
+        # Checkpoints of a DQN (see snake_dqn_agent.DQN) in numbered subdirectories of directory, the file "latest"
+        # names the newest complete one. A checkpoint is written to a temporary directory and renamed when it is
+        # complete, so a crash while saving leaves the previous checkpoint intact. keep checkpoints are kept.
+        # The optional schedule (the TrainingSchedule of the training loop) and processor (a preprocessor from
+        # envs/snake_preprocessor.py) live outside the agent, pass the same ones to save and load to restore their counters
+        # and the score their rewards are measured from.
+        self.directory = directory
+        self.keep = keep
+        self.__thread = None
+        # Replay copies of save_async, two sets used in turn: the background thread may still write one while the
+        # next save captures into the other. They cost twice the replay memory once the first async save ran.
+        self.__copies = ({}, {})
+        self.__turn = 0
+
+    def latest(self) -> str:
+        # path of the newest complete checkpoint, None if there is none
+        try:
+            with open(os.path.join(self.directory, "latest")) as file:
+                return os.path.join(self.directory, file.read().strip())
+        except FileNotFoundError:
+            return None
+
+    def save(self, agent, step:int, extra:dict = None, schedule: TrainingSchedule = None, processor = None) -> str:
+        # saves synchronously, step numbers the checkpoint (e.g. the episode) and extra is any JSON data of the caller
+        return self.__write(self.__capture(agent, step, extra, schedule, processor))
+
+    def save_async(self, agent, step:int, extra:dict = None, schedule: TrainingSchedule = None, processor = None) -> None:
+        # Captures the agent state in the calling thread and writes it in a background thread, the training loop only
+        # waits for the capture, mostly copying the replay buffer. A save that is still running is finished first.
+        state = self.__capture(agent, step, extra, schedule, processor, self.__copies[self.__turn])
+        self.__turn = 1 - self.__turn
+        self.wait()
+        self.__thread = threading.Thread(target=self.__write, args=(state,), daemon=False)
+        self.__thread.start()
+
+    def wait(self) -> None:
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def load(self, agent, path:str = None, schedule: TrainingSchedule = None, processor = None) -> dict:
+        # restores the newest (or the given) checkpoint into agent, returns the step and extra data that were saved with it
+        path = path or self.latest()
+        if path is None:
+            raise FileNotFoundError(f"No checkpoint in {self.directory}")
+        with open(os.path.join(path, "state.json")) as file:
+            state = json.load(file)
+        if schedule is not None and state["schedule"] is None:
+            raise ValueError(f"Checkpoint {path} was saved without a training schedule")
+        if processor is not None and state["prev_score"] is None:
+            raise ValueError(f"Checkpoint {path} was saved without a processor")
+        with np.load(os.path.join(path, "weights.npz"), allow_pickle=False) as weights:
+            agent.model.set_weights([weights[f"model_{i}"] for i in range(state["model_arrays"])])
+            agent.learner.target_model.set_weights([weights[f"target_{i}"] for i in range(state["model_arrays"])])
+            for i, variable in enumerate(agent.learner.optimizer.variables):
+                variable.assign(weights[f"optimizer_{i}"])
+            np_random_keys = weights["np_random_keys"]
+        agent.policy.sync(agent.model)
+        agent.learner.updates = state["updates"]
+        agent.epsilon = state["epsilon"]
+
+        version, internal, gauss = state["python_random"]
+        random.setstate((version, tuple(internal), gauss))
+        np.random.set_state((state["np_random"][0], np_random_keys, *state["np_random"][1:]))
+        # DQN.act explores with action_space.sample(), which draws from the generator of the space
+        agent.action_space.np_random.bit_generator.state = state["action_space_random"]
+        if schedule is not None:
+            schedule.set_state(state["schedule"])
+        if processor is not None:
+            processor.prev_score = state["prev_score"]
+        load_replay(agent.memory, os.path.join(path, "replay"))
+        return {"step": state["step"], "extra": state["extra"]}
+
+    def __capture(self, agent, step:int, extra:dict, schedule: TrainingSchedule, processor, copies:dict = None) -> dict:
+        # everything a checkpoint holds, the replay transitions are only copied into copies (see _replay_state)
+        np_random = np.random.get_state()
+        arrays = {f"model_{i}": w for i, w in enumerate(agent.model.get_weights())}
+        arrays.update({f"target_{i}": w for i, w in enumerate(agent.learner.target_model.get_weights())})
+        arrays.update({f"optimizer_{i}": np.array(v) for i, v in enumerate(agent.learner.optimizer.variables)})
+        arrays["np_random_keys"] = np_random[1]
+
+        state = {"step": step, "extra": extra or {}, "epsilon": float(agent.epsilon), "updates": agent.learner.updates,
+                 "model_arrays": len(agent.model.get_weights()), "python_random": random.getstate(),
+                 "np_random": [np_random[0], int(np_random[2]), int(np_random[3]), float(np_random[4])],
+                 "action_space_random": agent.action_space.np_random.bit_generator.state,
+                 "schedule": None if schedule is None else schedule.get_state(),
+                 "prev_score": None if processor is None else int(processor.prev_score)}
+        return {"state": state, "arrays": arrays, "replay": _replay_state(agent.memory, copies)}
+
+    def __write(self, captured:dict) -> str:
+        name = f"step-{captured['state']['step']:09d}"
+        path = os.path.join(self.directory, name)
+        temporary = path + ".tmp"
+        shutil.rmtree(temporary, ignore_errors=True)
+        os.makedirs(temporary)
+
+        np.savez(os.path.join(temporary, "weights.npz"), **captured["arrays"])
+        with open(os.path.join(temporary, "state.json"), "w") as file:
+            json.dump(captured["state"], file)
+        _write_replay(*captured["replay"], os.path.join(temporary, "replay"))
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(temporary, path)
+        latest = os.path.join(self.directory, "latest.tmp")
+        with open(latest, "w") as file:
+            file.write(name)
+        os.replace(latest, os.path.join(self.directory, "latest"))
+
+        checkpoints = sorted(entry for entry in os.listdir(self.directory) if entry.startswith("step-") and not entry.endswith(".tmp"))
+        for old in checkpoints[:-self.keep]:
+            shutil.rmtree(os.path.join(self.directory, old), ignore_errors=True)
+        return path
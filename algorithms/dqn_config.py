@@ -0,0 +1,101 @@
+import time
+from dataclasses import dataclass, field
+
+
+@dataclass
+class DQNConfig:
+    # network and learner
+    layer_sizes: list = field(default_factory=lambda: [128, 128, 128, 128])
+    learning_rate: float = 0.00025
+    gamma: float = 0.95
+    batch_size: int = 200
+    # "hard" or "polyak", see DQNLearner
+    target_update: str = "hard"
+    target_sync_interval: int = 100
+    tau: float = 0.005
+
+    # replay memory
+    memory_size: int = 2500
+    prioritized_replay: bool = False
+    # transitions stored before the first update, never less than one batch
+    warmup: int = 0
+
+    # exploration: epsilon is multiplied by epsilon_decay after every env step (epsilon_schedule="step")
+    # or after every update (epsilon_schedule="update")
+    epsilon: float = 1.0
+    epsilon_min: float = 0.01
+    epsilon_decay: float = 0.995
+    epsilon_schedule: str = "update"
+
+    # update-to-data ratio: every env_steps_per_update env steps the learner takes gradient_steps minibatch steps
+    env_steps_per_update: int = 1
+    gradient_steps: int = 1
+
+    episodes: int = 10000
+    max_steps: int = 10000
+
+    # actor/learner mode (ActorLearner): number of actor processes, env steps of an actor between two refreshes of its
+    # policy weights, learner updates between two weight publications and transitions an actor collects per push
+    actors: int = 4
+    weight_sync_interval: int = 400
+    publish_interval: int = 50
+    actor_push_size: int = 64
+
+    # checkpoints (see Checkpointer): train() saves every checkpoint_interval episodes in the background and resumes
+    # from the newest checkpoint in checkpoint_dir. None turns checkpoints off.
+    checkpoint_dir: str = None
+    checkpoint_interval: int = 100
+
+    def __post_init__(self):
+        if self.epsilon_schedule not in ("step", "update"):
+            raise ValueError(f"Unknown epsilon schedule {self.epsilon_schedule}, use 'step' or 'update'")
+        if self.env_steps_per_update < 1 or self.gradient_steps < 1:
+            raise ValueError("env_steps_per_update and gradient_steps have to be at least 1")
+        if self.actors < 1:
+            raise ValueError("actors has to be at least 1")
+
+
+class TrainingSchedule():
+    def __init__(self, config: DQNConfig):
+        # Decides after every env step whether the agent trains and when epsilon decays, and counts env steps and
+        # gradient steps for the throughput log
+        self.config = config
+        self.warmup = max(config.warmup, config.batch_size)
+        self.env_steps = 0
+        self.gradient_steps = 0
+        self.__last_log = (time.perf_counter(), 0, 0)
+
+    def step(self, agent) -> None:
+        # call once after every env step, once the transition is stored
+        config = self.config
+        self.env_steps += 1
+        if self.env_steps % config.env_steps_per_update == 0 and len(agent.memory) >= self.warmup:
+            for _ in range(config.gradient_steps):
+                agent.replay()
+            # the acting copy only has to be current for the next env step, not after every gradient step
+            agent.policy.sync(agent.model)
+            self.gradient_steps += config.gradient_steps
+            if config.epsilon_schedule == "update":
+                agent.decay_epsilon()
+        if config.epsilon_schedule == "step":
+            agent.decay_epsilon()
+
+    def get_state(self) -> dict:
+        # the counters, for checkpoints
+        return {"env_steps": self.env_steps, "gradient_steps": self.gradient_steps}
+
+    def set_state(self, state:dict) -> None:
+        self.env_steps = state["env_steps"]
+        self.gradient_steps = state["gradient_steps"]
+        # the next throughput() only counts the steps after the restore
+        self.__last_log = (time.perf_counter(), self.env_steps, self.gradient_steps)
+
+    def throughput(self) -> str:
+        # env steps/s and gradient steps/s since the last call
+        now, env_steps, gradient_steps = time.perf_counter(), self.env_steps, self.gradient_steps
+        last_time, last_env_steps, last_gradient_steps = self.__last_log
+        seconds = max(now - last_time, 1e-9)
+        self.__last_log = (now, env_steps, gradient_steps)
+        return (f"{(env_steps - last_env_steps) / seconds:,.0f} env steps/s, "
+                f"{(gradient_steps - last_gradient_steps) / seconds:,.0f} gradient steps/s, "
+                f"{env_steps} env steps and {gradient_steps} gradient steps in total")
@@ -0,0 +1,60 @@
+import numpy as np
+import tensorflow as tf
+from keras.models import clone_model
+
+
+class DQNLearner():
+    def __init__(self, model, gamma:float, target_update:str = "hard", target_sync_interval:int = 100, tau:float = 0.005):
+        # One compiled training step per minibatch instead of two predict_on_batch calls and a fit. Targets bootstrap
+        # from a target network, the squared TD error only counts for the taken actions. The model has to be compiled,
+        # its optimizer is used for the updates.
+        # target_update="hard" copies the online weights every target_sync_interval updates,
+        # target_update="polyak" moves the target weights by tau towards the online weights after every update.
+        if target_update not in ("hard", "polyak"):
+            raise ValueError(f"Unknown target update {target_update}, use 'hard' or 'polyak'")
+        self.model = model
+        self.optimizer = model.optimizer
+        self.gamma = gamma
+        self.target_update = target_update
+        self.target_sync_interval = target_sync_interval
+        self.tau = tau
+        self.updates = 0
+
+        self.target_model = clone_model(model)
+        self.target_model.set_weights(model.get_weights())
+        # create the optimizer slots outside of the compiled step
+        self.optimizer.build(model.trainable_variables)
+
+    def update(self, states, actions, rewards, next_states, dones, weights = None):
+        # One gradient step on a minibatch, weights are importance-sampling weights (None for uniform replay).
+        # Returns the TD errors of the batch before the step, e.g. for the priorities of a prioritized replay.
+        if weights is None:
+            weights = np.ones(len(actions), dtype=np.float32)
+        loss, td_errors = self.__train_step(np.asarray(states, dtype=np.float32), np.asarray(actions, dtype=np.int32),
+                                            np.asarray(rewards, dtype=np.float32), np.asarray(next_states, dtype=np.float32),
+                                            np.asarray(dones, dtype=np.float32), np.asarray(weights, dtype=np.float32))
+        self.updates += 1
+        if self.target_update == "polyak":
+            self.__blend_target(tf.constant(self.tau))
+        elif self.updates % self.target_sync_interval == 0:
+            self.__blend_target(tf.constant(1.0))
+        return td_errors.numpy()
+
+    @tf.function
+    def __train_step(self, states, actions, rewards, next_states, dones, weights):
+        next_q_values = self.target_model(next_states, training=False)
+        targets = rewards + self.gamma * tf.reduce_max(next_q_values, axis=1) * (1.0 - dones)
+        with tf.GradientTape() as tape:
+            q_values = self.model(states, training=True)
+            taken = tf.gather(q_values, actions, axis=1, batch_dims=1)
+            td_errors = targets - taken
+            loss = tf.reduce_mean(weights * tf.square(td_errors))
+        gradients = tape.gradient(loss, self.model.trainable_variables)
+        self.optimizer.apply_gradients(zip(gradients, self.model.trainable_variables))
+        return loss, td_errors
+
+    @tf.function
+    def __blend_target(self, tau):
+        # tau = 1 is a hard copy
+        for target, online in zip(self.target_model.weights, self.model.weights):
+            target.assign(tau * online + (1.0 - tau) * target)
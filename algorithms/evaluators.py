@@ -0,0 +1,68 @@
+import numpy as np
+
+from envs.snake_env import SnakeEnv
+
+# Leaf evaluators for depth-bounded MCTS rollouts. An evaluator is called with the game where a rollout was cut
+# off and returns the value of that state on the scale of a rollout started there: its score plus the reward still
+# to come. Any callable taking the env works, the classes below are the built-in options.
+
+
+class ScoreEvaluator():
+    # the current score, a cut off rollout is worth what it collected so far
+    def __call__(self, env: SnakeEnv) -> float:
+        return env.score
+
+
+class AppleDistanceEvaluator():
+    def __init__(self, weight:float = 1.0):
+        # current score plus up to weight for being close to the apple, weight is reached on the apple cell
+        self.weight = weight
+
+    def __call__(self, env: SnakeEnv) -> float:
+        head_y, head_x = env.head
+        apple_y, apple_x = env.apple
+        distance = abs(int(head_y) - apple_y) + abs(int(head_x) - apple_x)
+        return env.score + self.weight * (1 - distance / (2 * (env.TILES - 1)))
+
+
+class ValueNetworkEvaluator():
+    # Board codes of the network input, the same as FastSnakeEnv uses
+    CODES = {SnakeEnv.EMPTY: 0, SnakeEnv.BODY: 1, SnakeEnv.HEAD: 2, SnakeEnv.APPLE: 3}
+
+    def __init__(self, model_path:str = None, model = None, features = None):
+        # A keras model given directly or loaded from model_path. Its input is features(env), by default the flattened
+        # board with the codes above. A model with one output predicts the value, with one output per action
+        # (e.g. a trained DQN) the largest one is used.
+        if model is None and model_path is None:
+            raise ValueError("Pass a model or a model_path")
+        self.model_path = model_path
+        self.model = model if model is not None else self.__load(model_path)
+        self.features = features or ValueNetworkEvaluator.board_features
+
+    @staticmethod
+    def board_features(env: SnakeEnv):
+        board = np.zeros(env.grid.shape, dtype=np.float32)
+        for symbol, code in ValueNetworkEvaluator.CODES.items():
+            board[env.grid == symbol] = code
+        return board.reshape(1, -1)
+
+    def __call__(self, env: SnakeEnv) -> float:
+        # calling the model directly avoids the batching overhead of predict for a single state
+        prediction = np.asarray(self.model(self.features(env), training=False))
+        return float(prediction.max())
+
+    def __getstate__(self):
+        # keras models do not pickle, worker processes of a parallel search load the model from model_path again
+        if self.model_path is None:
+            raise ValueError("ValueNetworkEvaluator needs a model_path to be used with a parallel search")
+        state = self.__dict__.copy()
+        state["model"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.model = self.__load(self.model_path)
+
+    def __load(self, model_path: str):
+        from keras.models import load_model
+        return load_model(model_path)
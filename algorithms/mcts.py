@@ -1,25 +1,68 @@
 from __future__ import annotations
 import math
+import os
 import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from algorithms.transposition_table import TranspositionTable
 
 class SnakeEnv:
     pass
 
 class Node():
-    def __init__(self, state: SnakeEnv, parent: Node):
-        self.state = state
-        self.is_terminal = state.terminal
+    def __init__(self, snapshot: tuple, is_terminal: bool, parent: Node, key: int = None, depth: int = 0):
+        # snapshot of the game as returned by SnakeEnv.snapshot() and its board hash.
+        # depth counts moves from the root of the first search, a root passes its own, see MCTS._new_root
+        self.snapshot = snapshot
+        self.key = key
+        self.is_terminal = is_terminal
         self.parent = parent
-        self.depth = 0 if parent is None else parent.depth + 1
+        self.depth = depth if parent is None else parent.depth + 1
         
         self.num_visits = 0
         self.value = 0
         self.children = {}
         self.ucb = float("-inf")
 
+# Game instances of the worker processes, one per env class and board size
+_worker_envs = {}
+
+def _worker_env(env_class, tiles: int) -> SnakeEnv:
+    if (env_class, tiles) not in _worker_envs:
+        _worker_envs[(env_class, tiles)] = env_class(tiles)
+    return _worker_envs[(env_class, tiles)]
+
+def _search_tree(searcher: MCTS, state: SnakeEnv, iterations: int, time_budget_ms: float, seed: int) -> tuple:
+    # root parallelism: one independent tree per task, returns the root statistics and the search counters
+    random.seed(seed)
+    searcher._start_search(time_budget_ms)
+    searcher.env = state
+    searcher.actions = state.actions
+    root = searcher._new_root()
+    searcher._search(root, iterations)
+    return searcher._root_statistics(root), searcher._counters()
+
+def _run_rollouts(searcher: MCTS, env_class, tiles: int, snapshot: tuple, rollouts: int, seed: int) -> tuple:
+    # leaf parallelism: a share of the rollouts of one leaf, returns the summed reward and the rollout steps
+    random.seed(seed)
+    searcher._start_search(None)
+    searcher.env = _worker_env(env_class, tiles)
+    return sum(searcher._rollout(snapshot) for _ in range(rollouts)), searcher._rollout_steps
+
 class MCTS():
-    def __init__(self, iterations:int = 1000, exploration_constant:float = 2, discount:float = 0.99, step_cost:float = 0.5):        
+    PHASES = ("selection", "expansion", "simulation", "backpropagation")
+
+    def __init__(self, iterations:int = 1000, exploration_constant:float = 2, discount:float = 0.99, step_cost:float = 0.5,
+                 parallel:str = None, workers:int = None, leaf_rollouts:int = None, reuse_tree:bool = False,
+                 transposition_size:int = 0, transposition_policy:str = "lru", time_budget_ms:float = None,
+                 rollout_depth:int = None, evaluator = None):        
+        # time_budget_ms stops the search at a deadline measured from the call of find_best_action and returns the best
+        # action found so far, iterations then is an optional cap (None for no cap). At least one iteration always runs.
+        if iterations is None and time_budget_ms is None:
+            raise ValueError("Set iterations, time_budget_ms or both")
         self.iterations = iterations
+        self.time_budget_ms = time_budget_ms
         self.C = exploration_constant
         
         # Bonus: it is good practice to add a discount to diminish value of actions further out in the future
@@ -27,26 +70,207 @@ class MCTS():
         # Bonus: adding step cost will ensure that the algorithm does not prefer driving around surviving over risking to eat
         self.step_cost = step_cost
 
+        # rollout_depth=None plays every rollout until the snake dies. Otherwise a rollout stops after rollout_depth moves and
+        # evaluator(env) estimates the rest of the game, see algorithms/evaluators.py. Without an evaluator the score
+        # at the cut off counts (ScoreEvaluator). rollout_depth=0 evaluates new nodes without any random moves.
+        self.rollout_depth = rollout_depth
+        self.evaluator = evaluator
+
+        # parallel=None searches on this process only.
+        # parallel="root" splits the iterations over one independent tree per worker and merges the root statistics.
+        # parallel="leaf" keeps one tree and runs leaf_rollouts rollouts per expanded node spread over the workers,
+        # the mean reward is backpropagated. It only pays off when rollouts are long compared to the inter-process round trip.
+        if parallel not in (None, "root", "leaf"):
+            raise ValueError(f"Unknown parallel mode {parallel}, use None, 'root' or 'leaf'")
+        self.parallel = parallel
+        self.workers = workers or os.cpu_count()
+        self.leaf_rollouts = leaf_rollouts or self.workers
+        self._pool = None
+
+        # reuse_tree=True keeps the tree between calls. If the state passed to the next call is the root or one of its
+        # children (same snake and same apple), that node becomes the new root and its visits count towards the iterations.
+        # Otherwise, e.g. when the apple spawned somewhere else than in the stored state, the search starts from a fresh root.
+        # Not used with parallel="root", those trees live in the worker processes.
+        self.reuse_tree = reuse_tree
+        self._last_root = None
+
+        # transposition_size > 0 shares statistics between nodes of the same state (same SnakeEnv.hash) reached on
+        # different paths. A new node whose state is already in the table takes its mean value instead of a rollout.
+        # The table is bounded, see TranspositionTable for the eviction policies, and is kept between moves. Its depths are
+        # the node depths, which count moves from the first search: a fresh root sits one move below the last root and a
+        # reused root keeps its depth, so entries of all moves are on the same scale.
+        self.transpositions = TranspositionTable(transposition_size, transposition_policy) if transposition_size > 0 else None
+        self.saved_rollouts = 0
+        self._root_depth = -1
+
+        # filled by every find_best_action: iterations, elapsed_ms, rollouts, mean_rollout_length and phase_ms per phase.
+        # With parallel="root" the counters and phase times are summed over the workers.
+        self.search_stats = {}
+
+    def __getstate__(self):
+        # worker processes only need the settings, not the pool or the game of the last search
+        state = self.__dict__.copy()
+        for name in ("_pool", "env", "tree", "_last_root"):
+            state.pop(name, None)
+        state["parallel"] = None
+        if self.transpositions is not None:
+            state["transpositions"] = TranspositionTable(self.transpositions.capacity, self.transpositions.policy)
+        return state
+
+    def close(self) -> None:
+        # shuts down the worker processes of a parallel search
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
     def find_best_action(self, current_state: SnakeEnv):
-        # Initialize root with current state
-        root = Node(current_state, None)
-        
-        for _ in range(self.iterations):
+        self._start_search(self.time_budget_ms)
+        # One scratch copy of the game is restored from node snapshots for every expansion and simulation
+        self.env = current_state.get_copy()
+        self.actions = self.env.actions
+
+        if self.parallel == "root":
+            action = self.__root_parallel_search()
+        else:
+            # Initialize root with current state, or with the matching node of the last search
+            root = None
+            if self.reuse_tree and self._last_root is not None:
+                root = self._reuse_root(self._last_root)
+            if root is None:
+                root = self._new_root()
+            self._root_depth = self._depth(root)
+            if self.transpositions is not None:
+                self.transpositions.start_move(self._root_depth)
+            self._search(root, None if self.iterations is None else self.iterations - int(self._visits(root)))
+            if self.reuse_tree:
+                self._last_root = root
+
+            # After iteration budget is used, select best action from root node
+            action = self._best_action(root)
+
+        self._finish_search()
+        return action
+
+    def _start_search(self, time_budget_ms: float) -> None:
+        self._started = time.perf_counter()
+        self._deadline = None if time_budget_ms is None else self._started + time_budget_ms / 1000
+        self._iterations_done = 0
+        self._rollouts = 0
+        self._rollout_steps = 0
+        self._phase_seconds = [0.0] * len(MCTS.PHASES)
+
+    def _counters(self) -> tuple:
+        return self._iterations_done, self._rollouts, self._rollout_steps, self._phase_seconds
+
+    def _finish_search(self) -> None:
+        elapsed = time.perf_counter() - self._started
+        self.search_stats = {
+            "iterations": self._iterations_done,
+            "elapsed_ms": elapsed * 1000,
+            "rollouts": self._rollouts,
+            "mean_rollout_length": self._rollout_steps / self._rollouts if self._rollouts else 0.0,
+            "phase_ms": {phase: seconds * 1000 for phase, seconds in zip(MCTS.PHASES, self._phase_seconds)},
+        }
+
+    def __get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def __root_parallel_search(self):
+        # every worker grows its own tree from the same state with its own seed, visits and values of the root children are summed
+        pool = self.__get_pool()
+        if self.iterations is None:
+            tree_iterations = [None] * self.workers
+        else:
+            tree_iterations = [self.iterations // self.workers + (i < self.iterations % self.workers) for i in range(self.workers)]
+        # workers get what is left of the time budget after the scheduling
+        time_budget_ms = None if self._deadline is None else (self._deadline - time.perf_counter()) * 1000
+        futures = [pool.submit(_search_tree, self, self.env, iterations, time_budget_ms, random.getrandbits(32))
+                   for iterations in tree_iterations if iterations is None or iterations > 0]
+
+        statistics = {}
+        for future in futures:
+            root_statistics, (iterations, rollouts, rollout_steps, phase_seconds) = future.result()
+            for action, (num_visits, value) in root_statistics.items():
+                visits_sum, value_sum = statistics.get(action, (0, 0))
+                statistics[action] = (visits_sum + num_visits, value_sum + value)
+            self._iterations_done += iterations
+            self._rollouts += rollouts
+            self._rollout_steps += rollout_steps
+            self._phase_seconds = [total + seconds for total, seconds in zip(self._phase_seconds, phase_seconds)]
+        return max(statistics.items(), key=lambda x:x[1][1])[0]
+
+    def __leaf_parallel_rollouts(self, snapshot: tuple) -> float:
+        pool = self.__get_pool()
+        shares = [self.leaf_rollouts // self.workers + (i < self.leaf_rollouts % self.workers) for i in range(self.workers)]
+        futures = [pool.submit(_run_rollouts, self, self.env.__class__, self.env.TILES, snapshot, share, random.getrandbits(32))
+                   for share in shares if share > 0]
+        reward = 0
+        for future in futures:
+            reward_sum, rollout_steps = future.result()
+            reward += reward_sum
+            self._rollout_steps += rollout_steps
+        self._rollouts += self.leaf_rollouts
+        return reward / self.leaf_rollouts
+
+    def _search(self, root, iterations: int) -> None:
+        # runs until the iteration cap (None for no cap) or the deadline, the deadline is checked from the second iteration on
+        clock = time.perf_counter
+        phase_seconds = self._phase_seconds
+        done = 0
+        while iterations is None or done < iterations:
+            if done > 0 and self._deadline is not None and clock() >= self._deadline:
+                break
             # Execute 4 steps of one iteration to update the tree
-            selected_node = self.__selection(root)
-            added_node = self.__expand(selected_node)
-            reward = self.__simulation(added_node)
-            self.__backpropogation(added_node, reward)
+            started = clock()
+            selected_node = self._selection(root)
+            selected = clock()
+            added_node = self._expand(selected_node)
+            expanded = clock()
+            reward = self._simulation(added_node)
+            simulated = clock()
+            self._backpropogation(added_node, reward)
+            ended = clock()
+
+            phase_seconds[0] += selected - started
+            phase_seconds[1] += expanded - selected
+            phase_seconds[2] += simulated - expanded
+            phase_seconds[3] += ended - simulated
+            done += 1
+        self._iterations_done += done
+
+    def _new_root(self) -> Node:
+        return Node(self.env.snapshot(), self.env.terminal, None, self.env.hash, self._root_depth + 1)
+
+    def _reuse_root(self, old_root: Node) -> Node:
+        # the old root itself or the child that matches the current game, detached from the rest of the old tree
+        for node in [old_root, *old_root.children.values()]:
+            if self.env.matches(node.snapshot):
+                node.parent = None
+                return node
+        return None
 
-        # After iteration budget is used, select best action from root node
+    # The search reads and writes nodes only through the _new_root ... _backpropogation methods, ArrayMCTS in
+    # algorithms/array_mcts.py overrides them to keep the tree in NumPy buffers instead of Node objects
+    def _visits(self, node: Node) -> float:
+        return node.num_visits
+
+    def _depth(self, node: Node) -> int:
+        return node.depth
+
+    def _best_action(self, root: Node):
         action = max([(action, node.value) for action, node in root.children.items()],key=lambda x:x[1])[0]
         return action
-        
 
-    def __selection(self, node: Node) -> Node:
+    def _root_statistics(self, root: Node) -> dict:
+        # visits and value of every explored action of the root
+        return {action: (node.num_visits, node.value) for action, node in root.children.items()}
+
+    def _selection(self, node: Node) -> Node:
         search_node = node
         
-        is_expandable = len(search_node.children) < len(search_node.state.actions)
+        is_expandable = len(search_node.children) < len(self.actions)
         # if the selected node can be expanded we stop the search
         while not (search_node.is_terminal or is_expandable):
             best_ucb = float("-inf")
@@ -65,57 +289,82 @@ class MCTS():
             # in case of multiple best nodes, randomly choose one
             search_node = random.choice(best_nodes)
             # check if node is expandable (has unexplored options)
-            is_expandable = len(search_node.children) < len(search_node.state.actions)
+            is_expandable = len(search_node.children) < len(self.actions)
         return search_node
 
-    def __expand(self, node: Node) ->  Node:
+    def _expand(self, node: Node) ->  Node:
         # terminal nodes can not be expanded
         if node.is_terminal:
             return node
         # randomly choose an unexplored action to expand the tree
-        action = random.choice([a for a in node.state.actions if not a in node.children.keys()])
+        action = random.choice([a for a in self.actions if not a in node.children.keys()])
         # create new node and add to the tree
-        state_copy = node.state.get_copy()
-        state_copy.step(action)
-        new_node = Node(state_copy, node)
+        self.env.restore(node.snapshot)
+        self.env.step(action)
+        new_node = Node(self.env.snapshot(), self.env.terminal, node, self.env.hash)
         node.children[action] = new_node
         
         return new_node
             
-    def __simulation(self, node: Node) -> float:
+    def _simulation(self, node: Node) -> float:
         # if state is terminal no new reward to backpropagate
         if node.is_terminal:
             return 0
         else:
-            # copy environment to run simulations
-            state = node.state.get_copy()
-            reward = state.score
-            steps = 0
+            return self._evaluate(node.key, node.snapshot)
 
-            while not state.terminal:
-                # randomly take an action
-                
-                # Bonus: required to remember previous score to see if action led to an improvement
-                old_score = state.score
-                
-                action = random.choice(state.actions)
-                state.step(action)
-                
-                # Bonus: punish reward for taking action to avoid pure survival over improving score
-                step_reward = state.score - old_score - self.step_cost
-                # Bonus: Discount rewards that our further out in the future
-                reward += step_reward * (self.discount ** steps)
-                
-                # Otherise this would also be enough for the algorithm to work
-                # reward = state.score
-                
-                steps += 1
+    def _evaluate(self, key: int, snapshot: tuple) -> float:
+        # mean value of an already evaluated state from the transposition table, a rollout otherwise
+        if self.transpositions is not None:
+            entry = self.transpositions.lookup(key)
+            if entry is not None:
+                self.saved_rollouts += 1
+                return entry[1] / entry[0]
+        return self._rollout(snapshot)
+
+    def _rollout(self, snapshot: tuple) -> float:
+        if self.parallel == "leaf":
+            return self.__leaf_parallel_rollouts(snapshot)
+
+        # restore the scratch environment to run simulations
+        state = self.env
+        state.restore(snapshot)
+        reward = state.score
+        steps = 0
+
+        depth = self.rollout_depth
+        while not state.terminal and (depth is None or steps < depth):
+            # randomly take an action
+            
+            # Bonus: required to remember previous score to see if action led to an improvement
+            old_score = state.score
+            
+            action = random.choice(state.actions)
+            state.play(action)
+            
+            # Bonus: punish reward for taking action to avoid pure survival over improving score
+            step_reward = state.score - old_score - self.step_cost
+            # Bonus: Discount rewards that our further out in the future
+            reward += step_reward * (self.discount ** steps)
+            
+            # Otherise this would also be enough for the algorithm to work
+            # reward = state.score
+            
+            steps += 1
+
+        # the evaluator replaces the part of the game after the cut off, discounted like the moves it stands for
+        if not state.terminal and self.evaluator is not None:
+            reward += (self.evaluator(state) - state.score) * (self.discount ** steps)
 
-            return reward
+        self._rollouts += 1
+        self._rollout_steps += steps
+        return reward
 
-    def __backpropogation(self, node: Node, reward: float) -> None:
+    def _backpropogation(self, node: Node, reward: float) -> None:
         # backpropagate from node to root and update visits and value of node
         while node is not None:
             node.num_visits += 1
             node.value += reward
+            if self.transpositions is not None:
+                self.transpositions.update(node.key, reward, node.depth)
             node = node.parent
\ No newline at end of file
@@ -0,0 +1,58 @@
+import numpy as np
+
+
+def _softmax(x):
+    x = np.exp(x - x.max(axis=1, keepdims=True))
+    return x / x.sum(axis=1, keepdims=True)
+
+
+class NumpyPolicy():
+    # Activations of the Dense layers the DQN agents build. softmax and linear keep the order of the outputs,
+    # act() skips them on the output layer.
+    ACTIVATIONS = {
+        "linear": lambda x: x,
+        "relu": lambda x: np.maximum(x, 0, out=x),
+        "softmax": _softmax,
+    }
+    ORDER_PRESERVING = ("linear", "softmax")
+
+    def __init__(self, model = None):
+        # Greedy inference of a Sequential model of Dense layers in plain NumPy. keras predict builds a dataset and runs
+        # callbacks on every call, for one state that costs milliseconds while the matrix products take microseconds.
+        # The weights are a copy, call sync() after training and before acting again to keep them up to date.
+        self.layers = []
+        if model is not None:
+            self.sync(model)
+
+    def sync(self, model) -> None:
+        self.set_weights(model.get_weights(), NumpyPolicy.activations(model))
+
+    def set_weights(self, weights:list, activations:list) -> None:
+        # weights as returned by model.get_weights(): kernel and bias of every layer in turn
+        for activation in activations:
+            if activation not in NumpyPolicy.ACTIVATIONS:
+                raise ValueError(f"Unsupported activation {activation}")
+        self.layers = [(np.asarray(weights[2 * i], dtype=np.float32), np.asarray(weights[2 * i + 1], dtype=np.float32), activation)
+                       for i, activation in enumerate(activations)]
+
+    @staticmethod
+    def activations(model) -> list:
+        return [layer.get_config()["activation"] for layer in model.layers]
+
+    def predict(self, states):
+        # outputs of the model for a batch of states, like model.predict
+        return self.__forward(states, skip_output_activation=False)
+
+    def act(self, states):
+        # index of the best action for every row of states
+        return np.argmax(self.__forward(states, skip_output_activation=True), axis=1)
+
+    def __forward(self, states, skip_output_activation:bool):
+        x = np.asarray(states, dtype=np.float32).reshape(len(states), -1)
+        last = len(self.layers) - 1
+        for i, (kernel, bias, activation) in enumerate(self.layers):
+            x = x @ kernel
+            x += bias
+            if not (i == last and skip_output_activation and activation in NumpyPolicy.ORDER_PRESERVING):
+                x = NumpyPolicy.ACTIVATIONS[activation](x)
+        return x
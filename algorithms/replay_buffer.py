@@ -0,0 +1,368 @@
+import multiprocessing
+
+import numpy as np
+
+
+class ReplayBuffer():
+    def __init__(self, capacity:int, state_shape:tuple, state_dtype = np.float32, seed:int = None):
+        # Replay memory of the DQN agents in preallocated arrays, one per field of a transition. New transitions
+        # overwrite the oldest ones once the buffer is full, sampled batches are gathered with one fancy index per field.
+        self.capacity = capacity
+        self.state_shape = tuple(state_shape)
+        self.rng = np.random.default_rng(seed)
+
+        self.states = np.zeros((capacity, *self.state_shape), dtype=state_dtype)
+        self.actions = np.zeros(capacity, dtype=np.int32)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros((capacity, *self.state_shape), dtype=state_dtype)
+        self.dones = np.zeros(capacity, dtype=bool)
+
+        # slot of the next transition and number of stored transitions
+        self.position = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self) -> int:
+        return self.states.nbytes + self.actions.nbytes + self.rewards.nbytes + self.next_states.nbytes + self.dones.nbytes
+
+    def add(self, state, action:int, reward:float, next_state, done:bool):
+        # states may carry a batch axis of 1 like the agents use them, they are stored in state_shape
+        index = self.position
+        self.states[index] = np.reshape(state, self.state_shape)
+        self.actions[index] = action
+        self.rewards[index] = reward
+        self.next_states[index] = np.reshape(next_state, self.state_shape)
+        self.dones[index] = done
+
+        self.position = (index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def add_batch(self, states, actions, rewards, next_states, dones) -> np.ndarray:
+        # stores len(actions) transitions with one write per field, returns the slots they went to
+        count = len(actions)
+        indices = (self.position + np.arange(count)) % self.capacity
+        self.states[indices] = np.reshape(states, (count, *self.state_shape))
+        self.actions[indices] = actions
+        self.rewards[indices] = rewards
+        self.next_states[indices] = np.reshape(next_states, (count, *self.state_shape))
+        self.dones[indices] = dones
+
+        self.position = (self.position + count) % self.capacity
+        self.size = min(self.size + count, self.capacity)
+        return indices
+
+    def sample(self, batch_size:int) -> tuple:
+        # uniform batch with replacement as (states, actions, rewards, next_states, dones), all arrays are copies
+        indices = self.rng.integers(0, self.size, size=batch_size)
+        return self.states[indices], self.actions[indices], self.rewards[indices], self.next_states[indices], self.dones[indices]
+
+
+class SumTree():
+    def __init__(self, capacity:int):
+        # Binary tree of priority sums in one array: node 1 is the root, the children of node i are 2i and 2i + 1
+        # and the leaves of the slots start at self.leaves. The leaf count is rounded up to a power of two so
+        # every leaf sits at the same depth. Updates and searches work on whole batches, one tree level at a time.
+        self.leaves = 1 << max(capacity - 1, 0).bit_length()
+        self.depth = self.leaves.bit_length() - 1
+        self.nodes = np.zeros(2 * self.leaves, dtype=np.float64)
+
+    @property
+    def total(self) -> float:
+        return self.nodes[1]
+
+    def get(self, indices):
+        return self.nodes[self.leaves + np.asarray(indices)]
+
+    def update(self, indices, priorities):
+        # writes the leaves and recomputes the sums on the path of every leaf up to the root. Paths that meet write
+        # the same sum twice, which is cheaper than deduplicating the nodes on every level.
+        nodes = self.leaves + np.asarray(indices)
+        self.nodes[nodes] = priorities
+        for _ in range(self.depth):
+            nodes //= 2
+            self.nodes[nodes] = self.nodes[2 * nodes] + self.nodes[2 * nodes + 1]
+
+    def find(self, values):
+        # slot of every value in the cumulative priorities, descends all values in lockstep
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sums = self.nodes[left]
+            go_right = values > left_sums
+            values -= np.where(go_right, left_sums, 0)
+            nodes = left + go_right
+        return nodes - self.leaves
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    def __init__(self, capacity:int, state_shape:tuple, state_dtype = np.float32, seed:int = None,
+                 alpha:float = 0.6, beta:float = 0.4, beta_increment:float = 1e-4, epsilon:float = 1e-6):
+        # Proportional prioritized replay: transitions are drawn with probability priority^alpha / sum, new ones get the
+        # highest priority seen so far. beta of the importance-sampling weights is annealed towards 1 with every batch,
+        # epsilon keeps transitions with a TD error of 0 reachable.
+        super(PrioritizedReplayBuffer, self).__init__(capacity, state_shape, state_dtype, seed)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.epsilon = epsilon
+        self.priorities = SumTree(capacity)
+        self.max_priority = 1.0
+
+    @property
+    def nbytes(self) -> int:
+        return super(PrioritizedReplayBuffer, self).nbytes + self.priorities.nodes.nbytes
+
+    def add(self, state, action:int, reward:float, next_state, done:bool):
+        self.priorities.update([self.position], [self.max_priority])
+        super(PrioritizedReplayBuffer, self).add(state, action, reward, next_state, done)
+
+    def add_batch(self, states, actions, rewards, next_states, dones) -> np.ndarray:
+        indices = super(PrioritizedReplayBuffer, self).add_batch(states, actions, rewards, next_states, dones)
+        self.priorities.update(indices, np.full(len(indices), self.max_priority))
+        return indices
+
+    def sample(self, batch_size:int) -> tuple:
+        # (states, actions, rewards, next_states, dones, indices, weights), indices go back into update_priorities.
+        # One value is drawn from each of batch_size equal segments of the total priority.
+        segment = self.priorities.total / batch_size
+        values = (np.arange(batch_size) + self.rng.random(batch_size)) * segment
+        # rounding can push a value past the last filled slot
+        indices = np.minimum(self.priorities.find(values), self.size - 1)
+
+        probabilities = self.priorities.get(indices) / self.priorities.total
+        weights = (self.size * probabilities) ** -self.beta
+        weights = (weights / weights.max()).astype(np.float32)
+        self.beta = min(1.0, self.beta + self.beta_increment)
+
+        return (self.states[indices], self.actions[indices], self.rewards[indices], self.next_states[indices], self.dones[indices],
+                indices, weights)
+
+    def update_priorities(self, indices, td_errors):
+        priorities = (np.abs(td_errors) + self.epsilon) ** self.alpha
+        self.priorities.update(indices, priorities)
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+
+
+class SharedReplayBuffer(ReplayBuffer):
+    # Fields of a transition and their dtypes besides the states
+    FIELDS = {"actions": np.int32, "rewards": np.float32, "dones": bool}
+
+    def __init__(self, capacity:int, state_shape:tuple, state_dtype = np.float32, context = None):
+        # ReplayBuffer in shared memory for actor processes that add transitions and a learner process that samples.
+        # Pass it to the processes as an argument, every copy maps the same memory and draws from its own generator.
+        # Writers hold the lock, sampling does not wait for it: a slot overwritten while a batch is gathered only
+        # gives one mixed-up transition, which replay tolerates.
+        context = context or multiprocessing.get_context()
+        self.capacity = capacity
+        self.state_shape = tuple(state_shape)
+        self.state_dtype = np.dtype(state_dtype)
+        self.lock = context.Lock()
+
+        state_bytes = capacity * int(np.prod(self.state_shape)) * self.state_dtype.itemsize
+        self._raw = {"states": context.RawArray("B", state_bytes), "next_states": context.RawArray("B", state_bytes),
+                     "meta": context.RawArray("q", 2)}
+        for name, dtype in SharedReplayBuffer.FIELDS.items():
+            self._raw[name] = context.RawArray("B", capacity * np.dtype(dtype).itemsize)
+        self.__map()
+
+    def __map(self):
+        self.rng = np.random.default_rng()
+        self.states = np.frombuffer(self._raw["states"], dtype=self.state_dtype).reshape(self.capacity, *self.state_shape)
+        self.next_states = np.frombuffer(self._raw["next_states"], dtype=self.state_dtype).reshape(self.capacity, *self.state_shape)
+        for name, dtype in SharedReplayBuffer.FIELDS.items():
+            setattr(self, name, np.frombuffer(self._raw[name], dtype=dtype))
+        # slot of the next transition and number of stored transitions
+        self._meta = np.frombuffer(self._raw["meta"], dtype=np.int64)
+
+    def __getstate__(self):
+        return {name: value for name, value in self.__dict__.items()
+                if name in ("capacity", "state_shape", "state_dtype", "lock", "_raw")}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__map()
+
+    @property
+    def position(self) -> int:
+        return int(self._meta[0])
+
+    @position.setter
+    def position(self, value:int):
+        self._meta[0] = value
+
+    @property
+    def size(self) -> int:
+        return int(self._meta[1])
+
+    @size.setter
+    def size(self, value:int):
+        self._meta[1] = value
+
+    def add(self, state, action:int, reward:float, next_state, done:bool):
+        with self.lock:
+            super(SharedReplayBuffer, self).add(state, action, reward, next_state, done)
+
+    def add_batch(self, states, actions, rewards, next_states, dones) -> np.ndarray:
+        with self.lock:
+            return super(SharedReplayBuffer, self).add_batch(states, actions, rewards, next_states, dones)
+
+
+class FrameReplayBuffer():
+    def __init__(self, capacity:int, frame_size:int, history:int = 2, seed:int = None):
+        # Replay memory of stacked frames (see FrameStack) that stores every uint8 frame once instead of in a state and
+        # again in a next_state. Slot i holds the frame after a move, its next_state is frames i, i - 1, ... and its
+        # state frames i - 1, i - 2, ..., both rebuilt by index at sample time and min/max normalized like FrameStack.
+        # Every episode starts with add_first(first frame), which takes a slot but is no transition.
+        # A state needs history + 1 frames of the same episode at most, steps counts the moves of the episode up to
+        # a slot (capped at history + 1, all that matters) and frames before its start are zero. Slots whose history is overwritten by newer frames are not sampled.
+        if not 0 < history < 255:
+            raise ValueError(f"A history of {history} frames is not supported")
+        if capacity <= history + 1:
+            raise ValueError(f"A capacity of {capacity} cannot hold a history of {history} frames")
+        self.capacity = capacity
+        self.frame_size = frame_size
+        self.history = history
+        self.rng = np.random.default_rng(seed)
+
+        self.frames = np.zeros((capacity, frame_size), dtype=np.uint8)
+        self.actions = np.zeros(capacity, dtype=np.int32)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=bool)
+        self.steps = np.zeros(capacity, dtype=np.uint8)
+        # slots that can be sampled as a transition
+        self.valid = np.zeros(capacity, dtype=bool)
+
+        # slot of the next frame, number of written slots, number of valid slots and moves of the current episode
+        self.position = 0
+        self.size = 0
+        self.transitions = 0
+        self.episode_steps = None
+        self.__offsets = np.arange(history + 1)
+
+    def __len__(self):
+        return self.transitions
+
+    @property
+    def nbytes(self) -> int:
+        return self.frames.nbytes + self.actions.nbytes + self.rewards.nbytes + self.dones.nbytes + self.steps.nbytes + self.valid.nbytes
+
+    def add_first(self, frame) -> None:
+        self.episode_steps = 0
+        self.__write(frame, 0, 0.0, False, False)
+
+    def add(self, frame, action:int, reward:float, done:bool) -> None:
+        # frame is the frame after action
+        if self.episode_steps is None:
+            raise ValueError("Start every episode with add_first")
+        self.episode_steps += 1
+        self.__write(frame, action, reward, done, True)
+
+    def sample(self, batch_size:int) -> tuple:
+        # uniform batch with replacement as (states, actions, rewards, next_states, dones) like ReplayBuffer.sample
+        if self.transitions == 0:
+            raise ValueError("No transitions to sample")
+        return self._gather(self._uniform_indices(batch_size))
+
+    def _uniform_indices(self, count:int) -> np.ndarray:
+        # draws slots until all of them are valid, first frames and overwritten histories are rare
+        indices = self.rng.integers(0, self.size, size=count)
+        invalid = ~self.valid[indices]
+        while invalid.any():
+            indices[invalid] = self.rng.integers(0, self.size, size=int(invalid.sum()))
+            invalid = ~self.valid[indices]
+        return indices
+
+    def _gather(self, indices) -> tuple:
+        window = self.frames[(indices[:, None] - self.__offsets) % self.capacity]
+        window[self.__offsets > self.steps[indices][:, None]] = 0
+        count = len(indices)
+        next_states = FrameReplayBuffer.__normalize(window[:, :self.history].reshape(count, -1))
+        states = FrameReplayBuffer.__normalize(window[:, 1:].reshape(count, -1))
+        return states, self.actions[indices], self.rewards[indices], next_states, self.dones[indices]
+
+    def _mark(self, indices:list, valid:list) -> None:
+        # a handful of slots per frame, plain Python beats the overhead of NumPy calls
+        for index, flag in zip(indices, valid):
+            self.transitions += int(flag) - int(self.valid[index])
+            self.valid[index] = flag
+
+    def __write(self, frame, action:int, reward:float, done:bool, valid:bool) -> None:
+        index = self.position
+        frame = np.asarray(frame)
+        self.frames[index].reshape(frame.shape)[...] = frame
+        self.actions[index] = action
+        self.rewards[index] = reward
+        self.dones[index] = done
+        self.steps[index] = min(self.episode_steps, self.history + 1)
+        # the following slots hold the oldest frames, their histories reach into the overwritten slot
+        following = [(index + offset) % self.capacity for offset in range(1, self.history + 1)]
+        self._mark([index] + following, [valid] + [False] * self.history)
+
+        self.position = (index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    @staticmethod
+    def __normalize(states) -> np.ndarray:
+        # min/max of every row to [0, 1], rows of one value become 0
+        states = states.astype(np.float32)
+        low = states.min(axis=1, keepdims=True)
+        span = states.max(axis=1, keepdims=True) - low
+        states -= low
+        states /= np.where(span > 0, span, 1)
+        return states
+
+
+class PrioritizedFrameReplayBuffer(FrameReplayBuffer):
+    def __init__(self, capacity:int, frame_size:int, history:int = 2, seed:int = None,
+                 alpha:float = 0.6, beta:float = 0.4, beta_increment:float = 1e-4, epsilon:float = 1e-6):
+        # FrameReplayBuffer with the proportional priorities of PrioritizedReplayBuffer, slots that are no valid
+        # transition have priority 0
+        self.priorities = SumTree(capacity)
+        super(PrioritizedFrameReplayBuffer, self).__init__(capacity, frame_size, history, seed)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.epsilon = epsilon
+        self.max_priority = 1.0
+
+    @property
+    def nbytes(self) -> int:
+        return super(PrioritizedFrameReplayBuffer, self).nbytes + self.priorities.nodes.nbytes
+
+    def sample(self, batch_size:int) -> tuple:
+        # (states, actions, rewards, next_states, dones, indices, weights) like PrioritizedReplayBuffer.sample
+        if self.transitions == 0:
+            raise ValueError("No transitions to sample")
+        segment = self.priorities.total / batch_size
+        values = (np.arange(batch_size) + self.rng.random(batch_size)) * segment
+        indices = np.minimum(self.priorities.find(values), self.size - 1)
+        # rounding can land on a slot of priority 0
+        invalid = ~self.valid[indices]
+        if invalid.any():
+            indices[invalid] = self._uniform_indices(int(invalid.sum()))
+
+        probabilities = self.priorities.get(indices) / self.priorities.total
+        weights = (self.transitions * probabilities) ** -self.beta
+        weights = (weights / weights.max()).astype(np.float32)
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        return (*self._gather(indices), indices, weights)
+
+    def update_priorities(self, indices, td_errors):
+        # slots that stopped being a transition since they were sampled keep priority 0
+        indices = np.asarray(indices)
+        keep = self.valid[indices]
+        priorities = (np.abs(td_errors[keep]) + self.epsilon) ** self.alpha
+        self.priorities.update(indices[keep], priorities)
+        if len(priorities):
+            self.max_priority = max(self.max_priority, float(priorities.max()))
+
+    def _mark(self, indices:list, valid:list) -> None:
+        # new transitions get the highest priority, slots that stop being one priority 0, one tree update for all
+        changes = [(index, self.max_priority if flag else 0.0) for index, flag in zip(indices, valid) if flag or self.valid[index]]
+        super(PrioritizedFrameReplayBuffer, self)._mark(indices, valid)
+        if changes:
+            self.priorities.update(*zip(*changes))
@@ -1,30 +1,43 @@
-import random
 import numpy as np
 from keras import Sequential
-from collections import deque
 from keras.layers import Dense
 from keras.optimizers import Adam
 from gym import spaces
 from IPython.display import clear_output
 
+from algorithms.checkpoint import Checkpointer
+from algorithms.dqn_config import DQNConfig, TrainingSchedule
+from algorithms.dqn_learner import DQNLearner
+from algorithms.numpy_policy import NumpyPolicy
+from algorithms.replay_buffer import ReplayBuffer, PrioritizedReplayBuffer
+
 
 class DQN:
 
     """ Deep Q Network """
 
-    def __init__(self, action_space, observation_space, params):
+    def __init__(self, action_space, observation_space, config: DQNConfig):
 
         self.action_space = action_space
         self.observation_space = observation_space
-        self.epsilon = params['epsilon'] 
-        self.gamma = params['gamma'] 
-        self.batch_size = params['batch_size'] 
-        self.epsilon_min = params['epsilon_min'] 
-        self.epsilon_decay = params['epsilon_decay'] 
-        self.learning_rate = params['learning_rate']
-        self.layer_sizes = params['layer_sizes']
-        self.memory = deque(maxlen=2500)
+        self.epsilon = config.epsilon
+        self.gamma = config.gamma
+        self.batch_size = config.batch_size
+        self.epsilon_min = config.epsilon_min
+        self.epsilon_decay = config.epsilon_decay
+        self.learning_rate = config.learning_rate
+        self.layer_sizes = config.layer_sizes
+        # prioritized replay draws transitions with large TD errors more often and corrects the bias with importance-sampling weights
+        self.prioritized_replay = config.prioritized_replay
+        if self.prioritized_replay:
+            self.memory = PrioritizedReplayBuffer(config.memory_size, (self.observation_space.n,))
+        else:
+            self.memory = ReplayBuffer(config.memory_size, (self.observation_space.n,))
         self.model = self.build_model()
+        # compiled update step with a target network, see DQNLearner for the target update modes
+        self.learner = DQNLearner(self.model, self.gamma, config.target_update, config.target_sync_interval, config.tau)
+        # NumPy copy of the network for acting, TrainingSchedule syncs it once per update
+        self.policy = NumpyPolicy(self.model)
 
 
     def build_model(self):
@@ -40,69 +53,79 @@ class DQN:
 
 
     def remember(self, state, action, reward, next_state, done):
-        self.memory.append((state, action, reward, next_state, done))
+        self.memory.add(state, action, reward, next_state, done)
 
 
     def act(self, state):
 
         if np.random.rand() <= self.epsilon:
             return self.action_space.sample()
-        act_values = self.model.predict(state)
-        return np.argmax(act_values[0])
+        return int(self.policy.act(state)[0])
+
+
+    def act_batch(self, states):
+        # epsilon-greedy actions for a batch of states, one row per env
+        actions = self.policy.act(states)
+        explore = np.random.rand(len(actions)) <= self.epsilon
+        actions[explore] = np.random.randint(self.action_space.n, size=int(explore.sum()))
+        return actions
 
 
     def replay(self):
 
         if len(self.memory) < self.batch_size:
             return
-        minibatch = random.sample(self.memory, self.batch_size)
-        states = np.array([i[0] for i in minibatch])
-        actions = np.array([i[1] for i in minibatch])
-        rewards = np.array([i[2] for i in minibatch])
-        next_states = np.array([i[3] for i in minibatch])
-        dones = np.array([i[4] for i in minibatch])
-
-        states = np.squeeze(states)
-        next_states = np.squeeze(next_states)
-        targets = rewards + self.gamma*(np.amax(self.model.predict_on_batch(next_states), axis=1))*(1-dones)
-        targets_full = self.model.predict_on_batch(states)
-
-        ind = np.array([i for i in range(self.batch_size)])
-        targets_full[[ind], [actions]] = targets
-        self.model.fit(states, targets_full, epochs=1, verbose=0)
+        if self.prioritized_replay:
+            states, actions, rewards, next_states, dones, indices, weights = self.memory.sample(self.batch_size)
+        else:
+            states, actions, rewards, next_states, dones = self.memory.sample(self.batch_size)
+            weights = None
+
+        td_errors = self.learner.update(states, actions, rewards, next_states, dones, weights)
+        if self.prioritized_replay:
+            # TD errors of the whole batch update the priorities in one go
+            self.memory.update_priorities(indices, td_errors)
+
+
+    def decay_epsilon(self):
         if self.epsilon > self.epsilon_min:
             self.epsilon *= self.epsilon_decay
 
 class DQNAGENT():
     
-    def __init__(self, env, processor, render):
+    def __init__(self, env, processor, render, config: DQNConfig = None):
         self.env = env
         # Enable state space reduction and reward enhancements
         self.processor = processor
         self.env.observation_space = self.processor.observation_space
         self.render = render
+        self.config = config or DQNConfig()
+        self.agent = None
+        # first episode of train(), set when a checkpoint is loaded
+        self.episode = 0
+        # env step and gradient step counters of train(), kept across calls and in checkpoints like episode
+        self.schedule = TrainingSchedule(self.config)
         
         
     def train(self):
-        params = dict()
-        params['name'] = None
-        params['epsilon'] = 1
-        params['gamma'] = .95
-        params['batch_size'] = 200
-        params['epsilon_min'] = .01
-        params['epsilon_decay'] = .995
-        params['learning_rate'] = 0.00025
-        params['layer_sizes'] = [128, 128, 128 ,128]
-        episode = 10000
-
-        agent = DQN(action_space=self.env.action_space, observation_space=self.env.observation_space, params=params)
+        config = self.config
+        episode = config.episodes
+
+        if self.agent is None and config.checkpoint_dir is not None and Checkpointer(config.checkpoint_dir).latest() is not None:
+            # resume a stopped run
+            self.load_model()
+        if self.agent is None:
+            self.agent = self._build_agent()
+        agent = self.agent
+        checkpointer = Checkpointer(config.checkpoint_dir) if config.checkpoint_dir is not None else None
+        schedule = self.schedule
+        print(f"Replay buffer: {agent.memory.nbytes / 2**20:.1f} MiB for {config.memory_size} transitions")
         high_score = 0
-        for e in range(episode):
+        for e in range(self.episode, episode):
             observation = self.env.reset()
             state = self.processor.process_state(observation, {"direction": self.env.actions[0]})
 
-            max_steps = 10000
-            for i in range(max_steps):
+            for i in range(config.max_steps):
                 action = agent.act(state)
                 observation, score, done, info = self.env.step(self.env.actions[action])
                 reward = self.processor.process_reward(observation, score, done, info)
@@ -111,13 +134,32 @@ class DQNAGENT():
                 state = next_state
                 if self.render:
                     self.env.render()
-                if params['batch_size'] > 1:
-                    agent.replay()
+                schedule.step(agent)
                 if done:
                     clear_output()
                     if score > high_score:
                         high_score = score
-                    print(f"Episode {e}/{episode}, Score: {score}, HighScore: {high_score}")
+                    print(f"Episode {e}/{episode}, Score: {score}, HighScore: {high_score}, {schedule.throughput()}")
                     break
-
-    
\ No newline at end of file
+            self.episode = e + 1
+            if checkpointer is not None and self.episode % config.checkpoint_interval == 0:
+                checkpointer.save_async(agent, self.episode, schedule=schedule, processor=self.processor)
+        if checkpointer is not None:
+            checkpointer.wait()
+
+    def _build_agent(self):
+        return DQN(action_space=self.env.action_space, observation_space=self.env.observation_space, config=self.config)
+
+    def load_model(self, directory:str = None):
+        # restores the newest checkpoint in directory (config.checkpoint_dir by default), train() goes on from its episode
+        if self.agent is None:
+            self.agent = self._build_agent()
+        saved = Checkpointer(directory or self.config.checkpoint_dir).load(self.agent, schedule=self.schedule, processor=self.processor)
+        self.episode = saved["step"]
+        print(f"Loaded checkpoint of episode {self.episode}")
+    
+    def store_model(self, directory:str = None):
+        # synchronous checkpoint of the agent of train()
+        if self.agent is None:
+            raise RuntimeError("No agent to store yet, call train() or load_model() first")
+        Checkpointer(directory or self.config.checkpoint_dir).save(self.agent, self.episode, schedule=self.schedule, processor=self.processor)
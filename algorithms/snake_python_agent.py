@@ -1,4 +1,3 @@
-import random
 import numpy as np
 from keras import Sequential
 from collections import deque
@@ -7,24 +6,41 @@ from keras.optimizers import Adam
 import os
 import time
 
+from algorithms.checkpoint import Checkpointer
+from algorithms.dqn_config import DQNConfig, TrainingSchedule
+from algorithms.dqn_learner import DQNLearner
+from algorithms.numpy_policy import NumpyPolicy
+from algorithms.replay_buffer import FrameReplayBuffer, PrioritizedFrameReplayBuffer
+from envs.frame_stack import FrameStack
+
 
 class DQN:
 
     """ Deep Q Network """
 
-    def __init__(self, env, params):
+    def __init__(self, env, config: DQNConfig):
 
         self.action_space = env.action_space
         self.observation_space = env.observation_space
-        self.epsilon = params['epsilon'] 
-        self.gamma = params['gamma'] 
-        self.batch_size = params['batch_size'] 
-        self.epsilon_min = params['epsilon_min'] 
-        self.epsilon_decay = params['epsilon_decay'] 
-        self.learning_rate = params['learning_rate']
-        self.layer_sizes = params['layer_sizes']
-        self.memory = deque(maxlen=1000)
+        self.epsilon = config.epsilon
+        self.gamma = config.gamma
+        self.batch_size = config.batch_size
+        self.epsilon_min = config.epsilon_min
+        self.epsilon_decay = config.epsilon_decay
+        self.learning_rate = config.learning_rate
+        self.layer_sizes = config.layer_sizes
+        # prioritized replay draws transitions with large TD errors more often and corrects the bias with importance-sampling weights
+        self.prioritized_replay = config.prioritized_replay
+        # states are the current and the last frame, the replay stores every frame once and stacks them when sampling
+        if self.prioritized_replay:
+            self.memory = PrioritizedFrameReplayBuffer(config.memory_size, self.observation_space.n, history=2)
+        else:
+            self.memory = FrameReplayBuffer(config.memory_size, self.observation_space.n, history=2)
         self.model = self.build_model()
+        # compiled update step with a target network, see DQNLearner for the target update modes
+        self.learner = DQNLearner(self.model, self.gamma, config.target_update, config.target_sync_interval, config.tau)
+        # NumPy copy of the network for acting, TrainingSchedule syncs it once per update
+        self.policy = NumpyPolicy(self.model)
 
 
     def build_model(self):
@@ -39,83 +55,99 @@ class DQN:
         return model
 
 
-    def remember(self, state, action, reward, next_state, done):
-        self.memory.append((state, action, reward, next_state, done))
+    def start_episode(self, frame):
+        self.memory.add_first(frame)
+
+
+    def remember(self, frame, action, reward, done):
+        # frame is the frame after action
+        self.memory.add(frame, action, reward, done)
 
 
     def act(self, state):
         if np.random.rand() <= self.epsilon:
             return self.action_space.sample()
-        act_values = self.model.predict(state)
-        return np.argmax(act_values[0])
+        return int(self.policy.act(state)[0])
+
+
+    def act_batch(self, states):
+        # epsilon-greedy actions for a batch of states, one row per env
+        actions = self.policy.act(states)
+        explore = np.random.rand(len(actions)) <= self.epsilon
+        actions[explore] = np.random.randint(self.action_space.n, size=int(explore.sum()))
+        return actions
 
 
     def replay(self):
         if len(self.memory) < self.batch_size:
             return
-        minibatch = random.sample(self.memory, self.batch_size)
-        states = np.array([i[0] for i in minibatch])
-        actions = np.array([i[1] for i in minibatch])
-        rewards = np.array([i[2] for i in minibatch])
-        next_states = np.array([i[3] for i in minibatch])
-        dones = np.array([i[4] for i in minibatch])
-
-        states = np.squeeze(states)
-        next_states = np.squeeze(next_states)
-        targets = rewards + self.gamma*(np.amax(self.model.predict_on_batch(next_states), axis=1))*(1-dones)
-        targets_full = self.model.predict_on_batch(states)
-
-        ind = np.array([i for i in range(self.batch_size)])
-        targets_full[[ind], [actions]] = targets
-        self.model.fit(states, targets_full, epochs=1, verbose=0)
+        if self.prioritized_replay:
+            states, actions, rewards, next_states, dones, indices, weights = self.memory.sample(self.batch_size)
+        else:
+            states, actions, rewards, next_states, dones = self.memory.sample(self.batch_size)
+            weights = None
+
+        td_errors = self.learner.update(states, actions, rewards, next_states, dones, weights)
+        if self.prioritized_replay:
+            # TD errors of the whole batch update the priorities in one go
+            self.memory.update_priorities(indices, td_errors)
+
+
+    def decay_epsilon(self):
         if self.epsilon > self.epsilon_min:
             self.epsilon *= self.epsilon_decay
 
 class DQNAGENT():
     
-    def __init__(self, env):
+    def __init__(self, env, config: DQNConfig = None):
         super().__init__()
         self.env = env
-        self.training_episodes = 100000
+        self.config = config or DQNConfig(batch_size=50, layer_sizes=[100, 100, 100], epsilon_decay=.9995, memory_size=1000, episodes=100000)
+        self.agent = None
+        # first episode of train(), set when a checkpoint is loaded
+        self.episode = 0
+        # env step and gradient step counters of train(), kept across calls and in checkpoints like episode
+        self.schedule = TrainingSchedule(self.config)
+        self.training_episodes = self.config.episodes
         self.log_path = os.path.join(os.path.dirname(__file__), '..','logs', 'log.txt')
         
         self.prev_length = None
-        self.last_image = None
+        self.frames = FrameStack(self.env.observation_space.n, history=2)
         
         
     def train(self):
-        params = dict()
-        params['name'] = None
-        params['epsilon'] = 1
-        params['gamma'] = .95
-        params['batch_size'] = 50
-        params['epsilon_min'] = .01
-        params['epsilon_decay'] = .9995
-        params['learning_rate'] = 0.00025
-        params['layer_sizes'] = [100, 100, 100]
-
-        agent = DQN(self.env, params)
+        config = self.config
+
+        if self.agent is None and config.checkpoint_dir is not None and Checkpointer(config.checkpoint_dir).latest() is not None:
+            # resume a stopped run
+            self.load_model()
+        if self.agent is None:
+            self.agent = self._build_agent()
+        agent = self.agent
+        checkpointer = Checkpointer(config.checkpoint_dir) if config.checkpoint_dir is not None else None
+        schedule = self.schedule
+        print(f"Replay buffer: {agent.memory.nbytes / 2**20:.1f} MiB for {config.memory_size} transitions")
         rolling_score = deque(maxlen=20)
        
-        for e in range(self.training_episodes):
+        for e in range(self.episode, self.training_episodes):
             render = False
             if (e % 1) == 0:
                 render = True
             observation = self.env.reset()
             self.prev_length = 0
-            self.last_image = np.zeros(shape=(5, 5))
-            state = self._enhance_state(observation)
+            self.frames.reset(self._enhance_state(observation))
+            agent.start_episode(self.frames.frame)
+            state = self.frames.state()
             score = 0
-            max_steps = 10000
-            for i in range(max_steps):
+            for i in range(config.max_steps):
                 action = agent.act(state)
                 observation, reward_indicators, done, _ = self.env.step(self.env.actions[action])
                 reward = self._enhance_reward(reward_indicators, done)
                 score = reward_indicators
-                next_state = self._enhance_state(observation)
-                agent.remember(state, action, reward, next_state, done)
-                state = next_state
-                agent.replay()
+                self.frames.push(self._enhance_state(observation))
+                agent.remember(self.frames.frame, action, reward, done)
+                state = self.frames.state()
+                schedule.step(agent)
                 if render:
                     self.env.render()
                     time.sleep(0.1)
@@ -123,23 +155,20 @@ class DQNAGENT():
                     rolling_score.append(score)
                     print(f'episode: {e+1}/{self.training_episodes}, score: {score}')
                     print(f'mean score of last 20: {np.asarray(rolling_score, dtype=np.float32).mean()}')
+                    print(schedule.throughput())
                     break
             # log_line = f'{e}, {score} \n'
             # with open(self.log_path, "a") as file_object:
             #     file_object.write(log_line)
-    
+            self.episode = e + 1
+            if checkpointer is not None and self.episode % config.checkpoint_interval == 0:
+                checkpointer.save_async(agent, self.episode, schedule=schedule)
+        if checkpointer is not None:
+            checkpointer.wait()
+
     def _enhance_state(self, observation):
-        image = np.asarray(observation).astype('float64')
-        image = np.transpose(image)
-        #print(image)
-        state = np.concatenate((image, self.last_image), axis=0)
-        #print(state)
-        state = np.reshape(state, (1, self.env.observation_space.n * 2))
-        #print(state)
-        state = np.interp(state, (state.min(), state.max()), (0, 1))
-        self.last_image = image
-        #print(state)
-        return state
+        # the frame of an observation, a transposed view that FrameStack copies into its ring as uint8
+        return np.transpose(np.asarray(observation))
     
     def _enhance_reward(self, reward_indicators, done):
         reward = 0
@@ -162,9 +191,20 @@ class DQNAGENT():
     def test(self):
         print("Test not implemented yet")
                 
-    def load_model(self):
-        print("Load model not implemented yet")
+    def _build_agent(self):
+        return DQN(self.env, self.config)
+
+    def load_model(self, directory:str = None):
+        # restores the newest checkpoint in directory (config.checkpoint_dir by default), train() goes on from its episode
+        if self.agent is None:
+            self.agent = self._build_agent()
+        saved = Checkpointer(directory or self.config.checkpoint_dir).load(self.agent, schedule=self.schedule)
+        self.episode = saved["step"]
+        print(f"Loaded checkpoint of episode {self.episode}")
     
-    def store_model(self):
-        print("Store model not implemented yet")
+    def store_model(self, directory:str = None):
+        # synchronous checkpoint of the agent of train()
+        if self.agent is None:
+            raise RuntimeError("No agent to store yet, call train() or load_model() first")
+        Checkpointer(directory or self.config.checkpoint_dir).save(self.agent, self.episode, schedule=self.schedule)
     
\ No newline at end of file
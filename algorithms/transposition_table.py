@@ -0,0 +1,55 @@
+from collections import OrderedDict
+
+
+class TranspositionTable():
+    # Bounded map from the Zobrist hash of a game state to [visits, value, depth], shared by every tree node of that state.
+    # depth is absolute, moves from the root of the first search (see MCTS), and an entry keeps the smallest one it saw.
+    # policy="lru" evicts the least recently used entry once the table is full.
+    # policy="depth" prefers shallow entries, which carry the most visits: a full table only replaces its least
+    # recently used entry if the new entry is not deeper in the tree. Entries above the root of the current search
+    # belong to earlier moves and are replaced like with "lru".
+    def __init__(self, capacity:int, policy:str = "lru"):
+        if policy not in ("lru", "depth"):
+            raise ValueError(f"Unknown eviction policy {policy}, use 'lru' or 'depth'")
+        self.capacity = capacity
+        self.policy = policy
+        self.entries = OrderedDict()
+        self.root_depth = 0
+
+        self.lookups = 0
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def start_move(self, root_depth:int) -> None:
+        # depth of the root of the next search
+        self.root_depth = root_depth
+
+    def lookup(self, key:int) -> list:
+        self.lookups += 1
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return entry
+
+    def update(self, key:int, reward:float, depth:int) -> None:
+        entry = self.entries.get(key)
+        if entry is None:
+            if len(self.entries) >= self.capacity:
+                if self.policy == "depth":
+                    oldest_depth = next(iter(self.entries.values()))[2]
+                    if oldest_depth >= self.root_depth and depth > oldest_depth:
+                        return
+                self.entries.popitem(last=False)
+            entry = self.entries[key] = [0, 0.0, depth]
+        else:
+            self.entries.move_to_end(key)
+            entry[2] = min(entry[2], depth)
+        entry[0] += 1
+        entry[1] += reward
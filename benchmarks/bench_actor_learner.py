@@ -0,0 +1,56 @@
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from algorithms.actor_learner import ActorLearner, SharedWeights, _run_actor
+from algorithms.dqn_config import DQNConfig
+from algorithms.replay_buffer import SharedReplayBuffer
+
+# Run from the repository root: python -m benchmarks.bench_actor_learner
+# Measures the experience throughput of the actor processes alone, with random policy weights instead of a learner,
+# so it runs without TensorFlow.
+
+
+def random_weights(inputs:int, layer_sizes:list, actions:int = 4):
+    rng = np.random.default_rng(0)
+    sizes = [inputs, *layer_sizes, actions]
+    weights = []
+    for fan_in, fan_out in zip(sizes[:-1], sizes[1:]):
+        weights += [rng.normal(scale=fan_in ** -0.5, size=(fan_in, fan_out)).astype(np.float32), np.zeros(fan_out, dtype=np.float32)]
+    return weights, ["relu"] * len(layer_sizes) + ["softmax"]
+
+
+def env_steps_per_second(actors:int, seconds:float = 5.0, tiles:int = 10):
+    config = DQNConfig(actors=actors, memory_size=100000)
+    trainer = ActorLearner(config, tiles)
+    context = trainer.context
+    memory = SharedReplayBuffer(config.memory_size, (12,), context=context)
+    weights = SharedWeights(*random_weights(12, config.layer_sizes), context)
+    counters = context.RawArray("d", 3)
+    stop = context.Event()
+    processes = [context.Process(target=_run_actor, daemon=True,
+                                 args=(config, epsilon, trainer.env_class, tiles, trainer.processor_class, memory, weights,
+                                       counters, stop, seed))
+                 for seed, epsilon in enumerate(trainer.actor_epsilons())]
+    for process in processes:
+        process.start()
+    # let the processes start up before measuring
+    while counters[0] == 0:
+        time.sleep(0.05)
+    start_steps, start = counters[0], time.perf_counter()
+    time.sleep(seconds)
+    steps = counters[0] - start_steps
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for process in processes:
+        process.join()
+    return steps / elapsed, len(memory)
+
+
+if __name__ == "__main__":
+    print(f"{os.cpu_count()} CPUs")
+    for actors in sorted({1, 2, 4, os.cpu_count()}):
+        steps, stored = env_steps_per_second(actors)
+        print(f"{actors} actors: {steps:,.0f} env steps/s, {stored} transitions stored")
@@ -0,0 +1,37 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from algorithms.checkpoint import save_replay, load_replay, _replay_state
+from algorithms.replay_buffer import ReplayBuffer, PrioritizedReplayBuffer
+
+# Run from the repository root: python -m benchmarks.bench_checkpoint
+
+
+def seconds(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        for buffer_class, transitions in ((ReplayBuffer, 1_000_000), (ReplayBuffer, 4_000_000), (PrioritizedReplayBuffer, 1_000_000)):
+            buffer = buffer_class(transitions, (12,))
+            buffer.states[:] = np.random.default_rng(0).random((transitions, 12), dtype=np.float32)
+            buffer.size = transitions
+            path = os.path.join(directory, f"{buffer_class.__name__}-{transitions}")
+
+            # the part of Checkpointer.save_async that runs on the training thread: copying the filled slots, into new
+            # arrays at the first save and into the reused copies of an earlier one from then on
+            copies = {}
+            first_stall = seconds(lambda: _replay_state(buffer, copies))
+            stall = seconds(lambda: _replay_state(buffer, copies))
+            save = seconds(lambda: save_replay(buffer, path))
+            restored = buffer_class(transitions, (12,))
+            load = seconds(lambda: load_replay(restored, path))
+            assert np.array_equal(restored.states, buffer.states)
+            print(f"{buffer_class.__name__} with {transitions:,} transitions ({buffer.nbytes / 2**20:.0f} MiB): save {save:.2f} s, load {load:.2f} s, "
+                  f"training loop stall of an async save {stall * 1000:.0f} ms ({first_stall * 1000:.0f} ms for the first)")
@@ -0,0 +1,124 @@
+import asyncio
+import random
+import time
+
+import numpy as np
+
+from chrome import event_api_client as api_client
+from chrome import wire_format
+from chrome.browser_environment import ChromeEnv, VecChromeEnv, open_envs, percentiles_ms
+from chrome.loopback import LoopbackBroker, LoopbackGames
+
+# Run from the repository root: python -m benchmarks.bench_chrome_env
+
+ACTIONS = ["up", "right", "down", "left"]
+
+
+class SpinningChromeEnv():
+    # the waiting of ChromeEnv before it blocked on a condition, to compare waiting strategies
+    def __init__(self, client):
+        self.observation_updated = False
+        self.current_observation = None
+        self.latencies = []
+        self.api_client = api_client.ApiClient(client)
+        self.api_client.subscribe_state(callback=self._updateObservation)
+
+    def _updateObservation(self, client, userdata, message):
+        self.current_observation = wire_format.decode_state(message.payload)
+        self.observation_updated = True
+
+    def step(self, action):
+        start = time.perf_counter()
+        self.api_client.publish_action(action=action)
+        while not self.observation_updated:
+            pass
+        self.observation_updated = False
+        self.latencies.append(time.perf_counter() - start)
+        return None, None, self.current_observation["done"], {}
+
+    def reset(self):
+        self.observation_updated = False
+        self.api_client.publish_reset()
+        while not self.observation_updated:
+            pass
+        self.observation_updated = False
+
+    def latency_percentiles(self, percentiles = (50, 90, 99)) -> dict:
+        values = np.percentile(np.asarray(self.latencies) * 1000, percentiles)
+        return {f"p{p}": float(value) for p, value in zip(percentiles, values)}
+
+
+def run(env, steps:int, batch:int = None):
+    # plays random moves and resets finished games, returns env steps/s and the CPU time of the process per wall second.
+    # The loopback never waits for a network, so the process is busy all the time and CPU per env step is what compares.
+    random.seed(0)
+    env.reset()
+    start, cpu_start = time.perf_counter(), time.process_time()
+    for _ in range(steps):
+        if batch is None:
+            _, _, done, _ = env.step(random.choice(ACTIONS))
+            if done:
+                env.reset()
+        else:
+            _, _, dones, _ = env.step([random.choice(ACTIONS) for _ in range(batch)])
+            if dones.any():
+                env.reset(np.flatnonzero(dones))
+    seconds = time.perf_counter() - start
+    return steps * (batch or 1) / seconds, (time.process_time() - cpu_start) / seconds
+
+
+def report(name:str, env, steps:int, batch:int = None):
+    steps_per_second, cpu = run(env, steps, batch)
+    latencies = env.latency_percentiles()
+    print(f"{name}: {steps_per_second:,.0f} env steps/s, step latency p50 {latencies['p50']:.3f} ms, "
+          f"p99 {latencies['p99']:.3f} ms, CPU {cpu:.0%} ({cpu / steps_per_second * 1e6:.0f} us per env step)")
+
+
+async def play(env, steps:int):
+    # one game played on its own, concurrently with the others on the loop
+    await env.reset()
+    for _ in range(steps):
+        _, _, done, _ = await env.step(random.choice(ACTIONS))
+        if done:
+            await env.reset()
+
+
+async def run_async(games:int, steps:int, binary:bool = True):
+    # games AsyncChromeEnvs on one loop and one connection, each with its own request in flight all the time
+    random.seed(0)
+    broker = LoopbackBroker()
+    LoopbackGames(broker, instances=range(games), binary=binary)
+    connection, envs = await open_envs(broker.client(), range(games), 1.0, 3, 10000)
+    start, cpu_start = time.perf_counter(), time.process_time()
+    await asyncio.gather(*(play(env, steps) for env in envs))
+    seconds = time.perf_counter() - start
+    cpu = (time.process_time() - cpu_start) / seconds
+    connection.close()
+    broker.close()
+    steps_per_second = games * steps / seconds
+    latencies = percentiles_ms([latency for env in envs for latency in env.latencies])
+    print(f"AsyncChromeEnv, {games} games, binary states: {steps_per_second:,.0f} env steps/s, step latency "
+          f"p50 {latencies['p50']:.3f} ms, p99 {latencies['p99']:.3f} ms, CPU {cpu:.0%} ({cpu / steps_per_second * 1e6:.0f} us per env step)")
+
+
+if __name__ == "__main__":
+    steps = 3000
+    for binary in (False, True):
+        broker = LoopbackBroker()
+        LoopbackGames(broker, binary=binary)
+        report(f"ChromeEnv, {'binary' if binary else 'JSON'} states", ChromeEnv(client=broker.client()), steps)
+        broker.close()
+
+    broker = LoopbackBroker()
+    LoopbackGames(broker)
+    report("spin-waiting env, JSON states", SpinningChromeEnv(broker.client()), steps)
+    broker.close()
+
+    for games in (1, 4, 16):
+        broker = LoopbackBroker()
+        LoopbackGames(broker, instances=range(games), binary=True)
+        report(f"VecChromeEnv, {games} games, binary states", VecChromeEnv(games, client=broker.client()), steps // games, games)
+        broker.close()
+
+    for games in (1, 16, 64):
+        asyncio.run(run_async(games, steps // games))
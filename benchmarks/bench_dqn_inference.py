@@ -0,0 +1,52 @@
+import time
+
+import numpy as np
+from keras import Sequential
+from keras.layers import Dense
+
+from algorithms.numpy_policy import NumpyPolicy
+
+# Run from the repository root: python -m benchmarks.bench_dqn_inference
+
+
+def build_model(inputs:int, layer_sizes:list, actions:int = 4):
+    # same network as DQN.build_model
+    model = Sequential()
+    for i, size in enumerate(layer_sizes):
+        if i == 0:
+            model.add(Dense(size, input_shape=(inputs,), activation='relu'))
+        else:
+            model.add(Dense(size, activation='relu'))
+    model.add(Dense(actions, activation='softmax'))
+    return model
+
+
+def states_per_second(function, states, repeats:int):
+    function(states)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function(states)
+    return repeats * len(states) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    for inputs, layer_sizes in ((12, [128, 128, 128, 128]), (40, [128, 128, 128, 128]), (50, [100, 100, 100])):
+        model = build_model(inputs, layer_sizes)
+        policy = NumpyPolicy(model)
+        state = np.random.rand(1, inputs).astype(np.float32)
+        assert np.array_equal(np.argmax(model.predict(state, verbose=0), axis=1), policy.act(state))
+
+        predict = states_per_second(lambda s: np.argmax(model.predict(s, verbose=0), axis=1), state, 50)
+        direct = states_per_second(lambda s: np.argmax(np.asarray(model(s, training=False)), axis=1), state, 200)
+        numpy_single = states_per_second(policy.act, state, 5000)
+        print(f"{inputs} inputs, layers {layer_sizes}: predict {predict:,.0f} steps/s, direct call {direct:,.0f} steps/s, "
+              f"NumpyPolicy {numpy_single:,.0f} steps/s ({numpy_single / predict:.0f}x predict)")
+        for batch_size in (64, 1024):
+            states = np.random.rand(batch_size, inputs).astype(np.float32)
+            print(f"    batch of {batch_size} envs: predict {states_per_second(lambda s: model.predict(s, verbose=0), states, 20):,.0f} states/s, "
+                  f"NumpyPolicy {states_per_second(policy.act, states, 500):,.0f} states/s")
+
+        start = time.perf_counter()
+        for _ in range(100):
+            policy.sync(model)
+        print(f"    sync after fit {(time.perf_counter() - start) / 100 * 1e6:.0f} us")
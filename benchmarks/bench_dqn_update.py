@@ -0,0 +1,76 @@
+import time
+
+import numpy as np
+from keras import Sequential
+from keras.layers import Dense
+from keras.optimizers import Adam
+
+from algorithms.dqn_learner import DQNLearner
+from algorithms.numpy_policy import NumpyPolicy
+from algorithms.replay_buffer import ReplayBuffer
+
+# Run from the repository root: python -m benchmarks.bench_dqn_update
+
+
+def build_model(inputs:int, layer_sizes:list, actions:int = 4):
+    # same network as DQN.build_model
+    model = Sequential()
+    for i, size in enumerate(layer_sizes):
+        if i == 0:
+            model.add(Dense(size, input_shape=(inputs,), activation='relu'))
+        else:
+            model.add(Dense(size, activation='relu'))
+    model.add(Dense(actions, activation='softmax'))
+    model.compile(loss='mse', optimizer=Adam(learning_rate=0.00025))
+    return model
+
+
+def legacy_replay(model, memory: ReplayBuffer, batch_size:int, gamma:float = 0.95):
+    # update of DQN.replay before DQNLearner: two predict_on_batch calls, NumPy target edit and fit
+    states, actions, rewards, next_states, dones = memory.sample(batch_size)
+    targets = rewards + gamma*(np.amax(model.predict_on_batch(next_states), axis=1))*(~dones)
+    targets_full = model.predict_on_batch(states)
+    targets_full[np.arange(batch_size), actions] = targets
+    model.fit(states, targets_full, epochs=1, verbose=0)
+
+
+def updates_per_second(update, repeats:int):
+    for _ in range(5):
+        update()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        update()
+    return repeats / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    for inputs, layer_sizes, batch_size in ((12, [128, 128, 128, 128], 200), (50, [100, 100, 100], 50), (40, [128, 128, 128], 100)):
+        memory = ReplayBuffer(2500, (inputs,))
+        for _ in range(2500):
+            memory.add(rng.random(inputs), rng.integers(4), rng.random(), rng.random(inputs), rng.random() < 0.1)
+
+        legacy_model = build_model(inputs, layer_sizes)
+        legacy = updates_per_second(lambda: legacy_replay(legacy_model, memory, batch_size), 100)
+        results = []
+        for target_update in ("hard", "polyak"):
+            learner = DQNLearner(build_model(inputs, layer_sizes), 0.95, target_update)
+            results.append(updates_per_second(lambda: learner.update(*memory.sample(batch_size)), 500))
+        print(f"{inputs} inputs, layers {layer_sizes}, batch {batch_size}: replay() {legacy:,.0f} updates/s, "
+              f"DQNLearner hard target {results[0]:,.0f} updates/s ({results[0] / legacy:.1f}x), polyak target {results[1]:,.0f} updates/s")
+
+        # TrainingSchedule syncs the acting NumpyPolicy once per update, after all gradient_steps gradient steps
+        model = build_model(inputs, layer_sizes)
+        learner = DQNLearner(model, 0.95)
+        policy = NumpyPolicy(model)
+
+        def scheduled_update(gradient_steps:int):
+            for _ in range(gradient_steps):
+                learner.update(*memory.sample(batch_size))
+            policy.sync(model)
+
+        sync = updates_per_second(lambda: policy.sync(model), 500)
+        synced = [updates_per_second(lambda: scheduled_update(gradient_steps), 500 // gradient_steps) * gradient_steps
+                  for gradient_steps in (1, 4)]
+        print(f"    policy sync {1e6 / sync:.0f} us, hard target with one sync per update: "
+              f"gradient_steps=1 {synced[0]:,.0f} gradient steps/s, gradient_steps=4 {synced[1]:,.0f} gradient steps/s")
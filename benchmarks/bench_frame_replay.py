@@ -0,0 +1,68 @@
+import time
+
+import numpy as np
+
+from algorithms.replay_buffer import ReplayBuffer, FrameReplayBuffer
+from envs.frame_stack import FrameStack
+
+# Run from the repository root: python -m benchmarks.bench_frame_replay
+
+
+def old_state(image, last_image):
+    # what snake_python_agent built every step before FrameStack
+    state = np.concatenate((image, last_image), axis=0)
+    state = np.reshape(state, (1, image.size * 2))
+    return np.interp(state, (state.min(), state.max()), (0, 1))
+
+
+def episode_frames(tiles:int, steps:int, seed:int = 0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 4, size=(steps, tiles, tiles))
+
+
+def fill(tiles:int, history:int, capacity:int, frames):
+    # same transitions in both buffers: episodes of 20 moves, returns the buffers and the seconds per stored step of each
+    states = ReplayBuffer(capacity, (history * tiles * tiles,))
+    start = time.perf_counter()
+    for t, observation in enumerate(frames):
+        image = np.transpose(observation).astype("float64")
+        if t % 21 == 0:
+            last_image = np.zeros((tiles, tiles))
+            state = old_state(image, last_image) if history == 2 else np.interp(image, (image.min(), image.max()), (0, 1)).reshape(1, -1)
+        else:
+            next_state = old_state(image, last_image) if history == 2 else np.interp(image, (image.min(), image.max()), (0, 1)).reshape(1, -1)
+            states.add(state, 0, 0.0, next_state, False)
+            state = next_state
+        last_image = image
+    states_seconds = (time.perf_counter() - start) / len(frames)
+
+    stack = FrameStack(tiles * tiles, history)
+    replay = FrameReplayBuffer(capacity, tiles * tiles, history)
+    start = time.perf_counter()
+    for t, observation in enumerate(frames):
+        if t % 21 == 0:
+            stack.reset(np.transpose(observation))
+            replay.add_first(stack.frame)
+        else:
+            stack.push(np.transpose(observation))
+            replay.add(stack.frame, 0, 0.0, False)
+        stack.state()
+    frame_seconds = (time.perf_counter() - start) / len(frames)
+    return states, replay, states_seconds, frame_seconds
+
+
+def sample_microseconds(buffer, batch_size:int = 256, repeats:int = 200):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        buffer.sample(batch_size)
+    return (time.perf_counter() - start) * 1e6 / repeats
+
+
+if __name__ == "__main__":
+    for name, tiles, history in (("snake_python_agent", 5, 2), ("snake_dqn_pixel_agent", 10, 1)):
+        capacity = 100000
+        states, replay, states_seconds, frame_seconds = fill(tiles, history, capacity, episode_frames(tiles, 20000))
+        print(f"{name} ({tiles}x{tiles}, history {history}): per step {states_seconds * 1e6:.1f} us -> {frame_seconds * 1e6:.1f} us, "
+              f"replay of {capacity} transitions {states.nbytes / 2**20:.1f} MiB -> {replay.nbytes / 2**20:.1f} MiB "
+              f"({states.nbytes / replay.nbytes:.1f}x less, states {(states.states.nbytes + states.next_states.nbytes) // capacity} B -> "
+              f"{replay.frames.nbytes // capacity} B per transition), sampling 256: {sample_microseconds(states):.0f} us -> {sample_microseconds(replay):.0f} us")
@@ -0,0 +1,67 @@
+import random
+import sys
+import time
+
+from algorithms.array_mcts import ArrayMCTS
+from algorithms.mcts import MCTS
+from benchmarks.bench_snapshot import snapshot_bytes
+from envs.fast_snake_env import FastSnakeEnv
+
+# Run from the repository root: python -m benchmarks.bench_mcts
+
+
+def play(searcher, tiles:int = 6, moves:int = 10, seed:int = 0):
+    # plays a few moves like run_mcts.ipynb and returns the actions and the mean seconds per move
+    random.seed(seed)
+    game = FastSnakeEnv(tiles)
+    actions = []
+    start = time.perf_counter()
+    while not game.terminal and len(actions) < moves:
+        action = searcher.find_best_action(current_state=game.get_copy())
+        actions.append(action)
+        game.step(action)
+    return actions, (time.perf_counter() - start) / len(actions)
+
+
+class RootKeepingMCTS(MCTS):
+    # keeps the root of the last search around to measure its nodes
+    def _new_root(self):
+        self.root = super()._new_root()
+        return self.root
+
+
+def node_bytes(root):
+    # memory per node of a finished MCTS search, the Node objects and the game snapshots they hold
+    total, count, stack, seen = 0, 0, [root], set()
+    while stack:
+        node = stack.pop()
+        total += sys.getsizeof(node) + sys.getsizeof(node.__dict__) + sys.getsizeof(node.children)
+        total += snapshot_bytes(node.snapshot, seen)
+        count += 1
+        stack.extend(node.children.values())
+    return total / count
+
+
+def array_node_bytes(tree):
+    # memory per node of a finished ArrayMCTS search, the whole buffers (reserved and unused slots too) and the snapshots
+    snapshots = [snapshot for snapshot in tree.snapshots if snapshot is not None]
+    seen = set()
+    return (tree.nbytes + sum(snapshot_bytes(snapshot, seen) for snapshot in snapshots)) / len(snapshots)
+
+
+if __name__ == "__main__":
+    settings = dict(iterations=2000, exploration_constant=2.5, discount=0.999, step_cost=0.5)
+    actions = {}
+    for searcher in (MCTS(**settings), ArrayMCTS(**settings)):
+        name = searcher.__class__.__name__
+        actions[name], move_time = play(searcher)
+        phases = ", ".join(f"{phase} {ms:.1f}" for phase, ms in searcher.search_stats["phase_ms"].items())
+        print(f"{name} {move_time * 1000:.0f} ms/move, phase ms of the last move: {phases}")
+    print(f"same actions: {actions['MCTS'] == actions['ArrayMCTS']}")
+
+    searcher = RootKeepingMCTS(**settings)
+    play(searcher, moves=1)
+    array_searcher = ArrayMCTS(**settings)
+    play(array_searcher, moves=1)
+    print(f"memory per node with snapshots: MCTS {node_bytes(searcher.root):.0f} bytes, "
+          f"ArrayMCTS {array_node_bytes(array_searcher.tree):.0f} bytes")
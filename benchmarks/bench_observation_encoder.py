@@ -0,0 +1,62 @@
+import random
+import time
+
+import numpy as np
+
+from envs.fast_snake_env import FastSnakeEnv
+from envs.observation_encoder import ObservationEncoder
+from envs.vec_snake_env import VecSnakeEnv
+
+# Run from the repository root: python -m benchmarks.bench_observation_encoder
+
+
+def string_state(state, direction):
+    # what FullState.process_state returned before the encoder: a string array of the grid and the direction flags
+    flags = [int(direction == 'UP'), int(direction == 'RIGHT'), int(direction == 'DOWN'), int(direction == 'LEFT')]
+    processed_s = np.append(np.ravel(state), flags)
+    return np.reshape(processed_s, (1, len(processed_s)))
+
+
+def record(tiles:int, steps:int, seed:int = 0):
+    random.seed(seed)
+    env = FastSnakeEnv(tiles)
+    observations, directions = [], []
+    for _ in range(steps):
+        observation, _, done, info = env.step(random.choice(env.actions))
+        observations.append(observation.copy())
+        directions.append(info["direction"])
+        if done:
+            env.reset()
+    return observations, directions
+
+
+def microseconds_per_state(function, states:int, repeats:int = 3):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1e6 / states
+
+
+if __name__ == "__main__":
+    steps = 2000
+    for tiles in (6, 16, 32):
+        observations, directions = record(tiles, steps)
+        pairs = list(zip(observations, directions))
+        string_us = microseconds_per_state(lambda: [string_state(o, d) for o, d in pairs], steps)
+        line = f"{tiles}x{tiles}: string array {string_us:.1f} us/state ({string_state(*pairs[0]).dtype})"
+        for dtype in (np.float32, np.uint8):
+            encoder = ObservationEncoder(tiles, "flat", dtype)
+            single_us = microseconds_per_state(lambda: [encoder.encode(o, d) for o, d in pairs], steps)
+            line += (f", {np.dtype(dtype).name} {single_us:.1f} us/state, "
+                     f"{encoder.transition_nbytes()} bytes/transition ({encoder.transition_nbytes() * 1e6 / 2**30:.2f} GiB per 1M)")
+        print(line)
+
+    # batch mode on the int boards of a VecSnakeEnv
+    for tiles in (6, 16, 32):
+        envs = VecSnakeEnv(256, tiles)
+        directions = [envs.actions[0]] * 256
+        encoder = ObservationEncoder(tiles, "channels", np.uint8)
+        batch_us = microseconds_per_state(lambda: [encoder.encode_batch(envs.boards, directions) for _ in range(20)], 20 * 256)
+        print(f"{tiles}x{tiles}: batch of 256 int boards, channels uint8 {batch_us:.2f} us/state, {encoder.nbytes} bytes/state")
@@ -0,0 +1,37 @@
+import os
+import random
+import time
+
+from algorithms.mcts import MCTS
+from envs.fast_snake_env import FastSnakeEnv
+
+# Run from the repository root: python -m benchmarks.bench_parallel_mcts
+
+
+def iterations_per_second(searcher, tiles:int = 6, moves:int = 5, seed:int = 0):
+    # plays a few moves and counts iterations, leaf parallel iterations each include leaf_rollouts rollouts
+    random.seed(seed)
+    game = FastSnakeEnv(tiles)
+    # warm up the worker processes before timing
+    searcher.find_best_action(current_state=game.get_copy())
+    start = time.perf_counter()
+    played = 0
+    while not game.terminal and played < moves:
+        game.step(searcher.find_best_action(current_state=game.get_copy()))
+        played += 1
+    elapsed = time.perf_counter() - start
+    searcher.close()
+    return played * searcher.iterations / elapsed
+
+
+if __name__ == "__main__":
+    settings = dict(exploration_constant=2.5, discount=0.999, step_cost=0.5)
+    baseline = iterations_per_second(MCTS(iterations=4000, **settings))
+    print(f"cpus: {os.cpu_count()}, sequential: {baseline:,.0f} iterations/s")
+    workers = 1
+    while workers <= os.cpu_count():
+        root = iterations_per_second(MCTS(iterations=4000, parallel="root", workers=workers, **settings))
+        leaf = iterations_per_second(MCTS(iterations=200, parallel="leaf", workers=workers, leaf_rollouts=workers, **settings))
+        print(f"{workers:>2} workers: root parallel {root:,.0f} iterations/s ({root / baseline:.2f}x), "
+              f"leaf parallel {leaf:,.0f} iterations/s with {workers} rollouts each")
+        workers *= 2
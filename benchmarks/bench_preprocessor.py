@@ -0,0 +1,81 @@
+import random
+import time
+
+import numpy as np
+
+from envs.snake_env import SnakeEnv
+from envs.fast_snake_env import FastSnakeEnv
+from envs.snake_preprocessor import ReduceState
+from envs.vec_snake_env import VecSnakeEnv
+
+# Run from the repository root: python -m benchmarks.bench_preprocessor
+
+
+def scan_state(processor: ReduceState, state, direction):
+    # the cell by cell search ReduceState.process_state did on every step before the env reported head and apple
+    field_size = len(state)
+    for y in range(field_size):
+        for x in range(field_size):
+            if state[y][x] == SnakeEnv.APPLE:
+                apple = (y, x)
+            elif state[y][x] == SnakeEnv.HEAD:
+                head = (y, x)
+    return processor.process_state(state, {"direction": direction, "head": head, "apple": apple})
+
+
+def record(tiles:int, steps:int, seed:int = 0):
+    # observations, infos and int boards of a random game, restarted whenever it ends
+    random.seed(seed)
+    env = FastSnakeEnv(tiles)
+    observations, infos, boards = [], [], []
+    for _ in range(steps):
+        observation, _, done, info = env.step(random.choice(env.actions))
+        observations.append(observation.copy())
+        infos.append(info)
+        boards.append(env.board.copy())
+        if done:
+            env.reset()
+    return observations, infos, boards
+
+
+def microseconds_per_state(function, states:int, repeats:int = 3):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1e6 / states
+
+
+if __name__ == "__main__":
+    processor = ReduceState()
+    steps = 2000
+    for tiles in (6, 16, 32, 64):
+        observations, infos, boards = record(tiles, steps)
+        directions = [info["direction"] for info in infos]
+        heads = np.array([info["head"] for info in infos])
+        apples = np.array([info["apple"] for info in infos])
+
+        fast = np.concatenate([processor.process_state(o, i) for o, i in zip(observations, infos)])
+        scanned = np.concatenate([scan_state(processor, o, i["direction"]) for o, i in zip(observations, infos)])
+        searched = np.concatenate([processor.process_state(o, {"direction": i["direction"]}) for o, i in zip(observations, infos)])
+        identical = (np.array_equal(fast, scanned) and np.array_equal(searched, fast)
+                     and np.array_equal(processor.process_states(observations, directions, heads, apples), fast)
+                     and np.array_equal(processor.process_states(observations, directions), fast)
+                     and np.array_equal(processor.process_states(boards, directions), fast))
+
+        scan_us = microseconds_per_state(lambda: [scan_state(processor, o, i["direction"]) for o, i in zip(observations, infos)], steps)
+        search_us = microseconds_per_state(lambda: [processor.process_state(o, {"direction": i["direction"]}) for o, i in zip(observations, infos)], steps)
+        fast_us = microseconds_per_state(lambda: [processor.process_state(o, i) for o, i in zip(observations, infos)], steps)
+        batch_us = microseconds_per_state(lambda: processor.process_states(observations, directions, heads, apples), steps)
+        boards_us = microseconds_per_state(lambda: processor.process_states(boards, directions), steps)
+        print(f"{tiles}x{tiles}: cell loop {scan_us:.1f} us/state, argwhere {search_us:.1f} us/state, positions from info {fast_us:.1f} us/state, "
+              f"batched with positions {batch_us:.2f} us/state, batched int boards {boards_us:.2f} us/state, "
+              f"identical features: {identical}")
+
+    # VecSnakeEnv reports directions as action indices, -1 for games that were just reset
+    env = VecSnakeEnv(16, 6, seed=0)
+    boards, _, _, info = env.step(np.arange(16) % 4)
+    names = [env.actions[action] if action >= 0 else "" for action in info["direction"]]
+    same = np.array_equal(processor.process_states(boards, info["direction"]), processor.process_states(boards, names))
+    print(f"VecSnakeEnv action indices give the features of the action names: {same}")
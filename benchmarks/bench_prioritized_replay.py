@@ -0,0 +1,51 @@
+import time
+
+import numpy as np
+
+from algorithms.replay_buffer import ReplayBuffer, PrioritizedReplayBuffer
+
+# Run from the repository root: python -m benchmarks.bench_prioritized_replay
+
+
+def microseconds(function, repeats:int):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats * 1e6
+
+
+def fill(buffer: ReplayBuffer, state_size:int, chunk:int = 100_000):
+    # fills the arrays directly instead of a million add calls, priorities drawn from a long tailed distribution
+    rng = np.random.default_rng(0)
+    buffer.states[:] = rng.random((buffer.capacity, state_size), dtype=np.float32)
+    buffer.size = buffer.capacity
+    if isinstance(buffer, PrioritizedReplayBuffer):
+        for start in range(0, buffer.capacity, chunk):
+            indices = np.arange(start, min(start + chunk, buffer.capacity))
+            buffer.update_priorities(indices, rng.exponential(size=len(indices)))
+
+
+if __name__ == "__main__":
+    capacity, state_size = 1_000_000, 12
+    uniform = ReplayBuffer(capacity, (state_size,))
+    prioritized = PrioritizedReplayBuffer(capacity, (state_size,), seed=0)
+    start = time.perf_counter()
+    fill(uniform, state_size)
+    fill(prioritized, state_size)
+    print(f"filled {capacity:,} transitions in {time.perf_counter() - start:.1f} s, "
+          f"uniform {uniform.nbytes / 2**20:.0f} MiB, prioritized {prioritized.nbytes / 2**20:.0f} MiB")
+
+    for batch_size in (32, 256, 1024):
+        uniform_us = microseconds(lambda: uniform.sample(batch_size), 200)
+        sample_us = microseconds(lambda: prioritized.sample(batch_size), 200)
+        indices = prioritized.sample(batch_size)[5]
+        td_errors = np.random.default_rng(1).normal(size=batch_size)
+        update_us = microseconds(lambda: prioritized.update_priorities(indices, td_errors), 200)
+        print(f"batch {batch_size}: uniform sample {uniform_us:.0f} us, prioritized sample {sample_us:.0f} us "
+              f"({batch_size / sample_us * 1e6:,.0f} transitions/s), priority update {update_us:.0f} us")
+
+    # sampled transitions follow the priorities: compare the sampled share of the top 1% with its priority share
+    leaves = prioritized.priorities.get(np.arange(capacity))
+    top = leaves >= np.percentile(leaves, 99)
+    sampled = np.concatenate([prioritized.sample(1024)[5] for _ in range(200)])
+    print(f"top 1% of priorities hold {leaves[top].sum() / leaves.sum():.1%} of the mass, sampled {top[sampled].mean():.1%}")
@@ -0,0 +1,51 @@
+import random
+import time
+from collections import deque
+
+import numpy as np
+
+from algorithms.replay_buffer import ReplayBuffer
+
+# Run from the repository root: python -m benchmarks.bench_replay_buffer
+
+
+def deque_batch(memory: deque, batch_size:int):
+    # minibatch assembly the DQN agents used before the ReplayBuffer
+    minibatch = random.sample(memory, batch_size)
+    states = np.squeeze(np.array([i[0] for i in minibatch]))
+    actions = np.array([i[1] for i in minibatch])
+    rewards = np.array([i[2] for i in minibatch])
+    next_states = np.squeeze(np.array([i[3] for i in minibatch]))
+    dones = np.array([i[4] for i in minibatch])
+    return states, actions, rewards, next_states, dones
+
+
+def microseconds(function, repeats:int):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats * 1e6
+
+
+if __name__ == "__main__":
+    batch_size, capacity = 200, 2500
+    for state_size in (12, 40, 200):
+        transitions = [(np.random.rand(1, state_size), random.randrange(4), random.random(), np.random.rand(1, state_size), random.random() < 0.1)
+                       for _ in range(capacity)]
+        memory = deque(transitions, maxlen=capacity)
+        buffer = ReplayBuffer(capacity, (state_size,))
+        for transition in transitions:
+            buffer.add(*transition)
+
+        old = microseconds(lambda: deque_batch(memory, batch_size), 500)
+        new = microseconds(lambda: buffer.sample(batch_size), 500)
+        add = microseconds(lambda: buffer.add(*transitions[0]), 20000)
+        print(f"state size {state_size}: deque batch {old:.0f} us, ReplayBuffer batch {new:.0f} us ({old / new:.0f}x), "
+              f"ReplayBuffer add {add:.1f} us")
+
+    for state_size in (12, 40):
+        buffer = ReplayBuffer(1_000_000, (state_size,))
+        # sample from the whole (zero filled) buffer as if it was full
+        buffer.size = buffer.capacity
+        print(f"1M transitions of state size {state_size}: {buffer.nbytes / 2**20:.0f} MiB, "
+              f"{buffer.nbytes / buffer.capacity:.0f} bytes per transition, batch {microseconds(lambda: buffer.sample(batch_size), 500):.0f} us")
@@ -0,0 +1,46 @@
+import random
+import sys
+
+from algorithms.mcts import MCTS
+from algorithms.evaluators import ScoreEvaluator, AppleDistanceEvaluator, ValueNetworkEvaluator
+from envs.fast_snake_env import FastSnakeEnv
+
+# Run from the repository root: python -m benchmarks.bench_rollout_depth [keras value model path]
+
+
+def play(searcher: MCTS, tiles:int, moves:int, seed:int):
+    # returns score, moves played, iterations per second, mean rollout length and simulation time per rollout in microseconds
+    random.seed(seed)
+    game = FastSnakeEnv(tiles)
+    played, iterations, seconds, rollout_length, simulation_ms, rollouts = 0, 0, 0.0, 0.0, 0.0, 0
+    while not game.terminal and played < moves:
+        game.step(searcher.find_best_action(current_state=game))
+        iterations += searcher.search_stats["iterations"]
+        seconds += searcher.search_stats["elapsed_ms"] / 1000
+        rollout_length += searcher.search_stats["mean_rollout_length"]
+        simulation_ms += searcher.search_stats["phase_ms"]["simulation"]
+        rollouts += searcher.search_stats["rollouts"]
+        played += 1
+    return game.score, played, iterations / seconds, rollout_length / played, simulation_ms * 1000 / rollouts
+
+
+def mean_over_seeds(make_searcher, tiles:int, moves:int = 60, seeds:int = 4):
+    results = [play(make_searcher(), tiles, moves, seed) for seed in range(seeds)]
+    return [sum(values) / seeds for values in zip(*results)]
+
+
+if __name__ == "__main__":
+    settings = dict(iterations=500, exploration_constant=2.5, discount=0.999, step_cost=0.5)
+    variants = [("unbounded rollouts", {}),
+                ("depth 10, score", dict(rollout_depth=10, evaluator=ScoreEvaluator())),
+                ("depth 10, apple distance", dict(rollout_depth=10, evaluator=AppleDistanceEvaluator())),
+                ("depth 0, apple distance", dict(rollout_depth=0, evaluator=AppleDistanceEvaluator()))]
+    if len(sys.argv) > 1:
+        variants.append(("depth 10, value network", dict(rollout_depth=10, evaluator=ValueNetworkEvaluator(sys.argv[1]))))
+
+    for tiles in (8, 16):
+        for name, options in variants:
+            score, moves, iterations_per_second, rollout_length, simulation_us = mean_over_seeds(lambda: MCTS(**settings, **options), tiles)
+            print(f"{tiles}x{tiles} {name}: mean score {score:.1f} after {moves:.0f} moves, "
+                  f"{iterations_per_second:,.0f} iterations/s, mean rollout length {rollout_length:.1f}, "
+                  f"simulation {simulation_us:.1f} us/rollout")
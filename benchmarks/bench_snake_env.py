@@ -0,0 +1,39 @@
+import random
+import time
+
+from envs.snake_env import SnakeEnv
+from envs.fast_snake_env import FastSnakeEnv
+
+# Run from the repository root: python -m benchmarks.bench_snake_env
+
+
+def steps_per_second(env_class, tiles:int, steps:int, seed:int = 0):
+    random.seed(seed)
+    env = env_class(tiles)
+    start = time.perf_counter()
+    for _ in range(steps):
+        _, _, done, _ = env.step(random.choice(env.actions))
+        if done:
+            env.reset()
+    return steps / (time.perf_counter() - start)
+
+
+def trajectory(env_class, tiles:int, steps:int, seed:int = 0):
+    random.seed(seed)
+    env = env_class(tiles)
+    history = []
+    for _ in range(steps):
+        _, score, done, _ = env.step(random.choice(env.actions))
+        history.append((env.snake.tolist(), env.apple, score, done, env.grid.tolist()))
+        if done:
+            env.reset()
+    return history
+
+
+if __name__ == "__main__":
+    for tiles in (6, 32):
+        identical = trajectory(SnakeEnv, tiles, 2000) == trajectory(FastSnakeEnv, tiles, 2000)
+        reference = steps_per_second(SnakeEnv, tiles, 20000)
+        fast = steps_per_second(FastSnakeEnv, tiles, 20000)
+        print(f"{tiles}x{tiles}: SnakeEnv {reference:,.0f} steps/s, FastSnakeEnv {fast:,.0f} steps/s, "
+              f"speedup {fast / reference:.1f}x, identical trajectories: {identical}")
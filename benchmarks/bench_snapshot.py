@@ -0,0 +1,79 @@
+import random
+import sys
+import timeit
+from copy import deepcopy
+
+import numpy as np
+
+from envs.snake_env import SnakeEnv
+from envs.fast_snake_env import FastSnakeEnv
+
+# Run from the repository root: python -m benchmarks.bench_snapshot
+
+
+def legacy_get_copy(env):
+    # SnakeEnv.get_copy before snapshot/restore: a fresh instance with a reset, then deepcopies on top
+    instance = SnakeEnv(env.TILES)
+    instance.reset()
+    instance.grid = deepcopy(env.grid)
+    instance.snake = deepcopy(env.snake)
+    instance.free_cells = env.free_cells.copy()
+    instance.apple = env.apple
+    instance.score = env.score
+    instance.terminal = env.terminal
+    instance.last_action = env.last_action
+    return instance
+
+
+def mid_game(env_class, tiles:int):
+    # play until the snake has eaten a few apples so the copies are not trivially small
+    random.seed(0)
+    env = env_class(tiles)
+    while env.score < 4:
+        head_y, head_x = env.snake[-1]
+        apple_y, apple_x = env.apple
+        if apple_y != head_y:
+            action = SnakeEnv.DOWN if apple_y > head_y else SnakeEnv.UP
+        else:
+            action = SnakeEnv.RIGHT if apple_x > head_x else SnakeEnv.LEFT
+        env.step(action)
+    return env
+
+
+def snapshot_bytes(snapshot, seen:set = None) -> int:
+    # deep size of a snapshot, every container and number it holds counted once. Pass the same seen set to count
+    # objects shared between snapshots only once.
+    seen = set() if seen is None else seen
+
+    def size(value):
+        if id(value) in seen:
+            return 0
+        seen.add(id(value))
+        if isinstance(value, np.ndarray):
+            return value.nbytes + sys.getsizeof(value) if value.base is None else sys.getsizeof(value)
+        if isinstance(value, (tuple, list)):
+            return sys.getsizeof(value) + sum(size(item) for item in value)
+        if hasattr(value, "__dict__"):
+            return sys.getsizeof(value) + size(list(vars(value).values()))
+        return sys.getsizeof(value)
+
+    return size(snapshot)
+
+
+def microseconds(statement, number:int = 20000):
+    return min(timeit.repeat(statement, number=number, repeat=3)) / number * 1e6
+
+
+if __name__ == "__main__":
+    for tiles in (6, 32):
+        env = mid_game(SnakeEnv, tiles)
+        fast_env = mid_game(FastSnakeEnv, tiles)
+        snapshot = env.snapshot()
+        fast_snapshot = fast_env.snapshot()
+        print(f"{tiles}x{tiles}: legacy get_copy {microseconds(lambda: legacy_get_copy(env)):.1f} us, "
+              f"get_copy {microseconds(env.get_copy):.1f} us, "
+              f"snapshot+restore {microseconds(lambda: env.restore(env.snapshot())):.1f} us, "
+              f"restore {microseconds(lambda: env.restore(snapshot)):.1f} us, snapshot {snapshot_bytes(snapshot)} bytes")
+        print(f"{tiles}x{tiles}: FastSnakeEnv get_copy {microseconds(fast_env.get_copy):.1f} us, "
+              f"snapshot+restore {microseconds(lambda: fast_env.restore(fast_env.snapshot())):.1f} us, "
+              f"restore {microseconds(lambda: fast_env.restore(fast_snapshot)):.1f} us, snapshot {snapshot_bytes(fast_snapshot)} bytes")
@@ -0,0 +1,44 @@
+import random
+
+import numpy as np
+
+from algorithms.mcts import MCTS
+from envs.fast_snake_env import FastSnakeEnv
+
+# Run from the repository root: python -m benchmarks.bench_time_budget
+
+
+def play(searcher: MCTS, tiles:int, moves:int, seed:int = 0):
+    # Per move latency and search stats of one game, the game restarts when it ends
+    random.seed(seed)
+    env = FastSnakeEnv(tiles)
+    latencies, stats = [], []
+    for _ in range(moves):
+        action = searcher.find_best_action(env)
+        latencies.append(searcher.search_stats["elapsed_ms"])
+        stats.append((len(env.snake), searcher.search_stats))
+        _, _, done, _ = env.step(action)
+        if done:
+            env.reset()
+    return np.array(latencies), stats
+
+
+if __name__ == "__main__":
+    tiles, moves = 10, 60
+    for name, searcher in [("1000 iterations", MCTS(iterations=1000)),
+                           ("20 ms budget", MCTS(iterations=None, time_budget_ms=20)),
+                           ("50 ms budget", MCTS(iterations=None, time_budget_ms=50)),
+                           ("50 ms budget, cap 1000", MCTS(iterations=1000, time_budget_ms=50))]:
+        latencies, stats = play(searcher, tiles, moves)
+        iterations = np.mean([s["iterations"] for _, s in stats])
+        rollout_length = np.mean([s["mean_rollout_length"] for _, s in stats])
+        phases = {phase: np.mean([s["phase_ms"][phase] for _, s in stats]) for phase in MCTS.PHASES}
+        print(f"{name}: latency p50 {np.percentile(latencies, 50):.1f} ms, p99 {np.percentile(latencies, 99):.1f} ms, "
+              f"{iterations:.0f} iterations/move, mean rollout length {rollout_length:.1f}, "
+              "phase ms " + ", ".join(f"{phase} {ms:.1f}" for phase, ms in phases.items()))
+
+        # iterations per move by snake length
+        by_length = {}
+        for length, s in stats:
+            by_length.setdefault(min(length // 3 * 3, 9), []).append(s["iterations"])
+        print("    iterations by snake length: " + ", ".join(f"{length}+: {np.mean(v):.0f}" for length, v in sorted(by_length.items())))
@@ -0,0 +1,40 @@
+import random
+import time
+
+from algorithms.mcts import MCTS
+from envs.fast_snake_env import FastSnakeEnv
+
+# Run from the repository root: python -m benchmarks.bench_transposition
+
+
+def play(searcher, tiles:int, moves:int = 30, seed:int = 0):
+    # returns score, moves played, seconds per move, table hit rate and the share of iterations without a rollout
+    random.seed(seed)
+    game = FastSnakeEnv(tiles)
+    played = 0
+    start = time.perf_counter()
+    while not game.terminal and played < moves:
+        game.step(searcher.find_best_action(current_state=game.get_copy()))
+        played += 1
+    seconds = (time.perf_counter() - start) / played
+    hit_rate = searcher.transpositions.hit_rate if searcher.transpositions else 0.0
+    return game.score, played, seconds, hit_rate, searcher.saved_rollouts / (played * searcher.iterations)
+
+
+def mean_over_seeds(make_searcher, tiles:int, seeds:int = 5):
+    results = [play(make_searcher(), tiles, seed=seed) for seed in range(seeds)]
+    return [sum(values) / seeds for values in zip(*results)]
+
+
+if __name__ == "__main__":
+    settings = dict(iterations=1000, exploration_constant=2.5, discount=0.999, step_cost=0.5)
+    for tiles in (6, 10):
+        score, moves, seconds, _, _ = mean_over_seeds(lambda: MCTS(**settings), tiles)
+        print(f"{tiles}x{tiles} without table: mean score {score:.1f}, {moves:.0f} moves, {seconds * 1000:.0f} ms/move")
+        # 20000 entries hold every state of a game, 500 fill up within a few moves and evict
+        for size in (20000, 500):
+            for policy in ("lru", "depth"):
+                make_searcher = lambda: MCTS(transposition_size=size, transposition_policy=policy, **settings)
+                score, moves, seconds, hit_rate, saved = mean_over_seeds(make_searcher, tiles)
+                print(f"{tiles}x{tiles} with {size} entry {policy} table: mean score {score:.1f}, {moves:.0f} moves, "
+                      f"{seconds * 1000:.0f} ms/move, hit rate {hit_rate:.1%}, rollouts saved on {saved:.1%} of iterations")
@@ -0,0 +1,46 @@
+import random
+import time
+
+from algorithms.mcts import MCTS
+from envs.fast_snake_env import FastSnakeEnv
+
+# Run from the repository root: python -m benchmarks.bench_tree_reuse
+
+
+class CountingMCTS(MCTS):
+    # counts the iterations actually run and how often a stored node became the new root
+    new_iterations = 0
+    reused_roots = 0
+
+    def _search(self, root, iterations):
+        self.new_iterations += iterations
+        super()._search(root, iterations)
+
+    def _reuse_root(self, old_root):
+        root = super()._reuse_root(old_root)
+        self.reused_roots += root is not None
+        return root
+
+
+def play_games(reuse_tree:bool, games:int = 5, tiles:int = 6, max_moves:int = 150):
+    scores, moves = [], 0
+    start = time.perf_counter()
+    searcher = CountingMCTS(iterations=1000, exploration_constant=2.5, discount=0.999, step_cost=0.5, reuse_tree=reuse_tree)
+    for seed in range(games):
+        random.seed(seed)
+        game = FastSnakeEnv(tiles)
+        played = 0
+        while not game.terminal and played < max_moves:
+            game.step(searcher.find_best_action(current_state=game.get_copy()))
+            played += 1
+        scores.append(game.score)
+        moves += played
+    elapsed = time.perf_counter() - start
+    return sum(scores) / games, searcher.new_iterations / moves, searcher.reused_roots / moves, elapsed / moves
+
+
+if __name__ == "__main__":
+    for reuse_tree in (False, True):
+        score, iterations, reused, seconds = play_games(reuse_tree)
+        print(f"reuse_tree={reuse_tree}: mean score {score:.1f}, {iterations:.0f} new iterations/move, "
+              f"reused root on {reused:.0%} of moves, {seconds * 1000:.0f} ms/move")
@@ -0,0 +1,37 @@
+import random
+import time
+
+import numpy as np
+
+from envs.fast_snake_env import FastSnakeEnv
+from envs.vec_snake_env import VecSnakeEnv
+
+# Run from the repository root: python -m benchmarks.bench_vec_snake_env
+
+
+def single_env_steps_per_second(tiles:int, steps:int):
+    random.seed(0)
+    env = FastSnakeEnv(tiles)
+    start = time.perf_counter()
+    for _ in range(steps):
+        _, _, done, _ = env.step(random.choice(env.actions))
+        if done:
+            env.reset()
+    return steps / (time.perf_counter() - start)
+
+
+def vec_env_steps_per_second(num_envs:int, tiles:int, batches:int):
+    env = VecSnakeEnv(num_envs, tiles, seed=0)
+    actions = np.random.default_rng(0).integers(0, len(env.actions), size=(batches, num_envs))
+    start = time.perf_counter()
+    for batch in actions:
+        env.step(batch)
+    return batches * num_envs / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    for tiles in (6, 32):
+        print(f"{tiles}x{tiles}: FastSnakeEnv {single_env_steps_per_second(tiles, 20000):,.0f} steps/s")
+        for num_envs in (1, 64, 1024, 4096):
+            steps = vec_env_steps_per_second(num_envs, tiles, batches=max(200, 200000 // num_envs))
+            print(f"{tiles}x{tiles}: VecSnakeEnv with {num_envs} envs {steps:,.0f} steps/s")
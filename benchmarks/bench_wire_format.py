@@ -0,0 +1,76 @@
+import json
+import random
+import time
+
+import numpy as np
+
+from chrome.fake_game import FakeGame
+from chrome.wire_format import decode_state, encode_state
+
+# Run from the repository root: python -m benchmarks.bench_wire_format
+
+
+def record(binary:bool, steps:int, seed:int = 0):
+    # state payloads of a random game played by a FakeGame, reset whenever it ends
+    random.seed(seed)
+    game = FakeGame(10, binary)
+    payloads = [game.handle("reset", "0:reset")]
+    for seq in range(1, steps):
+        if game.env.terminal:
+            payloads.append(game.handle("reset", f"{seq}:reset"))
+        else:
+            payloads.append(game.handle("action", f"{seq}:{random.choice(game.env.actions)}"))
+    return payloads
+
+
+def long_snake_payloads(length:int, count:int = 1000):
+    # random play hardly grows the snake, these states have a snake of length cells winding row by row
+    message = FakeGame(10).state_message()
+    cells = [(y, x if y % 2 == 0 else 9 - x) for y in range(10) for x in range(10)][:length]
+    message["observation"]["snake_dots"] = [[x * 10, y * 10] for y, x in cells]
+    message["rewardIndicators"]["length"] = length - 2
+    message["seq"] = 1
+    return [json.dumps(message).encode()] * count, [encode_state(message)] * count
+
+
+def image(observation, out):
+    # the snake part of snake_dqn_pixel_agent.DQNAGENT._enhance_state for both formats
+    out.fill(0)
+    field_size = observation["field_size"]
+    if "snake_cells" in observation:
+        out.reshape(-1)[observation["snake_cells"]] = 1
+    else:
+        percent_size = int(100 / field_size)
+        for dot in observation["snake_dots"]:
+            if len(dot) == 2:
+                out[int(dot[1] / percent_size)][int(dot[0] / percent_size)] = 1
+    return out
+
+
+def microseconds_per_message(payloads, repeats:int = 3):
+    out = np.zeros((10, 10), dtype=np.uint8)
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for payload in payloads:
+            image(decode_state(payload)["observation"], out)
+        best = min(best, time.perf_counter() - start)
+    return best * 1e6 / len(payloads)
+
+
+if __name__ == "__main__":
+    steps = 5000
+    json_payloads, binary_payloads = record(False, steps), record(True, steps)
+    same = all(np.array_equal(image(decode_state(j)["observation"], np.zeros((10, 10), np.uint8)),
+                              image(decode_state(b)["observation"], np.zeros((10, 10), np.uint8)))
+               for j, b in zip(json_payloads, binary_payloads))
+    for name, payloads in (("JSON", json_payloads), ("binary", binary_payloads)):
+        sizes = np.array([len(payload) for payload in payloads])
+        print(f"{name}: {sizes.mean():.0f} bytes/state (max {sizes.max()}), "
+              f"decode and image {microseconds_per_message(payloads):.1f} us/state")
+    print(f"identical images: {same}")
+
+    for length in (20, 60, 100):
+        json_payloads, binary_payloads = long_snake_payloads(length)
+        print(f"snake of {length}: JSON {len(json_payloads[0])} bytes, {microseconds_per_message(json_payloads):.1f} us/state, "
+              f"binary {len(binary_payloads[0])} bytes, {microseconds_per_message(binary_payloads):.1f} us/state")
@@ -0,0 +1,175 @@
+import random
+import tempfile
+
+import numpy as np
+from gym import spaces
+
+from algorithms.checkpoint import Checkpointer
+from algorithms.dqn_config import DQNConfig, TrainingSchedule
+from algorithms.replay_buffer import ReplayBuffer, PrioritizedReplayBuffer, FrameReplayBuffer, PrioritizedFrameReplayBuffer
+
+# Run from the repository root: python -m benchmarks.check_checkpoint
+# Saves and loads agents with every replay buffer type through Checkpointer and fails with an AssertionError if
+# anything comes back different. The agent is a stand-in for snake_dqn_agent.DQN with the parts Checkpointer touches,
+# its model is a list of NumPy arrays instead of a keras model.
+
+
+class Model():
+    def __init__(self, seed:int):
+        rng = np.random.default_rng(seed)
+        self.weights = [rng.random((12, 8), dtype=np.float32), rng.random(8, dtype=np.float32)]
+
+    def get_weights(self):
+        return [w.copy() for w in self.weights]
+
+    def set_weights(self, weights):
+        self.weights = [np.array(w) for w in weights]
+
+
+class Variable():
+    # an optimizer variable, np.array() reads it and assign writes it like a tf.Variable
+    def __init__(self, value):
+        self.value = np.array(value)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.value if dtype is None else self.value.astype(dtype)
+
+    def assign(self, value):
+        self.value = np.array(value)
+
+
+class Optimizer():
+    def __init__(self, seed:int):
+        self.variables = [Variable(seed), Variable(np.full(8, seed, dtype=np.float32))]
+
+
+class Learner():
+    def __init__(self, seed:int):
+        self.target_model = Model(seed + 1)
+        self.optimizer = Optimizer(seed)
+        self.updates = seed
+
+
+class Policy():
+    def sync(self, model):
+        self.weights = model.get_weights()
+
+
+class Processor():
+    # the reward state of a preprocessor from envs/snake_preprocessor.py
+    def __init__(self, prev_score:int):
+        self.prev_score = prev_score
+
+
+class Agent():
+    def __init__(self, memory, seed:int):
+        self.memory = memory
+        self.action_space = spaces.Discrete(4, seed=seed)
+        self.model = Model(seed)
+        self.learner = Learner(seed)
+        self.policy = Policy()
+        self.epsilon = 1.0 / (seed + 1)
+
+
+def new_buffer(buffer_class, capacity:int):
+    if issubclass(buffer_class, FrameReplayBuffer):
+        return buffer_class(capacity, 64, history=2, seed=0)
+    return buffer_class(capacity, (64,), seed=0)
+
+
+def add(buffer, first:int, count:int) -> None:
+    # transition number n holds n in every field, so rows of mixed transitions are easy to spot
+    for n in range(first, first + count):
+        if isinstance(buffer, FrameReplayBuffer):
+            if n % 50 == 0:
+                buffer.add_first(np.full(64, n % 256, dtype=np.uint8))
+            else:
+                buffer.add(np.full(64, n % 256, dtype=np.uint8), n % 4, n, False)
+        else:
+            buffer.add(np.full(64, n, dtype=np.float32), n % 4, n, np.full(64, n + 1, dtype=np.float32), n % 7 == 0)
+    if isinstance(buffer, (PrioritizedReplayBuffer, PrioritizedFrameReplayBuffer)):
+        indices = np.arange(buffer.size)
+        buffer.update_priorities(indices, buffer.rewards[indices])
+
+
+def check_rows(buffer) -> None:
+    numbers = buffer.rewards[:buffer.size].astype(np.int64)
+    if isinstance(buffer, FrameReplayBuffer):
+        valid = buffer.valid[:buffer.size]
+        assert np.array_equal(buffer.frames[:buffer.size][valid, 0], numbers[valid] % 256), "frames and rewards of different transitions"
+        assert np.array_equal(buffer.actions[:buffer.size][valid], numbers[valid] % 4), "actions and rewards of different transitions"
+    else:
+        assert np.array_equal(buffer.states[:buffer.size, 0], numbers), "states and rewards of different transitions"
+        assert np.array_equal(buffer.next_states[:buffer.size, -1], numbers + 1), "next states and rewards of different transitions"
+        assert np.array_equal(buffer.actions[:buffer.size], numbers % 4), "actions and rewards of different transitions"
+
+
+def check_same(saved: dict, agent: Agent, schedule: TrainingSchedule, processor: Processor) -> None:
+    buffer = agent.memory
+    for name, values in saved["replay"].items():
+        assert np.array_equal(getattr(buffer, name)[:buffer.size], values), f"replay field {name} differs"
+    if "priorities" in saved:
+        assert np.array_equal(buffer.priorities.nodes, saved["priorities"]), "priorities differ"
+    for restored, weights in zip(agent.model.get_weights(), saved["model"]):
+        assert np.array_equal(restored, weights), "model weights differ"
+    assert agent.epsilon == saved["epsilon"] and agent.learner.updates == saved["updates"], "training state differs"
+    assert np.array_equal(np.array(agent.learner.optimizer.variables[1]), saved["optimizer"]), "optimizer state differs"
+    assert random.random() == saved["python_random"] and np.random.random() == saved["np_random"], "random state differs"
+    assert agent.action_space.sample() == saved["action_space_random"], "action space random state differs"
+    assert schedule.get_state() == saved["schedule"], "training schedule counters differ"
+    assert processor.prev_score == saved["prev_score"], "processor state differs"
+
+
+def snapshot(agent: Agent, schedule: TrainingSchedule, processor: Processor) -> dict:
+    # what a checkpoint of agent has to bring back, the random draws are the next ones after the save
+    buffer = agent.memory
+    fields = ("frames", "actions", "rewards", "dones", "steps", "valid") if isinstance(buffer, FrameReplayBuffer) else \
+        ("states", "actions", "rewards", "next_states", "dones")
+    saved = {"replay": {name: getattr(buffer, name)[:buffer.size].copy() for name in fields},
+             "model": agent.model.get_weights(), "epsilon": agent.epsilon, "updates": agent.learner.updates,
+             "optimizer": np.array(agent.learner.optimizer.variables[1]).copy(),
+             "schedule": schedule.get_state(), "prev_score": processor.prev_score}
+    if hasattr(buffer, "priorities"):
+        saved["priorities"] = buffer.priorities.nodes.copy()
+    state = random.getstate(), np.random.get_state()
+    saved["python_random"], saved["np_random"] = random.random(), np.random.random()
+    random.setstate(state[0])
+    np.random.set_state(state[1])
+    action_space_state = agent.action_space.np_random.bit_generator.state
+    saved["action_space_random"] = agent.action_space.sample()
+    agent.action_space.np_random.bit_generator.state = action_space_state
+    return saved
+
+
+def round_trip(buffer_class, asynchronous:bool, capacity:int = 200_000) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        agent = Agent(new_buffer(buffer_class, capacity), seed=3)
+        add(agent.memory, 0, capacity + capacity // 3)
+        # draws of the action space and counters that differ from the ones of a fresh run
+        agent.action_space.sample()
+        schedule = TrainingSchedule(DQNConfig())
+        schedule.set_state({"env_steps": 1234, "gradient_steps": 617})
+        processor = Processor(prev_score=9)
+        saved = snapshot(agent, schedule, processor)
+        checkpointer = Checkpointer(directory)
+        if asynchronous:
+            checkpointer.save_async(agent, 7, schedule=schedule, processor=processor)
+            # training goes on and overwrites the whole buffer while the checkpoint is written
+            add(agent.memory, 2 * capacity, capacity)
+            schedule.set_state({"env_steps": 5000, "gradient_steps": 2500})
+            checkpointer.wait()
+        else:
+            checkpointer.save(agent, 7, schedule=schedule, processor=processor)
+
+        restored = Agent(new_buffer(buffer_class, capacity), seed=5)
+        restored_schedule, restored_processor = TrainingSchedule(DQNConfig()), Processor(prev_score=0)
+        assert Checkpointer(directory).load(restored, schedule=restored_schedule, processor=restored_processor)["step"] == 7
+        check_rows(restored.memory)
+        check_same(saved, restored, restored_schedule, restored_processor)
+
+
+if __name__ == "__main__":
+    for buffer_class in (ReplayBuffer, PrioritizedReplayBuffer, FrameReplayBuffer, PrioritizedFrameReplayBuffer):
+        for asynchronous in (False, True):
+            round_trip(buffer_class, asynchronous)
+            print(f"{buffer_class.__name__}, {'save_async' if asynchronous else 'save'}: restored state is identical")
@@ -1,70 +1,339 @@
-from time import sleep
+import asyncio
+from collections import deque
+from functools import partial
+import random
+import threading
+import time
 from gym import Env, spaces
-import event_api_client as api_client
-import json
+import numpy as np
+from chrome import event_api_client as api_client
+from chrome import wire_format
+from envs.snake_env import action_names
 import os
 
 param_path = os.path.join(os.path.dirname(__file__), 'params.json')
 
+
+def percentiles_ms(latencies, percentiles = (50, 90, 99)) -> dict:
+    # latencies in seconds as percentiles in milliseconds
+    if not latencies:
+        return {}
+    values = np.percentile(np.asarray(latencies) * 1000, percentiles)
+    return {f"p{p}": float(value) for p, value in zip(percentiles, values)}
+
+
+class AsyncChromeEnv():
+
+    def __init__(self, api_client: api_client.AsyncApiClient, instance = None, timeout:float = 1.0, retries:int = 3,
+                 latency_window:int = 10000):
+        # The browser game with async step and reset, create it on the event loop of api_client after awaiting its
+        # connect(). Many envs can share one AsyncApiClient and run their requests concurrently on the loop.
+        # step and reset publish a request with a sequence number and wait for the state with the same number. A request
+        # without an answer after timeout seconds is sent again, up to retries times, then TimeoutError is raised.
+        # States with another sequence number (late answers, duplicates) are dropped. One request at a time per env.
+        # instance selects the topics of a game opened with ?instance=<instance>, None the single game on rl/*.
+        self.action_space = spaces.Discrete(4)
+        self.observation_space = spaces.Discrete(100)
+        self.api_client = api_client
+        self.instance = instance
+        self.timeout = timeout
+        self.retries = retries
+
+        # sequence number of the request that is waited for and the future its state resolves. It starts at a random
+        # number, a game still holding the last number of an earlier run would take a request with the same number
+        # for a repeat.
+        self.seq = random.randrange(1 << 30)
+        self.future = None
+        self.publish = None
+        self.attempt = 0
+        self.deadline = 0.0
+        self.timer = None
+        self.latencies = deque(maxlen=latency_window)
+        self.resends = 0
+        self.dropped = 0
+
+        self.api_client.subscribe_state(callback=self._updateObservation, instance=instance)
+
+    def _updateObservation(self, client, userdata, message):
+        # JSON or the binary format of wire_format, whichever the game sends
+        observation = wire_format.decode_state(message.payload)
+        # states of a game without sequence numbers are always taken
+        if observation.get("seq", self.seq) != self.seq or self.future is None or self.future.done():
+            self.dropped += 1
+            return
+        self.future.set_result(observation)
+
+    async def step(self, action):
+        # action is an action name or an index into SnakeEnv.ACTIONS
+        if not isinstance(action, str):
+            action = str(action_names(action))
+        start = time.perf_counter()
+        message = await self.__request(partial(self.api_client.publish_action, action))
+        self.latencies.append(time.perf_counter() - start)
+
+        observation = message["observation"]
+        done = message["done"]
+        reward = message["rewardIndicators"]
+        info = {}
+
+        return observation, reward, done, info
+
+    async def reset(self):
+        message = await self.__request(self.api_client.publish_reset)
+        return message["observation"]
+
+    def latency_percentiles(self, percentiles = (50, 90, 99)) -> dict:
+        # step latencies in milliseconds, from publishing the action to receiving the state
+        return percentiles_ms(self.latencies, percentiles)
+
+    async def __request(self, publish):
+        loop = asyncio.get_running_loop()
+        self.seq += 1
+        self.future = loop.create_future()
+        self.publish = publish
+        self.attempt = 0
+        self.__send(loop)
+        return await self.future
+
+    def __send(self, loop):
+        if self.attempt > 0:
+            self.resends += 1
+            print(f"No state for request {self.seq} after {self.timeout} s, sending it again")
+        status = self.publish(seq=self.seq, instance=self.instance)
+        if status != 0:
+            print(f"Failed to send request {self.seq}, status {status}")
+        # One timer per env that is only set again when it fires, a timer per request would fill the timer heap of the
+        # loop with cancelled ones at thousands of steps per second
+        self.deadline = loop.time() + self.timeout
+        if self.timer is None:
+            self.timer = loop.call_at(self.deadline, self.__expire, loop)
+
+    def __expire(self, loop):
+        self.timer = None
+        if self.future.done():
+            return
+        if loop.time() < self.deadline:
+            self.timer = loop.call_at(self.deadline, self.__expire, loop)
+        elif self.attempt < self.retries:
+            self.attempt += 1
+            self.__send(loop)
+        else:
+            self.future.set_exception(TimeoutError(f"No state for request {self.seq} after {self.retries + 1} attempts of {self.timeout} s"))
+
+
+async def open_envs(client, instances:list, timeout:float, retries:int, latency_window:int):
+    # one AsyncApiClient and an AsyncChromeEnv per instance on it
+    connection = api_client.AsyncApiClient(client)
+    await connection.connect()
+    return connection, [AsyncChromeEnv(connection, instance, timeout, retries, latency_window) for instance in instances]
+
+
+class BlockingRequests():
+
+    def __init__(self, api_client: api_client.ApiClient, instances:list, timeout:float, retries:int):
+        # Requests with sequence numbers to the games of instances that block until every state is in, the waiting of
+        # ChromeEnv and VecChromeEnv. paho's network thread hands the states over under a condition.
+        # A request without an answer after timeout seconds is sent again to the games that did not answer, up to
+        # retries times, then TimeoutError is raised. States with another sequence number (late answers, duplicates)
+        # are dropped.
+        self.api_client = api_client
+        self.instances = instances
+        self.timeout = timeout
+        self.retries = retries
+
+        # per game the sequence number of the request that is waited for and the state that answered it. They start
+        # at random numbers, a game still holding the last number of an earlier run would take a request with the
+        # same number for a repeat.
+        self.seqs = [random.randrange(1 << 30) for _ in instances]
+        self.messages = [None] * len(instances)
+        # games of the current request without a state yet
+        self.waiting = set()
+        self.condition = threading.Condition()
+        self.resends = 0
+        self.dropped = 0
+
+        for index, instance in enumerate(instances):
+            self.api_client.subscribe_state(callback=partial(self._updateObservation, index), instance=instance)
+
+    def _updateObservation(self, index, client, userdata, message):
+        # JSON or the binary format of wire_format, whichever the game sends
+        observation = wire_format.decode_state(message.payload)
+        with self.condition:
+            # states of a game without sequence numbers are always taken
+            if observation.get("seq", self.seqs[index]) != self.seqs[index] or index not in self.waiting:
+                self.dropped += 1
+                return
+            self.messages[index] = observation
+            self.waiting.discard(index)
+            if not self.waiting:
+                self.condition.notify()
+
+    def request(self, indices, publish) -> list:
+        # publish(index, seq) sends the request of each game in indices, returns their states in that order
+        indices = list(indices)
+        with self.condition:
+            for index in indices:
+                self.seqs[index] += 1
+                self.messages[index] = None
+            self.waiting = set(indices)
+        pending = indices
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                self.resends += len(pending)
+                print(f"No state from instances {[self.instances[i] for i in pending]} after {self.timeout} s, sending again")
+            for index in pending:
+                status = publish(index, self.seqs[index])
+                if status != 0:
+                    print(f"Failed to send request {self.seqs[index]} to instance {self.instances[index]}, status {status}")
+            with self.condition:
+                if self.condition.wait_for(lambda: not self.waiting, timeout=self.timeout):
+                    return [self.messages[index] for index in indices]
+                pending = sorted(self.waiting)
+        raise TimeoutError(f"No state from instances {[self.instances[i] for i in pending]} after {self.retries + 1} attempts of {self.timeout} s")
+
+
 class ChromeEnv(Env):
 
-    def __init__(self):
+    def __init__(self, timeout:float = 1.0, retries:int = 3, latency_window:int = 10000, instance = None, client = None):
+        # Blocking step and reset for one game, see BlockingRequests for requests, resends, timeouts and sequence
+        # numbers. AsyncChromeEnv is the same game with async step and reset.
+        # The last latency_window step latencies are kept for latency_percentiles().
+        # instance selects the topics of a game opened with ?instance=<instance>, None the single game on rl/*.
+        # client is passed on to ApiClient, e.g. a loopback.LoopbackClient instead of a connection to the broker.
         print("created Env")
         self.action_space = spaces.Discrete(4)
         self.observation_space = spaces.Discrete(100)
-        
-        self.current_observation = None
-        self.observation_updated = False
-        
-        self.api_client = api_client.ApiClient()
-        self.api_client.subscribe_state(callback=self._updateObservation)
-        
-    def _updateObservation(self, client, userdata, message):
-        self.current_observation = json.loads(message.payload.decode())
-        self.observation_updated = True
+        self.instance = instance
+        self.latencies = deque(maxlen=latency_window)
+
+        self.api_client = api_client.ApiClient(client)
+        self.requests = BlockingRequests(self.api_client, [instance], timeout, retries)
+
+    @property
+    def resends(self):
+        return self.requests.resends
+
+    @property
+    def dropped(self):
+        return self.requests.dropped
 
     def step(self, action):
-        status = self.api_client.publish_action(action=action)
-        if status != 0:
-            # TODO implement fail logic
-            print(f"Failed to send action to topic {action}")
-        
-        # Wait for state update from the Chrome Extension
-        while not self.observation_updated:
-            # print("waiting for state")
-            pass
-        
-        observation = self.current_observation["observation"]
-        done = self.current_observation["done"]
-        reward = self.current_observation["rewardIndicators"]
+        # action is an action name or an index into SnakeEnv.ACTIONS
+        if not isinstance(action, str):
+            action = str(action_names(action))
+        start = time.perf_counter()
+        (message,) = self.requests.request((0,), lambda index, seq: self.api_client.publish_action(action=action, seq=seq, instance=self.instance))
+        self.latencies.append(time.perf_counter() - start)
+
+        observation = message["observation"]
+        done = message["done"]
+        reward = message["rewardIndicators"]
         info = {}
-                
-        self.observation_updated = False
-        
+
         return observation, reward, done, info
-        
+
     def reset(self):
-        self.current_observation = None
-        self.observation_updated = False
-        self.api_client.publish_reset()
-        
-        # Wait for state update from the Chrome Extension
-        while not self.observation_updated:
-            # print("waiting for reset")
-            pass
-        
-        observation = self.current_observation["observation"]
-        self.observation_updated = False
-        return observation
+        (message,) = self.requests.request((0,), lambda index, seq: self.api_client.publish_reset(seq=seq, instance=self.instance))
+        return message["observation"]
+
+    def latency_percentiles(self, percentiles = (50, 90, 99)) -> dict:
+        # step latencies in milliseconds, from publishing the action to receiving the state
+        return percentiles_ms(self.latencies, percentiles)
 
     def render(self):
         print("rendered environment")
-        
+
     def close(self):
         self.api_client.close()
         print("Connection closed")
-        
 
-        
-        
-    
+
+class VecChromeEnv(Env):
+
+    def __init__(self, num_envs:int, instances:list = None, timeout:float = 1.0, retries:int = 3, latency_window:int = 10000,
+                 client = None):
+        # num_envs browser games on their own topics (instances, 0 ... num_envs - 1 by default, open the games with
+        # ?instance=<instance>) driven over one MQTT connection. step publishes the actions of all games at once and
+        # waits until every state is in, so the round trips overlap instead of running one after the other.
+        # Requests, resends, timeouts and sequence numbers are per game, see BlockingRequests.
+        # Games are not reset automatically, reset the ones that are done with reset(indices).
+        # States come back stacked like from envs.VecSnakeEnv: (num_envs, T, T) int8 boards with the codes of
+        # FastSnakeEnv, so ReduceState.process_states and FullState.process_states take them as they are.
+        self.num_envs = num_envs
+        self.instances = list(instances) if instances is not None else list(range(num_envs))
+        if len(self.instances) != num_envs:
+            raise ValueError(f"{len(self.instances)} instances for {num_envs} envs")
+        self.single_action_space = spaces.Discrete(4)
+        self.action_space = spaces.MultiDiscrete([4] * num_envs)
+        self.observation_space = spaces.Discrete(100)
+        self.latencies = deque(maxlen=latency_window)
+
+        self.api_client = api_client.ApiClient(client)
+        self.requests = BlockingRequests(self.api_client, self.instances, timeout, retries)
+
+        # stacked state of all games, the boards are allocated with the field size of the first state
+        self.boards = None
+        self.scores = np.zeros(num_envs, dtype=np.int64)
+        self.directions = np.full(num_envs, "", dtype="<U5")
+        self.heads = np.zeros((num_envs, 2), dtype=np.int64)
+        self.apples = np.zeros((num_envs, 2), dtype=np.int64)
+
+    @property
+    def resends(self):
+        return self.requests.resends
+
+    @property
+    def dropped(self):
+        return self.requests.dropped
+
+    def step(self, actions):
+        # actions holds one action name or action index (into SnakeEnv.ACTIONS, what DQN.act_batch returns) per game.
+        # Returns the boards, the scores (rewardIndicators["length"]) and the dones of all games and an info dict with
+        # the (N,) direction names and the (N, 2) (y, x) of the heads and apples. The boards are a live view that the
+        # next step and reset overwrite, copy them to keep them.
+        actions = action_names(actions)
+        if actions.shape != (self.num_envs,):
+            raise ValueError(f"{actions.shape} actions for {self.num_envs} envs")
+        start = time.perf_counter()
+        messages = self.requests.request(range(self.num_envs),
+                                         lambda index, seq: self.api_client.publish_action(action=actions[index], seq=seq, instance=self.instances[index]))
+        self.latencies.append(time.perf_counter() - start)
+
+        dones = np.empty(self.num_envs, dtype=bool)
+        for index, message in enumerate(messages):
+            self.__write(index, message["observation"])
+            self.scores[index] = message["rewardIndicators"]["length"]
+            dones[index] = message["done"]
+        return self.boards, self.scores.copy(), dones, self.__info()
+
+    def reset(self, indices = None):
+        # resets all games or the ones in indices and returns the boards of all games, see step
+        indices = range(self.num_envs) if indices is None else indices
+        messages = self.requests.request(indices, lambda index, seq: self.api_client.publish_reset(seq=seq, instance=self.instances[index]))
+        for index, message in zip(indices, messages):
+            self.__write(index, message["observation"])
+            self.scores[index] = 0
+        return self.boards
+
+    def __info(self) -> dict:
+        return {"direction": self.directions.copy(), "head": self.heads.copy(), "apple": self.apples.copy()}
+
+    def __write(self, index:int, observation:dict) -> None:
+        field_size = observation["field_size"]
+        if self.boards is None or self.boards.shape[1] != field_size:
+            self.boards = np.zeros((self.num_envs, field_size, field_size), dtype=np.int8)
+        wire_format.write_board(observation, self.boards[index])
+        self.directions[index] = observation["direction"]
+        self.heads[index] = observation["head_y"], observation["head_x"]
+        self.apples[index] = observation["food_y"], observation["food_x"]
+
+    def latency_percentiles(self, percentiles = (50, 90, 99)) -> dict:
+        # latencies of whole batched steps in milliseconds
+        return percentiles_ms(self.latencies, percentiles)
+
+    def render(self):
+        print("rendered environment")
+
+    def close(self):
+        self.api_client.close()
+        print("Connection closed")
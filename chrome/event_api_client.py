@@ -1,50 +1,186 @@
+import asyncio
+from functools import partial
+from itertools import count
 import random
+import threading
 from paho.mqtt import client as mqtt_client
 
 BROKER = '127.0.0.1'
 PORT = 8883
 # generate client ID with pub prefix randomly
 client_id = f'python-mqtt-{random.randint(0, 1000)}'
+# the broker drops a connection when another one comes in with the same ID, every client of the process gets its own
+client_numbers = count()
 
 STATE_TOPIC = "rl/state"
 ACTION_TOPIC = "rl/action"
 RESET_TOPIC = "rl/reset"
 
+
+def topic(name, instance=None):
+    # topics of one game instance ("rl/<instance>/<name>"), instance None is the single game on "rl/<name>"
+    return f"rl/{name}" if instance is None else f"rl/{instance}/{name}"
+
+
+def new_client():
+    # paho 2.x takes the version of the callback signatures first, on_connect below accepts both versions
+    name = f"{client_id}-{next(client_numbers)}"
+    if hasattr(mqtt_client, "CallbackAPIVersion"):
+        return mqtt_client.Client(mqtt_client.CallbackAPIVersion.VERSION2, name, transport='websockets')
+    return mqtt_client.Client(name, transport='websockets')
+
+
+def on_connect(client, userdata, flags, rc, properties=None):
+    if rc == 0:
+        print("Connected to MQTT Broker!")
+    else:
+        print("Failed to connect, return code %d\n", rc)
+
 # Very High level, this is going to look like the API Framework we use decides
 
 
 class ApiClient():
 
-    def __init__(self):
-        def on_connect(client, userdata, flags, rc):
-            if rc == 0:
-                print("Connected to MQTT Broker!")
-            else:
-                print("Failed to connect, return code %d\n", rc)
+    def __init__(self, client=None):
+        # client is a connected paho client or a stand-in with the same methods (see loopback.LoopbackClient),
+        # by default a client connects to BROKER
+        self.topics = []
+        if client is not None:
+            self.client = client
+            return
 
-        self.client = mqtt_client.Client(client_id, transport='websockets')
-        self.client.on_connect = on_connect
+        self.client = new_client()
+        self.client.on_connect = self._on_connect
         self.client.connect(BROKER, PORT)
         self.client.loop_start()
 
-    def publish_action(self, action):
-        msg = action
-        result = self.client.publish(ACTION_TOPIC, msg)
+    def publish_action(self, action, seq=None, instance=None):
+        # with a sequence number the message is "<seq>:<action>", the game echoes seq in its state
+        msg = action if seq is None else f"{seq}:{action}"
+        result = self.client.publish(topic("action", instance), msg)
         # result: [0, 1]
         status = result[0]
         return status
 
-    def publish_reset(self):
-        msg = "reset"
-        result = self.client.publish(RESET_TOPIC, msg)
+    def publish_reset(self, seq=None, instance=None):
+        msg = "reset" if seq is None else f"{seq}:reset"
+        result = self.client.publish(topic("reset", instance), msg)
         # result: [0, 1]
         status = result[0]
         return status
 
-    def subscribe_state(self, callback):
-        self.client.subscribe(STATE_TOPIC)
-        self.client.on_message = callback
+    def subscribe_state(self, callback, instance=None):
+        # one callback per instance, so several envs can share the connection
+        state_topic = topic("state", instance)
+        self.topics.append(state_topic)
+        self.client.message_callback_add(state_topic, callback)
+        self.client.subscribe(state_topic)
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        on_connect(client, userdata, flags, rc, properties)
+        # paho reconnects a dropped connection, but the broker forgot its subscriptions
+        if rc == 0:
+            for state_topic in self.topics:
+                client.subscribe(state_topic)
 
     def close(self):
         self.client.disconnect()  # disconnect gracefully
         self.client.loop_stop()  # stops network loop
+
+
+class AsyncApiClient(ApiClient):
+
+    def __init__(self, client=None):
+        # ApiClient without paho's network thread: the asyncio event loop watches the socket and calls loop_read and
+        # loop_write when it is readable or writable, so message callbacks run on the event loop. Create it and
+        # await connect() inside the loop. A client passed in (e.g. loopback.LoopbackClient) is used as it is.
+        self.loop = None
+        self.thread = None
+        self.connected = None
+        self.__misc = None
+        self.topics = []
+        self.__injected = client is not None
+        if self.__injected:
+            self.client = client
+            # it reconnects on a thread of its own, the subscriptions of the envs are made again from there
+            self.client.on_connect = self._on_connect
+            return
+
+        self.client = new_client()
+        self.client.on_connect = self.__on_connect
+        self.client.on_socket_open = self.__on_socket_open
+        self.client.on_socket_close = self.__on_socket_close
+        self.client.on_socket_register_write = self.__on_socket_register_write
+        self.client.on_socket_unregister_write = self.__on_socket_unregister_write
+
+    async def connect(self):
+        # returns once the broker accepted the connection
+        self.loop = asyncio.get_running_loop()
+        self.thread = threading.get_ident()
+        if self.__injected:
+            return
+        self.connected = self.loop.create_future()
+        # the TCP connect and the websocket handshake block, they run on a worker thread and the loop goes on. The
+        # socket callbacks paho makes from there are handed over to the loop, see __on_loop.
+        self.client.connect_async(BROKER, PORT)
+        await self.loop.run_in_executor(None, self.client.reconnect)
+        self.__misc = self.loop.create_task(self.__loop_misc())
+        await self.connected
+
+    def subscribe_state(self, callback, instance=None):
+        # a client passed in may call back from a thread of its own (the loopback from its delivery thread), its
+        # messages are handed over to the event loop
+        if self.loop is None:
+            raise RuntimeError("Subscribe after awaiting connect()")
+        if self.__injected:
+            callback = partial(self.loop.call_soon_threadsafe, callback)
+        super().subscribe_state(callback, instance)
+
+    def close(self):
+        self.client.disconnect()
+        if self.__misc is not None:
+            self.__misc.cancel()
+
+    def __on_connect(self, client, userdata, flags, rc, properties=None):
+        self._on_connect(client, userdata, flags, rc, properties)
+        if not self.connected.done():
+            if rc == 0:
+                self.connected.set_result(None)
+            else:
+                self.connected.set_exception(ConnectionError(f"MQTT broker refused the connection: {rc}"))
+
+    def __on_loop(self, callback, *args):
+        # the event loop is not thread safe, calls from the worker thread of connect are queued on it
+        if threading.get_ident() == self.thread:
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def __on_socket_open(self, client, userdata, sock):
+        self.__on_loop(self.loop.add_reader, sock, self.__read, sock)
+
+    def __on_socket_close(self, client, userdata, sock):
+        self.__on_loop(self.loop.remove_reader, sock)
+        self.__on_loop(self.loop.remove_writer, sock)
+
+    def __on_socket_register_write(self, client, userdata, sock):
+        self.__on_loop(self.loop.add_writer, sock, self.client.loop_write)
+
+    def __on_socket_unregister_write(self, client, userdata, sock):
+        self.__on_loop(self.loop.remove_writer, sock)
+
+    def __read(self, sock):
+        self.client.loop_read()
+        # the websocket wrapper can hold bytes of the next messages that the socket no longer signals
+        while getattr(sock, "pending", lambda: 0)() > 0:
+            self.client.loop_read()
+
+    async def __loop_misc(self):
+        # keepalive pings, retries and reconnects of a dropped connection, what paho's network thread would do
+        while True:
+            if self.client.loop_misc() == mqtt_client.MQTT_ERR_NO_CONN:
+                try:
+                    await self.loop.run_in_executor(None, self.client.reconnect)
+                except OSError as error:
+                    print(f"Failed to reconnect to MQTT Broker: {error}")
+            await asyncio.sleep(1)
@@ -0,0 +1,59 @@
+from envs.snake_env import SnakeEnv
+from chrome.wire_format import encode_state
+import json
+
+
+class FakeGame():
+    def __init__(self, tiles:int = 10, binary:bool = False):
+        # Stand-in for the snake-game extension without a browser: answers the requests of ChromeEnv like App.js does,
+        # with a SnakeEnv underneath. Requests are "<seq>:<value>" or "<value>", a repeated seq gets the last state again.
+        # Unknown actions raise ValueError where App.js ignores them, so a wrong action shows up instead of a timeout.
+        # States are JSON like App.js sends them, or the binary format of wire_format with binary=True (?format=binary).
+        self.env = SnakeEnv(tiles)
+        self.binary = binary
+        self.percent_size = 100 // tiles
+        self.direction = SnakeEnv.RIGHT
+        self.seq = None
+        self.last_payload = None
+
+    def handle(self, name:str, payload) -> bytes:
+        # name is the last part of the topic ("action" or "reset"), returns the state payload to publish
+        text = payload.decode() if isinstance(payload, (bytes, bytearray)) else payload
+        seq, separator, value = text.partition(":")
+        seq, value = (int(seq), value) if separator else (None, text)
+        if name == "action" and value.upper() not in SnakeEnv.ACTIONS:
+            raise ValueError(f"Unknown action {value!r}")
+        if seq is not None and seq == self.seq and self.last_payload is not None:
+            return self.last_payload
+        self.seq = seq
+
+        if name == "reset":
+            self.env.reset()
+            self.direction = SnakeEnv.RIGHT
+        elif name == "action" and not self.env.terminal:
+            self.direction = value.upper()
+            self.env.step(self.direction)
+        message = self.state_message()
+        self.last_payload = encode_state(message) if self.binary else json.dumps(message).encode()
+        return self.last_payload
+
+    def state_message(self) -> dict:
+        # the state dict of App.js, positions as cells and the snake as percentage coordinates from tail to head
+        head_y, head_x = self.env.head
+        apple_y, apple_x = self.env.apple
+        message = {
+            "rewardIndicators": {"length": len(self.env.snake) - 1},
+            "observation": {
+                "field_size": self.env.TILES,
+                "snake_dots": [[int(x) * self.percent_size, int(y) * self.percent_size] for y, x in self.env.snake],
+                "food_x": int(apple_x),
+                "food_y": int(apple_y),
+                "head_x": int(head_x),
+                "head_y": int(head_y),
+                "direction": self.direction,
+            },
+            "done": bool(self.env.terminal),
+        }
+        if self.seq is not None:
+            message["seq"] = self.seq
+        return message
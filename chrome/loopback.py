@@ -0,0 +1,113 @@
+from collections import namedtuple
+import queue
+import threading
+import traceback
+
+from chrome.event_api_client import topic
+from chrome.fake_game import FakeGame
+
+# what paho hands to message callbacks, as far as ChromeEnv reads it
+LoopbackMessage = namedtuple("LoopbackMessage", ["topic", "payload"])
+
+
+class LoopbackBroker():
+    def __init__(self):
+        # In-process stand-in for the mosquitto broker: published messages are queued and delivered in order on one
+        # delivery thread, like paho delivers them on its network thread. Topics match exactly, no wildcards.
+        self.subscriptions = {}
+        self.lock = threading.Lock()
+        self.messages = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.__deliver, daemon=True)
+        self.thread.start()
+
+    def client(self):
+        return LoopbackClient(self)
+
+    def subscribe(self, client, name:str) -> None:
+        with self.lock:
+            self.subscriptions.setdefault(name, []).append(client)
+
+    def unsubscribe(self, client) -> None:
+        with self.lock:
+            for clients in self.subscriptions.values():
+                if client in clients:
+                    clients.remove(client)
+
+    def publish(self, name:str, payload:bytes) -> None:
+        self.messages.put((name, payload))
+
+    def close(self) -> None:
+        self.messages.put(None)
+        self.thread.join()
+
+    def __deliver(self):
+        while True:
+            message = self.messages.get()
+            if message is None:
+                return
+            name, payload = message
+            with self.lock:
+                clients = list(self.subscriptions.get(name, ()))
+            for client in clients:
+                # a failing subscriber must not take the delivery thread down, every later message would be lost
+                try:
+                    client._receive(name, payload)
+                except Exception:
+                    print(f"Exception in a subscriber of {name}, message dropped")
+                    traceback.print_exc()
+
+
+class LoopbackClient():
+    def __init__(self, broker: LoopbackBroker):
+        # the part of the paho client that ApiClient uses, connected to a LoopbackBroker
+        self.broker = broker
+        self.on_connect = None
+        self.on_message = None
+        self.__callbacks = {}
+
+    def publish(self, name:str, payload, qos:int = 0, retain:bool = False):
+        # (result code, message id) like paho's MQTTMessageInfo
+        self.broker.publish(name, payload.encode() if isinstance(payload, str) else bytes(payload))
+        return 0, 0
+
+    def subscribe(self, name:str, qos:int = 0):
+        self.broker.subscribe(self, name)
+        return 0, 0
+
+    def message_callback_add(self, name:str, callback) -> None:
+        self.__callbacks[name] = callback
+
+    def loop_start(self) -> None:
+        pass
+
+    def loop_stop(self) -> None:
+        pass
+
+    def disconnect(self) -> None:
+        self.broker.unsubscribe(self)
+
+    def _receive(self, name:str, payload:bytes) -> None:
+        callback = self.__callbacks.get(name, self.on_message)
+        if callback is not None:
+            callback(self, None, LoopbackMessage(name, payload))
+
+
+class LoopbackGames():
+    def __init__(self, broker: LoopbackBroker, instances:list = (None,), tiles:int = 10, binary:bool = False):
+        # One FakeGame per instance that answers the requests on the rl/* topics of the instance (None is the single
+        # game on rl/state, rl/action and rl/reset). The games run on the delivery thread of the broker.
+        self.client = broker.client()
+        self.games = {}
+        for instance in instances:
+            game = FakeGame(tiles, binary)
+            self.games[instance] = game
+            for name in ("action", "reset"):
+                self.client.message_callback_add(topic(name, instance), self.__handler(game, name, instance))
+                self.client.subscribe(topic(name, instance))
+
+    def __handler(self, game: FakeGame, name:str, instance):
+        state_topic = topic("state", instance)
+
+        def handle(client, userdata, message):
+            client.publish(state_topic, game.handle(name, message.payload))
+        return handle
@@ -4,12 +4,58 @@ import Food from './Food';
 import mqtt from "mqtt";
 
 const URL = 'ws://127.0.0.1:8883'
-const STATE_TOPIC = "rl/state"
-const ACTION_TOPIC = "rl/action"
-const RESET_TOPIC = "rl/reset"
+// Several games can share the broker: a game opened with ?instance=<instance> uses the topics rl/<instance>/*
+const PARAMS = new URLSearchParams(window.location.search)
+const INSTANCE = PARAMS.get('instance')
+// ?format=binary sends states in the binary format of chrome/wire_format.py instead of JSON
+const BINARY = PARAMS.get('format') === 'binary'
+const topic = (name) => INSTANCE === null ? `rl/${name}` : `rl/${INSTANCE}/${name}`
+const STATE_TOPIC = topic("state")
+const ACTION_TOPIC = topic("action")
+const RESET_TOPIC = topic("reset")
 
 const percentSize = 10
 
+// Requests are "<seq>:<value>" or just "<value>" (seq null), seq is echoed in the state they cause
+const parseMessage = (message) => {
+  const text = message.toString()
+  const separator = text.indexOf(':')
+  if (separator < 0) {
+    return [null, text]
+  }
+  return [parseInt(text.slice(0, separator), 10), text.slice(separator + 1)]
+}
+
+const DIRECTIONS = ['UP', 'RIGHT', 'DOWN', 'LEFT']
+const HEADER_SIZE = 18
+const NO_SEQ = 0xFFFFFFFF
+
+// little endian header of chrome/wire_format.py followed by the uint16 cell index of every snake dot from tail to head
+const encodeState = (payload) => {
+  const observation = payload.observation
+  const fieldSize = observation.field_size
+  const cells = observation.snake_dots
+    .filter(dot => dot.length === 2)
+    .map(dot => Math.floor(dot[1] / percentSize) * fieldSize + Math.floor(dot[0] / percentSize))
+  const buffer = new ArrayBuffer(HEADER_SIZE + 2 * cells.length)
+  const view = new DataView(buffer)
+  view.setUint8(0, 'S'.charCodeAt(0))
+  view.setUint8(1, 'N'.charCodeAt(0))
+  view.setUint8(2, 1)
+  view.setUint32(3, payload.seq === null ? NO_SEQ : payload.seq, true)
+  view.setUint8(7, fieldSize)
+  view.setUint8(8, payload.done ? 1 : 0)
+  view.setUint16(9, payload.rewardIndicators.length, true)
+  view.setUint8(11, observation.head_x)
+  view.setUint8(12, observation.head_y)
+  view.setUint8(13, observation.food_x)
+  view.setUint8(14, observation.food_y)
+  view.setUint8(15, DIRECTIONS.indexOf(observation.direction))
+  view.setUint16(16, cells.length, true)
+  cells.forEach((cell, i) => view.setUint16(HEADER_SIZE + 2 * i, cell, true))
+  return new Uint8Array(buffer)
+}
+
 const getRandomCoordinates = () => {
   let min = 0;
   let max = 98;
@@ -39,6 +85,10 @@ class App extends Component {
     this.episode = 0
     this.highScore = 0
     this.oldState = null
+    // sequence number of the request being answered and the last published state, sent again for a repeated request
+    this.seq = null
+    this.lastSeq = null
+    this.lastPayload = null
   }
 
   state = initialState;
@@ -120,8 +170,11 @@ class App extends Component {
             done: true
           }
         }
-        const json = JSON.stringify(payload);
-        this.client.publish(STATE_TOPIC, json, error => {
+        payload.seq = this.seq
+        const message = BINARY ? encodeState(payload) : JSON.stringify(payload);
+        this.lastSeq = this.seq
+        this.lastPayload = message
+        this.client.publish(STATE_TOPIC, message, error => {
           if (error) {
             console.log('Publish error: ', error);
           }
@@ -131,11 +184,20 @@ class App extends Component {
   }
 
   onMessage = (topic, message) => {
+    const [seq, value] = parseMessage(message)
+    if (seq !== null && seq === this.seq) {
+      // a resent request must not move the snake again, its state is repeated once it is published
+      if (seq === this.lastSeq) {
+        this.client.publish(STATE_TOPIC, this.lastPayload)
+      }
+      return
+    }
+    this.seq = seq
     if (topic === RESET_TOPIC) {
       this.onReset()
     }
     if (topic === ACTION_TOPIC) {
-      this.onAction(message.toString().toUpperCase())
+      this.onAction(value.toUpperCase())
     }
   }
 
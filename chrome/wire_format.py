@@ -0,0 +1,75 @@
+import json
+import struct
+
+import numpy as np
+
+from envs.fast_snake_env import FastSnakeEnv
+
+# Binary state message of the snake game, all little endian: the header below followed by count uint16 cell indices
+# (y * field_size + x) of the snake from tail to head. Every header field is one of the JSON fields, seq NO_SEQ means
+# a state without sequence number. The header is 18 bytes, which keeps the cell indices 2-byte aligned.
+MAGIC = b"SN"
+VERSION = 1
+HEADER = struct.Struct("<2sBIBBHBBBBBH")
+NO_SEQ = 0xFFFFFFFF
+DIRECTIONS = ("UP", "RIGHT", "DOWN", "LEFT")
+
+
+def is_binary(payload) -> bool:
+    return payload[:2] == MAGIC
+
+
+def decode_state(payload) -> dict:
+    # State message of either format as the dict of the JSON format. Binary messages carry the snake as
+    # observation["snake_cells"], a read-only uint16 view on the payload, instead of the percentage "snake_dots".
+    if not is_binary(payload):
+        return json.loads(payload.decode() if isinstance(payload, (bytes, bytearray)) else payload)
+    (_, version, seq, field_size, done, length, head_x, head_y, food_x, food_y, direction, count) = HEADER.unpack_from(payload)
+    if version != VERSION:
+        raise ValueError(f"Unknown state message version {version}")
+    message = {
+        "rewardIndicators": {"length": length},
+        "observation": {
+            "field_size": field_size,
+            "snake_cells": np.frombuffer(payload, dtype="<u2", count=count, offset=HEADER.size),
+            "food_x": food_x,
+            "food_y": food_y,
+            "head_x": head_x,
+            "head_y": head_y,
+            "direction": DIRECTIONS[direction],
+        },
+        "done": bool(done),
+    }
+    if seq != NO_SEQ:
+        message["seq"] = seq
+    return message
+
+
+def snake_cells(observation:dict) -> np.ndarray:
+    # flat cell indices (y * field_size + x) of the snake from tail to head, from either format
+    if "snake_cells" in observation:
+        return observation["snake_cells"]
+    field_size = observation["field_size"]
+    percent_size = 100 // field_size
+    return np.array([int(dot[1]) // percent_size * field_size + int(dot[0]) // percent_size
+                     for dot in observation["snake_dots"] if len(dot) == 2], dtype=np.int64)
+
+
+def write_board(observation:dict, board:np.ndarray) -> None:
+    # the state as a (field_size, field_size) int board with the codes of FastSnakeEnv, written into board
+    board.fill(FastSnakeEnv.EMPTY_ID)
+    board.reshape(-1)[snake_cells(observation)] = FastSnakeEnv.BODY_ID
+    board[observation["head_y"], observation["head_x"]] = FastSnakeEnv.HEAD_ID
+    board[observation["food_y"], observation["food_x"]] = FastSnakeEnv.APPLE_ID
+
+
+def encode_state(message:dict) -> bytes:
+    # binary form of a JSON state message, what the game sends with ?format=binary
+    observation = message["observation"]
+    field_size = observation["field_size"]
+    cells = snake_cells(observation)
+    seq = message.get("seq")
+    header = HEADER.pack(MAGIC, VERSION, NO_SEQ if seq is None else seq, field_size, int(message["done"]),
+                         message["rewardIndicators"]["length"], observation["head_x"], observation["head_y"],
+                         observation["food_x"], observation["food_y"], DIRECTIONS.index(observation["direction"]), len(cells))
+    return header + np.asarray(cells, dtype="<u2").tobytes()
@@ -0,0 +1,207 @@
+from copy import copy
+import random
+
+import numpy as np
+
+from envs.snake_env import SnakeEnv, FreeCells
+
+
+class FastSnakeEnv(SnakeEnv):
+    # Integer codes of the compact board, they index into SYMBOLS to get the string grid back
+    EMPTY_ID = 0
+    BODY_ID = 1
+    HEAD_ID = 2
+    APPLE_ID = 3
+    SYMBOLS = np.array([SnakeEnv.EMPTY, SnakeEnv.BODY, SnakeEnv.HEAD, SnakeEnv.APPLE])
+
+    MOVES = {
+        SnakeEnv.UP: (-1, 0),
+        SnakeEnv.DOWN: (1, 0),
+        SnakeEnv.RIGHT: (0, 1),
+        SnakeEnv.LEFT: (0, -1),
+    }
+
+    def __init__(self, tiles:int):
+        # Same game as SnakeEnv, but the board is an int8 grid and the snake a ring buffer of flat cell indices.
+        # Every step is O(1) and consumes the random module exactly like SnakeEnv, so equal seeds give equal games.
+        # The string grid is still kept up to date as observation, it only costs the same few cell writes per step.
+        # It is built from the board on first use after a reset or restore, rollouts that never look at it skip it.
+        super(FastSnakeEnv, self).__init__(tiles)
+
+    @property
+    def grid(self):
+        if self._grid is None:
+            self._grid = FastSnakeEnv.SYMBOLS[self.board]
+        return self._grid
+
+    @grid.setter
+    def grid(self, grid):
+        self._grid = grid
+
+    @property
+    def snake(self):
+        # Snake cells as [y, x] rows from tail to head, like SnakeEnv.snake
+        cells = [self._body[(self._tail + i) % self._capacity] for i in range(self._length)]
+        return np.array([divmod(cell, self.TILES) for cell in cells])
+
+    def reset(self):
+        self._capacity = self.TILES * self.TILES
+        self.board = np.zeros((self.TILES, self.TILES), dtype=np.int8)
+        # flat view on the board to address cells by a single index
+        self._cells = self.board.reshape(-1)
+
+        # Ring buffer of the snake body, the tail lives at _tail and the head _length - 1 slots further
+        self._body = [0] * self._capacity
+        self._tail = 0
+        self._length = 1
+
+        # Add snake head to the board at random position
+        start_y = random.randint(0 , self.TILES - 1)
+        start_x = random.randint(0 , self.TILES - 1)
+        head = start_y * self.TILES + start_x
+        self._body[0] = head
+        self._cells[head] = FastSnakeEnv.HEAD_ID
+        self.free_cells = FreeCells(self.TILES)
+        self.free_cells.remove(head)
+
+        # Add apple at random position
+        apple_y, apple_x = self.__generate_apple()
+        self._cells[apple_y * self.TILES + apple_x] = FastSnakeEnv.APPLE_ID
+        self.apple = (apple_y, apple_x)
+        self._grid = None
+
+        # Zobrist hash of the board, same keys and updates as SnakeEnv
+        head_keys, _, tail_keys, apple_keys, _ = self.zobrist
+        self.hash = head_keys[head] ^ tail_keys[head] ^ apple_keys[apple_y * self.TILES + apple_x]
+
+        # Initialize game variables & last_action memory
+        self.score = 0
+        self.terminal = False
+        self.last_action = None
+
+        return self.grid
+
+    @property
+    def head(self):
+        return divmod(self._body[(self._tail + self._length - 1) % self._capacity], self.TILES)
+
+    def step(self, action):
+        # Move the snake
+        self.play(action)
+        info = {"direction": action, "head": self.head, "apple": self.apple}
+
+        return self.grid, self.score, self.terminal, info
+
+    def play(self, action) -> bool:
+        self.__move(direction=action)
+        self.score = self._length
+        return self.terminal
+
+    def get_copy(self):
+        # full copy like SnakeEnv.get_copy, the grid is built again when the copy needs it
+        instance = copy(self)
+        instance.board = self.board.copy()
+        instance._cells = instance.board.reshape(-1)
+        instance._body = self._body.copy()
+        instance._grid = None
+        if self._free_cells is not None:
+            instance._free_cells = self._free_cells.copy()
+        return instance
+
+    def snapshot(self):
+        # Like SnakeEnv.snapshot: the snake cells from tail to head as a tuple, the apple, score and flags and the hash
+        return (self.__snake_cells(), self.apple, self.score, self.terminal, self.last_action, self.hash)
+
+    def restore(self, snapshot):
+        cells, self.apple, self.score, self.terminal, self.last_action, self.hash = snapshot
+        # the ring starts over at slot 0, board, grid and free cells are rebuilt from the cells (the last two lazily)
+        self._length = len(cells)
+        self._tail = 0
+        self._body[:self._length] = cells
+        self._cells.fill(FastSnakeEnv.EMPTY_ID)
+        self._cells.put(cells, FastSnakeEnv.BODY_ID)
+        self._cells[cells[-1]] = FastSnakeEnv.HEAD_ID
+        self._cells[self.apple[0] * self.TILES + self.apple[1]] = FastSnakeEnv.APPLE_ID
+        self._grid = None
+        self._free_cells = None
+
+    def matches(self, snapshot) -> bool:
+        # SnakeEnv.matches on the cells of the snapshot
+        cells, apple, _, terminal, _, _ = snapshot
+        return self.apple == apple and self.terminal == terminal and self._length == len(cells) and self.__snake_cells() == cells
+
+    def _free_mask(self):
+        return (self._cells == FastSnakeEnv.EMPTY_ID) | (self._cells == FastSnakeEnv.APPLE_ID)
+
+    def __snake_cells(self) -> tuple:
+        # flat cells from tail to head, the ring buffer can wrap around its end
+        end = self._tail + self._length
+        if end <= self._capacity:
+            return tuple(self._body[self._tail:end])
+        return tuple(self._body[self._tail:]) + tuple(self._body[:end - self._capacity])
+
+    def __generate_apple(self):
+        # Same free cell bookkeeping as SnakeEnv so random.choice picks the same cell
+        if self.free_cells:
+            return divmod(self.free_cells.sample(), self.TILES)
+        else:
+            # In case the board is full of snake the game will end anyway
+            return divmod(random.choice(range(self._capacity)), self.TILES)
+
+    def __move(self, direction):
+        head = self._body[(self._tail + self._length - 1) % self._capacity]
+        head_y, head_x = divmod(head, self.TILES)
+        move_y, move_x = FastSnakeEnv.MOVES[direction]
+        new_y, new_x = head_y + move_y, head_x + move_x
+
+        # wall crash
+        if not (0 <= new_y < self.TILES and 0 <= new_x < self.TILES):
+            self.__crash()
+            return
+
+        # self crash is a single board lookup, a snake covering the whole board (apple drawn on top of it) can not move at all
+        new_head = new_y * self.TILES + new_x
+        target = self._cells[new_head]
+        if target == FastSnakeEnv.BODY_ID or target == FastSnakeEnv.HEAD_ID or self._length == self._capacity:
+            self.__crash()
+            return
+
+        head_keys, body_keys, tail_keys, apple_keys, _ = self.zobrist
+        self.hash ^= head_keys[head] ^ body_keys[head] ^ head_keys[new_head]
+
+        self._body[(self._tail + self._length) % self._capacity] = new_head
+        self._length += 1
+        if self._free_cells is not None:
+            self._free_cells.remove(new_head)
+        self._cells[head] = FastSnakeEnv.BODY_ID
+        self._cells[new_head] = FastSnakeEnv.HEAD_ID
+        grid = self._grid
+        if grid is not None:
+            grid[head_y][head_x] = SnakeEnv.BODY
+            grid[new_y][new_x] = SnakeEnv.HEAD
+
+        if (new_y, new_x) == self.apple:
+            apple_y, apple_x = self.__generate_apple()
+            self._cells[apple_y * self.TILES + apple_x] = FastSnakeEnv.APPLE_ID
+            if grid is not None:
+                grid[apple_y][apple_x] = SnakeEnv.APPLE
+            self.apple = (apple_y, apple_x)
+            self.hash ^= apple_keys[new_head] ^ apple_keys[apple_y * self.TILES + apple_x]
+        else:
+            tail = self._body[self._tail]
+            self._tail = (self._tail + 1) % self._capacity
+            self._length -= 1
+            self._cells[tail] = FastSnakeEnv.EMPTY_ID
+            if self._free_cells is not None:
+                self._free_cells.add(tail)
+            if grid is not None:
+                tail_y, tail_x = divmod(tail, self.TILES)
+                grid[tail_y][tail_x] = SnakeEnv.EMPTY
+            self.hash ^= body_keys[tail] ^ tail_keys[tail] ^ tail_keys[self._body[self._tail]]
+
+        self.last_action = direction
+
+    def __crash(self):
+        if not self.terminal:
+            self.hash ^= self.zobrist[4]
+        self.terminal = True
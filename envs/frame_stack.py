@@ -0,0 +1,44 @@
+import numpy as np
+
+
+class FrameStack():
+    def __init__(self, frame_size:int, history:int = 2):
+        # The last history frames of an episode in a preallocated uint8 ring, frames of any shape with frame_size cells.
+        # state() is the stack newest frame first as one (1, history * frame_size) float32 row, min/max normalized to
+        # [0, 1] like np.interp over the whole stack. Frames before the start of the episode are zero.
+        self.frame_size = frame_size
+        self.history = history
+        self.frames = np.zeros((history, frame_size), dtype=np.uint8)
+        self.head = 0
+        # ring slots newest first for every head position
+        self.__orders = (np.arange(history)[:, None] - np.arange(history)[None, :]) % history
+        self.__stack = np.zeros((history, frame_size), dtype=np.uint8)
+        self.__state = np.zeros((1, history * frame_size), dtype=np.float32)
+
+    @property
+    def frame(self) -> np.ndarray:
+        # the newest frame, flat
+        return self.frames[self.head]
+
+    def reset(self, frame) -> None:
+        self.frames.fill(0)
+        self.head = 0
+        self.__write(frame)
+
+    def push(self, frame) -> None:
+        self.head = (self.head + 1) % self.history
+        self.__write(frame)
+
+    def state(self) -> np.ndarray:
+        # The returned row is reused by the next call, copy it to keep it
+        np.take(self.frames, self.__orders[self.head], axis=0, out=self.__stack)
+        low, high = self.__stack.min(), self.__stack.max()
+        np.subtract(self.__stack.reshape(1, -1), low, out=self.__state, dtype=np.float32)
+        if high > low:
+            self.__state /= high - low
+        return self.__state
+
+    def __write(self, frame) -> None:
+        # copies (and casts) frame into its ring slot without a temporary array, also for transposed views
+        frame = np.asarray(frame)
+        self.frames[self.head].reshape(frame.shape)[...] = frame
@@ -0,0 +1,73 @@
+import numpy as np
+
+from envs.snake_env import SnakeEnv, direction_names
+from envs.fast_snake_env import FastSnakeEnv
+
+
+class ObservationEncoder():
+    # Channel order of the one-hot board, empty cells are all zero
+    CHANNELS = (SnakeEnv.BODY, SnakeEnv.HEAD, SnakeEnv.APPLE)
+    CHANNEL_IDS = (FastSnakeEnv.BODY_ID, FastSnakeEnv.HEAD_ID, FastSnakeEnv.APPLE_ID)
+    DIRECTIONS = ('UP', 'RIGHT', 'DOWN', 'LEFT')
+
+    def __init__(self, tiles:int, layout:str = "flat", dtype = np.float32):
+        # Numeric one-hot encoding of string grids or int boards (codes of FastSnakeEnv / VecSnakeEnv), written into
+        # preallocated output buffers instead of building a new array every step.
+        # layout="channels" gives (3, T, T) planes for body, head and apple, layout="flat" the same planes raveled
+        # followed by the 4 direction flags (3 * T * T + 4 values). dtype float32 feeds Keras directly, uint8 takes a
+        # quarter of the memory in a replay buffer.
+        # Every call writes into the other of two buffers and returns it, so the state and next_state of one
+        # transition stay valid until the next call. Copy a result that has to live longer.
+        if layout not in ("channels", "flat"):
+            raise ValueError(f"Unknown layout {layout}, use 'channels' or 'flat'")
+        self.tiles = tiles
+        self.layout = layout
+        self.dtype = np.dtype(dtype)
+        self.planes = len(ObservationEncoder.CHANNELS) * tiles * tiles
+        self.shape = (len(ObservationEncoder.CHANNELS), tiles, tiles) if layout == "channels" else (self.planes + len(ObservationEncoder.DIRECTIONS),)
+        self.size = int(np.prod(self.shape))
+
+        self.__symbols = np.array(ObservationEncoder.CHANNELS)[:, None, None]
+        self.__ids = np.array(ObservationEncoder.CHANNEL_IDS, dtype=np.int8)[:, None, None]
+        self.__directions = np.array(ObservationEncoder.DIRECTIONS)
+        # ping-pong buffers of one state (with a batch axis of 1 like the agents use states) and of the last batch size
+        self.__single = [np.zeros((1, *self.shape), dtype=self.dtype) for _ in range(2)]
+        self.__batch = None
+        self.__turn = 0
+
+    @property
+    def nbytes(self) -> int:
+        # bytes of one encoded state
+        return self.size * self.dtype.itemsize
+
+    def transition_nbytes(self) -> int:
+        # bytes of one transition in a ReplayBuffer of these states: state and next_state, int32 action,
+        # float32 reward and bool done
+        return 2 * self.nbytes + 4 + 4 + 1
+
+    def encode(self, state, direction:str) -> np.ndarray:
+        # (1, *shape) encoding of one board, direction is ignored by the channels layout
+        self.__turn ^= 1
+        out = self.__single[self.__turn]
+        self.__write(np.asarray(state)[None], np.asarray([direction]), out)
+        return out
+
+    def encode_batch(self, states, directions) -> np.ndarray:
+        # (N, *shape) encoding of N boards with one write per channel, the buffers are reallocated when N changes.
+        # directions are action names or action indices like the info["direction"] of VecSnakeEnv, see direction_names
+        states = np.asarray(states)
+        if self.__batch is None or len(self.__batch[0]) != len(states):
+            self.__batch = [np.zeros((len(states), *self.shape), dtype=self.dtype) for _ in range(2)]
+        self.__turn ^= 1
+        out = self.__batch[self.__turn]
+        self.__write(states, direction_names(directions), out)
+        return out
+
+    def __write(self, states, directions, out) -> None:
+        codes = self.__symbols if states.dtype.kind == "U" else self.__ids
+        count = len(states)
+        planes = out.reshape(count, len(ObservationEncoder.CHANNELS), self.tiles, self.tiles) if self.layout == "channels" \
+            else out[:, :self.planes].reshape(count, len(ObservationEncoder.CHANNELS), self.tiles, self.tiles)
+        np.equal(states[:, None], codes, out=planes, casting="unsafe")
+        if self.layout == "flat":
+            np.equal(directions[:, None], self.__directions, out=out[:, self.planes:], casting="unsafe")
@@ -1,9 +1,86 @@
-from copy import deepcopy
+from copy import copy
+from functools import lru_cache
 from gym import Env, spaces
 import numpy as np
 import random
 from IPython.display import clear_output
 
+@lru_cache(maxsize=None)
+def zobrist_keys(tiles:int) -> tuple:
+    # Fixed random 64 bit keys per board size for the incremental board hash: one head, body, tail and apple key
+    # per cell plus one key for terminal states. A private generator leaves the random module untouched.
+    generator = random.Random(tiles)
+    head, body, tail, apple = ([generator.getrandbits(64) for _ in range(tiles * tiles)] for _ in range(4))
+    return head, body, tail, apple, generator.getrandbits(64)
+
+
+def direction_names(directions) -> np.ndarray:
+    # Directions as action names, given as names or as indices into SnakeEnv.ACTIONS like the info["direction"] of
+    # VecSnakeEnv. The index -1 of a game that did not move since its reset becomes "", which matches no direction.
+    directions = np.asarray(directions)
+    if directions.dtype.kind in "iu":
+        return np.array((*SnakeEnv.ACTIONS, ""))[directions]
+    if directions.dtype.kind != "U":
+        raise TypeError(f"Directions must be action names or action indices, not {directions.dtype}")
+    return directions
+
+
+def action_names(actions) -> np.ndarray:
+    # Actions as action names, given as names or as indices into SnakeEnv.ACTIONS like DQN.act_batch returns them
+    actions = np.asarray(actions)
+    if actions.dtype.kind in "iu":
+        if ((actions < 0) | (actions >= len(SnakeEnv.ACTIONS))).any():
+            raise ValueError(f"Action indices must be in 0 ... {len(SnakeEnv.ACTIONS) - 1}, got {actions}")
+        return np.array(SnakeEnv.ACTIONS)[actions]
+    if actions.dtype.kind != "U":
+        raise TypeError(f"Actions must be action names or action indices, not {actions.dtype}")
+    return actions
+
+
+class FreeCells():
+    # Flat indices (y * tiles + x) of all cells without snake, kept as a list with swap-remove and the
+    # position of every cell in that list. Adding and removing a cell and drawing a random one are O(1),
+    # and the list order only depends on the moves, so a seeded random module picks the same cells.
+    def __init__(self, tiles:int):
+        self.cells = list(range(tiles * tiles))
+        self.positions = list(range(tiles * tiles))
+
+    def __len__(self):
+        return len(self.cells)
+
+    def add(self, cell:int):
+        self.positions[cell] = len(self.cells)
+        self.cells.append(cell)
+
+    def remove(self, cell:int):
+        position = self.positions[cell]
+        last = self.cells.pop()
+        if last != cell:
+            self.cells[position] = last
+            self.positions[last] = position
+
+    def sample(self) -> int:
+        return random.choice(self.cells)
+
+    def copy(self):
+        instance = FreeCells.__new__(FreeCells)
+        instance.cells = self.cells.copy()
+        instance.positions = self.positions.copy()
+        return instance
+
+    @staticmethod
+    def from_mask(free) -> "FreeCells":
+        # The cells where the flat bool array free is set, in ascending order. The list only depends on the board, so
+        # restoring the same snapshot under the same seed picks the same cells.
+        cells = np.flatnonzero(free)
+        positions = np.zeros(len(free), dtype=np.int64)
+        positions[cells] = np.arange(len(cells))
+        instance = FreeCells.__new__(FreeCells)
+        instance.cells = cells.tolist()
+        instance.positions = positions.tolist()
+        return instance
+
+
 class  SnakeEnv(Env):
     APPLE = "A"
     HEAD = "H"
@@ -14,12 +91,15 @@ class  SnakeEnv(Env):
     DOWN = 'DOWN'
     RIGHT = 'RIGHT'
     LEFT = 'LEFT'
+    # order of self.actions, agents and VecSnakeEnv use indices into it
+    ACTIONS = (UP, DOWN, LEFT, RIGHT)
     
     def __init__(self, tiles:int):
         super(SnakeEnv, self).__init__()
         self.TILES = tiles
+        self.zobrist = zobrist_keys(tiles)
 
-        self.actions = [SnakeEnv.UP, SnakeEnv.DOWN, SnakeEnv.LEFT, SnakeEnv.RIGHT]
+        self.actions = list(SnakeEnv.ACTIONS)
         self.action_space = spaces.Discrete(len(self.actions))
         self.observation_space = spaces.Discrete(self.TILES * self.TILES)
         
@@ -35,11 +115,18 @@ class  SnakeEnv(Env):
         start_x = random.randint(0 , self.TILES - 1)
         self.grid[start_y][start_x] = SnakeEnv.HEAD
         self.snake = np.array([[start_y, start_x]])
+        self.free_cells = FreeCells(self.TILES)
+        self.free_cells.remove(start_y * self.TILES + start_x)
         
         # Add apple at random position
         apple_y, apple_x = self.__generate_apple()
         self.grid[apple_y][apple_x] = SnakeEnv.APPLE
         self.apple = (apple_y, apple_x)
+
+        # Zobrist hash of the board: head key on the head, body keys on the rest of the snake, tail key on the last cell and the apple key
+        head_keys, _, tail_keys, apple_keys, _ = self.zobrist
+        start = start_y * self.TILES + start_x
+        self.hash = head_keys[start] ^ tail_keys[start] ^ apple_keys[apple_y * self.TILES + apple_x]
         
         # Initialize game variables & last_action memory
         self.score = 0
@@ -50,36 +137,78 @@ class  SnakeEnv(Env):
         
     def step(self, action):
         # Move the snake
-        self.__move(direction=action)
+        self.play(action)
         
         observation = self.grid
         done = self.terminal
-        self.score = len(self.snake)
         score = self.score
-        info = {"direction": action}
+        # head and apple let preprocessors skip searching the grid
+        info = {"direction": action, "head": self.head, "apple": self.apple}
         
         return observation, score, done, info
     
+    def play(self, action) -> bool:
+        # step without observation and info dict for simulations, returns whether the game is over
+        self.__move(direction=action)
+        self.score = len(self.snake)
+        return self.terminal
+
+    @property
+    def head(self):
+        # (y, x) of the snake head
+        return tuple(self.snake[-1])
+
+    @property
+    def free_cells(self):
+        # A restored game only rebuilds its free cells when an apple has to be placed, most moves never need them
+        if self._free_cells is None:
+            self._free_cells = FreeCells.from_mask(self._free_mask())
+        return self._free_cells
+
+    @free_cells.setter
+    def free_cells(self, free_cells):
+        self._free_cells = free_cells
+
+    def _free_mask(self):
+        # flat bool array of the cells without snake
+        return ((self.grid != SnakeEnv.BODY) & (self.grid != SnakeEnv.HEAD)).reshape(-1)
+
     def get_copy(self):
-        # Returns a full copy of the game
-        instance = SnakeEnv(self.TILES)
-        instance.reset()
-        instance.grid = deepcopy(self.grid)
-        instance.snake = deepcopy(self.snake)
-        instance.apple = self.apple
-        instance.score = self.score
-        instance.terminal = self.terminal
-        instance.last_action = self.last_action
+        # Returns a full copy of the game without resetting a new instance. Unlike restore(snapshot()) it keeps the
+        # order of the free cells, so the copy places the same apples as the game under the same seed.
+        instance = copy(self)
+        instance.grid = self.grid.copy()
+        if self._free_cells is not None:
+            instance._free_cells = self._free_cells.copy()
         return instance
 
+    def snapshot(self):
+        # Compact game state: the snake from tail to head, the apple, score and flags and the hash. restore() puts it back
+        # into any env with the same number of tiles and rebuilds the grid from it.
+        # The snake array is never written in place, so it can be shared instead of copied.
+        return (self.snake, self.apple, self.score, self.terminal, self.last_action, self.hash)
+
+    def restore(self, snapshot):
+        self.snake, self.apple, self.score, self.terminal, self.last_action, self.hash = snapshot
+        # the grid is refilled in place, get_copy gives each copy its own
+        self.grid.fill(SnakeEnv.EMPTY)
+        self.grid[self.snake[:, 0], self.snake[:, 1]] = SnakeEnv.BODY
+        head_y, head_x = self.snake[-1].tolist()
+        self.grid[head_y, head_x] = SnakeEnv.HEAD
+        self.grid[self.apple] = SnakeEnv.APPLE
+        self._free_cells = None
+
+    def matches(self, snapshot) -> bool:
+        # True if the game is in the state the snapshot was taken from, the snake has to match cell by cell from tail to head
+        snake, apple, _, terminal, _, _ = snapshot
+        return self.apple == apple and self.terminal == terminal and np.array_equal(self.snake, snake)
+
     def __generate_apple(self):
-        all_grid_positions = {(y,x) for x in range(0, self.TILES) for y in  range(0, self.TILES)}
-        allowed_grid_positions = list(all_grid_positions - set([tuple(e) for e in self.snake]))
-        if allowed_grid_positions:
-            return random.choice(allowed_grid_positions)
+        if self.free_cells:
+            return divmod(self.free_cells.sample(), self.TILES)
         else:
             # In case the board is full of snake the game will end anyway
-            return random.choice(list(all_grid_positions))
+            return divmod(random.choice(range(self.TILES * self.TILES)), self.TILES)
         
         
     def __move(self, direction):
@@ -98,27 +227,38 @@ class  SnakeEnv(Env):
                 new_head = (head_y, head_x - 1)
                 
 
-        if self.__did_wall_crash(new_head):
-            self.terminal = True
-            return
-        
-        if self.__did_self_crash(new_head):
+        if self.__did_wall_crash(new_head) or self.__did_self_crash(new_head):
+            if not self.terminal:
+                self.hash ^= self.zobrist[4]
             self.terminal = True
             return
         
+        head_keys, body_keys, tail_keys, apple_keys, _ = self.zobrist
+        old_head = int(head_y * self.TILES + head_x)
+        self.hash ^= head_keys[old_head] ^ body_keys[old_head] ^ head_keys[int(new_head[0] * self.TILES + new_head[1])]
+
         self.snake = np.append(self.snake, [new_head], axis=0)
+        if self._free_cells is not None:
+            self._free_cells.remove(int(new_head[0] * self.TILES + new_head[1]))
         self.grid[head_y][head_x] = SnakeEnv.BODY
         head_y, head_x = self.snake[-1]
         self.grid[head_y][head_x] = SnakeEnv.HEAD
         
         if self.__did_eat():
+            self.hash ^= apple_keys[self.apple[0] * self.TILES + self.apple[1]]
             apple_y, apple_x = self.__generate_apple()
             self.grid[apple_y][apple_x] = SnakeEnv.APPLE
             self.apple = (apple_y, apple_x)   
+            self.hash ^= apple_keys[apple_y * self.TILES + apple_x]
         else:
             tail_y, tail_x = self.snake[0]
             self.snake = self.snake[1:]
             self.grid[tail_y][tail_x] = SnakeEnv.EMPTY
+            tail = int(tail_y * self.TILES + tail_x)
+            if self._free_cells is not None:
+                self._free_cells.add(tail)
+            new_tail_y, new_tail_x = self.snake[0]
+            self.hash ^= body_keys[tail] ^ tail_keys[tail] ^ tail_keys[int(new_tail_y * self.TILES + new_tail_x)]
         
         self.last_action = direction
     
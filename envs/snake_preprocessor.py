@@ -1,21 +1,25 @@
 import numpy as np
 from gym import spaces
 
-from envs.python_snake_env import SnakeEnv
+from envs.snake_env import SnakeEnv, direction_names
+from envs.fast_snake_env import FastSnakeEnv
+from envs.observation_encoder import ObservationEncoder
 
 class FullState:
 
-    def __init__(self) -> None:
+    def __init__(self, tiles:int = 6, dtype = np.float32) -> None:
         # variables for reward enhancement
         self.prev_score = 0
-        self.observation_space = spaces.Discrete(40)
+        # one-hot body, head and apple planes and the 4 direction flags, see ObservationEncoder
+        self.encoder = ObservationEncoder(tiles, "flat", dtype)
+        self.observation_space = spaces.Discrete(self.encoder.size)
 
     def process_state(self, state, info):
-        processed_s = state       
-        snake_direction = [int(info["direction"] == 'UP'), int(info["direction"] == 'RIGHT'), int(info["direction"] == 'DOWN'), int(info["direction"] == 'LEFT')]
-        processed_s = np.append(np.ravel(processed_s), snake_direction)
-        processed_s = np.reshape(processed_s, (1, len(processed_s)))
-        return processed_s
+        # the result is one of the two reused buffers of the encoder, it is overwritten two calls later
+        return self.encoder.encode(state, info["direction"])
+
+    def process_states(self, states, directions):
+        return self.encoder.encode_batch(states, directions)
 
     def process_reward(self, state, score, is_terminal, info):
         processed_r = 0
@@ -38,17 +42,15 @@ class ReduceState:
         self.observation_space = spaces.Discrete(12)
 
     def process_state(self, state, info):
-        processed_s = state
         field_size = len(state)
 
-        for y in range(field_size):
-            for x in range(field_size):
-                if state[y][x] == SnakeEnv.APPLE:
-                    apple_x = x
-                    apple_y = y
-                elif state[y][x] == SnakeEnv.HEAD:
-                    snake_x = x
-                    snake_y = y
+        # SnakeEnv.step puts head and apple into info, the grid is only searched without them (e.g. after a reset)
+        if "head" in info and "apple" in info:
+            snake_y, snake_x = info["head"]
+            apple_y, apple_x = info["apple"]
+        else:
+            snake_y, snake_x = np.argwhere(state == SnakeEnv.HEAD)[-1]
+            apple_y, apple_x = np.argwhere(state == SnakeEnv.APPLE)[-1]
         
         snake_direction = info["direction"]
 
@@ -75,6 +77,31 @@ class ReduceState:
         processed_s = np.reshape(processed_s, (1, len(processed_s)))
         return processed_s
 
+    def process_states(self, states, directions, heads = None, apples = None):
+        # Features of process_state for a batch of boards as one (N, 12) array. states are (N, T, T) string grids or
+        # int boards with the codes of FastSnakeEnv / VecSnakeEnv, directions one action name or action index (the
+        # info["direction"] of VecSnakeEnv) per board, see direction_names.
+        # heads and apples are (N, 2) arrays of (y, x), the boards are searched for the ones that are not given.
+        states = np.asarray(states)
+        field_size = states.shape[1]
+        if states.dtype.kind == "U":
+            head_code, apple_code = SnakeEnv.HEAD, SnakeEnv.APPLE
+        else:
+            head_code, apple_code = FastSnakeEnv.HEAD_ID, FastSnakeEnv.APPLE_ID
+        cells = states.reshape(len(states), -1)
+        if heads is None:
+            heads = np.stack(np.divmod(np.argmax(cells == head_code, axis=1), field_size), axis=1)
+        if apples is None:
+            apples = np.stack(np.divmod(np.argmax(cells == apple_code, axis=1), field_size), axis=1)
+        snake_y, snake_x = np.asarray(heads).T
+        apple_y, apple_x = np.asarray(apples).T
+        directions = direction_names(directions)
+
+        last = field_size - 1
+        return np.stack([snake_y < apple_y, snake_x < apple_x, snake_y > apple_y, snake_x > apple_x,
+                         snake_y == 0, snake_x == last, (snake_y == last) & (snake_y != 0), (snake_x == 0) & (snake_x != last),
+                         directions == 'UP', directions == 'RIGHT', directions == 'DOWN', directions == 'LEFT'], axis=1).astype(np.int64)
+
     def process_reward(self, state, score, is_terminal, info):
         processed_r = 0
         
@@ -0,0 +1,128 @@
+import numpy as np
+from gym import spaces
+
+from envs.snake_env import SnakeEnv
+from envs.fast_snake_env import FastSnakeEnv
+
+
+class VecSnakeEnv():
+    # Board codes are shared with FastSnakeEnv
+    EMPTY_ID = FastSnakeEnv.EMPTY_ID
+    BODY_ID = FastSnakeEnv.BODY_ID
+    HEAD_ID = FastSnakeEnv.HEAD_ID
+    APPLE_ID = FastSnakeEnv.APPLE_ID
+
+    # Row and column offsets per action index, in the order of self.actions
+    MOVE_Y = np.array([-1, 1, 0, 0])
+    MOVE_X = np.array([0, 0, -1, 1])
+
+    def __init__(self, num_envs:int, tiles:int, seed:int = None):
+        # N snake games stepped together, boards are one (N, T, T) int8 array and every game
+        # follows the rules of SnakeEnv. Actions are indices into self.actions, finished games
+        # are reset automatically inside step.
+        self.num_envs = num_envs
+        self.TILES = tiles
+        self.capacity = tiles * tiles
+
+        self.actions = list(SnakeEnv.ACTIONS)
+        self.single_action_space = spaces.Discrete(len(self.actions))
+        self.action_space = spaces.MultiDiscrete([len(self.actions)] * num_envs)
+        self.observation_space = spaces.Box(low=0, high=FastSnakeEnv.APPLE_ID, shape=(num_envs, tiles, tiles), dtype=np.int8)
+
+        self.rng = np.random.default_rng(seed)
+
+        self.boards = np.zeros((num_envs, tiles, tiles), dtype=np.int8)
+        # flat view on the boards to address cells by a single index per game
+        self._cells = self.boards.reshape(num_envs, self.capacity)
+
+        # One ring buffer of flat cell indices per game, the tail lives at tail and the head length - 1 slots further
+        self.body = np.zeros((num_envs, self.capacity), dtype=np.int32)
+        self.tail = np.zeros(num_envs, dtype=np.int64)
+        self.length = np.ones(num_envs, dtype=np.int64)
+        # flat cell of the apple, -1 once a snake fills its whole board
+        self.apple = np.zeros(num_envs, dtype=np.int64)
+        self.scores = np.zeros(num_envs, dtype=np.int64)
+        # index of the last successful action, -1 after a reset
+        self.last_actions = np.full(num_envs, -1, dtype=np.int64)
+        self._all_envs = np.arange(num_envs)
+
+        self.reset()
+
+    def reset(self):
+        self.__reset_envs(self._all_envs)
+        return self.boards
+
+    def step(self, actions):
+        # Returns the boards (a live view, copy to keep them), the scores, the done flags and an info dict.
+        # Scores and the "final_observation" boards in info belong to the games before the automatic reset.
+        actions = np.asarray(actions)
+        envs = self._all_envs
+
+        heads = self.body[envs, (self.tail + self.length - 1) % self.capacity]
+        new_y = heads // self.TILES + VecSnakeEnv.MOVE_Y[actions]
+        new_x = heads % self.TILES + VecSnakeEnv.MOVE_X[actions]
+        inside = (new_y >= 0) & (new_y < self.TILES) & (new_x >= 0) & (new_x < self.TILES)
+        new_heads = np.where(inside, new_y * self.TILES + new_x, 0)
+
+        # wall crash, self crash or a snake covering the whole board
+        targets = self._cells[envs, new_heads]
+        dones = ~inside | (targets == VecSnakeEnv.BODY_ID) | (targets == VecSnakeEnv.HEAD_ID) | (self.length == self.capacity)
+
+        moving = np.flatnonzero(~dones)
+        moved_heads = new_heads[moving]
+        self.body[moving, (self.tail[moving] + self.length[moving]) % self.capacity] = moved_heads
+        self.length[moving] += 1
+        self._cells[moving, heads[moving]] = VecSnakeEnv.BODY_ID
+        self._cells[moving, moved_heads] = VecSnakeEnv.HEAD_ID
+        self.last_actions[moving] = actions[moving]
+
+        ate = moved_heads == self.apple[moving]
+        self.__place_apples(moving[ate])
+
+        # every snake that did not eat drops its tail
+        shrinking = moving[~ate]
+        tails = self.body[shrinking, self.tail[shrinking]]
+        self._cells[shrinking, tails] = VecSnakeEnv.EMPTY_ID
+        self.tail[shrinking] = (self.tail[shrinking] + 1) % self.capacity
+        self.length[shrinking] -= 1
+
+        self.scores[:] = self.length
+        scores = self.scores.copy()
+
+        finished = np.flatnonzero(dones)
+        info = {"direction": self.last_actions.copy(), "final_observation": self.boards[finished].copy(), "finished": finished}
+        if finished.size:
+            self.__reset_envs(finished)
+
+        return self.boards, scores, dones, info
+
+    def __reset_envs(self, envs):
+        self._cells[envs] = VecSnakeEnv.EMPTY_ID
+        heads = self.rng.integers(0, self.capacity, size=len(envs))
+        self._cells[envs, heads] = VecSnakeEnv.HEAD_ID
+        self.body[envs, 0] = heads
+        self.tail[envs] = 0
+        self.length[envs] = 1
+        self.scores[envs] = 0
+        self.last_actions[envs] = -1
+        self.__place_apples(envs)
+
+    def __place_apples(self, envs):
+        # Pick a uniformly random empty cell per game: draw a rank below the number of free cells and
+        # find the cell holding that rank with a cumulative sum over the free mask
+        if envs.size == 0:
+            return
+        free = self._cells[envs] == VecSnakeEnv.EMPTY_ID
+        counts = free.sum(axis=1)
+        ranks = (self.rng.random(len(envs)) * counts).astype(np.int64)
+        cells = np.argmax(np.cumsum(free, axis=1) > ranks[:, None], axis=1)
+
+        # In case the board is full of snake the game will end anyway
+        has_space = counts > 0
+        self._cells[envs[has_space], cells[has_space]] = VecSnakeEnv.APPLE_ID
+        self.apple[envs] = np.where(has_space, cells, -1)
+
+    def render(self, index:int = 0):
+        # Prints one of the games in the format of SnakeEnv.render
+        grid = FastSnakeEnv.SYMBOLS[self.boards[index]]
+        print("".join(" ".join(row) + " \n" for row in grid))